@@ -0,0 +1,6 @@
+from .hash_random import *
+from .pools import *
+from .providers import *
+from .pseudonymizer import *
+from .pushdown import *
+from .value_cache import *
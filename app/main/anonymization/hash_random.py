@@ -0,0 +1,59 @@
+import random
+from hashlib import blake2b
+
+_RECIP_BPF = 2.0**-53
+
+
+class HashRandom(random.Random):
+    """random.Random whose stream is derived from a digest instead of the Mersenne Twister.
+
+    Seeding only stores the digest, so switching to a new cell costs a small
+    fraction of random.seed(). Words are drawn lazily from
+    blake2b(digest || counter) blocks.
+    """
+
+    def __init__(self, digest: bytes = b"") -> None:
+        super().__init__(digest)
+
+    def seed(self, a=None, version: int = 2) -> None:
+        if not isinstance(a, (bytes, bytearray)):
+            a = blake2b(str(a).encode()).digest()
+
+        self._digest = bytes(a)
+        self._counter = 0
+        self._words = []
+
+    def _next_word(self) -> int:
+        words = self._words
+        if not words:
+            block = blake2b(
+                self._digest + self._counter.to_bytes(4, "little"), digest_size=64
+            ).digest()
+            self._counter += 1
+            words = self._words = memoryview(block).cast("Q").tolist()
+        return words.pop()
+
+    def _randbelow(self, n: int) -> int:
+        # Multiply-shift reduction, the bias is at most n / 2**64
+        if n <= 1 << 64:
+            return (self._next_word() * n) >> 64
+        return self.getrandbits(n.bit_length() + 64) % n
+
+    def getrandbits(self, k: int) -> int:
+        if k <= 64:
+            return self._next_word() >> (64 - k)
+
+        value = 0
+        for shift in range(0, k, 64):
+            value |= self._next_word() << shift
+        return value & ((1 << k) - 1)
+
+    def random(self) -> float:
+        return (self._next_word() >> 11) * _RECIP_BPF
+
+    def getstate(self):
+        return self._digest, self._counter, list(self._words)
+
+    def setstate(self, state) -> None:
+        self._digest, self._counter, words = state
+        self._words = list(words)
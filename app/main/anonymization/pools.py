@@ -0,0 +1,160 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from faker import Faker
+
+from app.main.config import Config
+
+POOL_TYPES = ["name", "address", "email", "phone_number", "cellphone_number"]
+
+_MAGIC = b"DPPOOLS1"
+_HEADER = struct.Struct("<8sI")
+_ENTRY = struct.Struct("<32sIQQ")
+
+_pools = {}
+
+
+class Pool:
+    """Read-only sequence of strings stored in a memory-mapped pool file.
+
+    The offsets are an array of count + 1 little-endian uint32 relative to the
+    start of the pool data, so value i is data[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, buffer: mmap.mmap, count: int, offsets_pos: int, data_pos: int):
+        self._buffer = buffer
+        self._offsets = memoryview(buffer)[
+            offsets_pos : offsets_pos + (count + 1) * 4
+        ].cast("I")
+        self._data_pos = data_pos
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        start = self._data_pos + self._offsets[index]
+        end = self._data_pos + self._offsets[index + 1]
+        return str(self._buffer[start:end], "utf-8")
+
+
+class PoolSet:
+    """All pools of a pool file, sharing one read-only mmap of it.
+
+    The checksum identifies the pool values, jobs keep it to use the same
+    pools in every worker and to tell the columns anonymized with others.
+    """
+
+    def __init__(self, path: str) -> None:
+        if sys.byteorder != "little":
+            raise RuntimeError("anonymization pools require a little-endian host")
+
+        with open(path, "rb") as file:
+            self._stat = _file_stat(file.fileno())
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.checksum = hashlib.sha256(self._buffer).hexdigest()
+
+        magic, count = _HEADER.unpack_from(self._buffer, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an anonymization pool file")
+
+        self.pools = {}
+        for index in range(count):
+            name, size, offsets_pos, data_pos = _ENTRY.unpack_from(
+                self._buffer, _HEADER.size + index * _ENTRY.size
+            )
+            self.pools[name.rstrip(b"\0").decode()] = Pool(
+                self._buffer, size, offsets_pos, data_pos
+            )
+
+    def get(self, anonymization_type: str) -> Pool:
+        return self.pools.get(anonymization_type)
+
+
+def build_pools(path: str, size: int, seed: int = 0) -> None:
+    # A fixed seed and size give the same pool file, and so the same anonymized values
+    fake = Faker(locale=["pt_BR"])["pt_BR"]
+    fake.seed_instance(seed)
+
+    generators = {
+        "name": fake.name,
+        "address": fake.address,
+        "email": fake.ascii_email,
+        "phone_number": fake.phone_number,
+        "cellphone_number": fake.cellphone_number,
+    }
+
+    pools = []
+    for anonymization_type in POOL_TYPES:
+        generate = generators[anonymization_type]
+        values = [generate().encode() for _ in range(size)]
+
+        offsets = array("I", [0])
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        pools.append((anonymization_type, offsets, b"".join(values)))
+
+    position = _HEADER.size + len(pools) * _ENTRY.size
+    entries = []
+    for anonymization_type, offsets, data in pools:
+        offsets_pos = position
+        data_pos = offsets_pos + len(offsets) * offsets.itemsize
+        entries.append(
+            _ENTRY.pack(anonymization_type.encode(), size, offsets_pos, data_pos)
+        )
+        position = data_pos + len(data)
+
+    if sys.byteorder != "little":
+        for _, offsets, _ in pools:
+            offsets.byteswap()
+
+    # Write next to the target and rename, so running workers keep their old mapping
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(pools)))
+        file.writelines(entries)
+        for _, offsets, data in pools:
+            file.write(offsets.tobytes())
+            file.write(data)
+    os.replace(tmp_path, path)
+
+    _pools.pop(path, None)
+
+
+def get_pools(path: str = None) -> PoolSet:
+    # Pools are optional, without a pool file every value comes from Faker
+    path = path or Config.ANONYMIZATION_POOL_PATH
+    try:
+        stat = _file_stat(path)
+    except FileNotFoundError:
+        _pools.pop(path, None)
+        return None
+
+    # Mapped again once the file is rebuilt, the old mapping stays valid meanwhile
+    if path not in _pools or _pools[path]._stat != stat:
+        _pools[path] = PoolSet(path)
+    return _pools[path]
+
+
+def job_pools(path: str, checksum: str) -> PoolSet:
+    """The pools a job started with, by their checksum, None without pools.
+
+    Raises ValueError when the pool file changed since, so no job mixes
+    values of different pools, or of pools and Faker.
+    """
+    if checksum is None:
+        return None
+
+    pools = get_pools(path=path)
+    if pools is None or pools.checksum != checksum:
+        raise ValueError(f"The pool file {path} changed since the job started")
+    return pools
+
+
+def _file_stat(file) -> tuple:
+    stat = os.stat(file)
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
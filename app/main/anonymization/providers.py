@@ -0,0 +1,143 @@
+import re
+import sys
+from array import array
+from datetime import date, datetime, time, timedelta
+from functools import partial
+from itertools import repeat
+from operator import add, floordiv, getitem, mod
+from socket import AF_INET6, inet_ntoa, inet_ntop
+
+from faker import Faker
+
+from app.main.anonymization.hash_random import HashRandom
+from app.main.anonymization.pools import Pool, PoolSet
+
+# Bump whenever a generator changes its output, columns anonymized with an
+# older version are then anonymized again from their original values
+GENERATOR_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+# Fixed upper bound so generated dates do not drift with the current time
+_DATE_TIME_SPAN = int((datetime(2030, 1, 1) - _EPOCH).total_seconds())
+_DATE_SPAN = _DATE_TIME_SPAN // 86400
+
+_IPV4_SLICE = slice(0, 4)
+_IPV6_SLICE = slice(0, 16)
+
+
+def fix_cpf(cpf: str):
+    if cpf is None:
+        return None
+
+    cpf = re.sub("[.-]", "", cpf)
+    return cpf
+
+
+def fix_rg(rg: str):
+    if rg is None:
+        return None
+
+    return rg.replace("X", "0")
+
+
+def _digest_words(digests: list[bytes], slot: int) -> array:
+    # Little-endian 64-bit word number `slot` of every digest, as one array
+    words = array("Q", b"".join(digests))
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words[slot :: len(digests[0]) // words.itemsize]
+
+
+def _date_time(digests: list[bytes]) -> list:
+    seconds = map(mod, _digest_words(digests, 0), repeat(_DATE_TIME_SPAN))
+    return list(map(_EPOCH.__add__, map(timedelta, repeat(0), seconds)))
+
+
+def _date(digests: list[bytes]) -> list:
+    days = map(mod, _digest_words(digests, 1), repeat(_DATE_SPAN))
+    ordinals = map(add, days, repeat(_EPOCH_ORDINAL))
+    return list(map(date.isoformat, map(date.fromordinal, ordinals)))
+
+
+def _time(digests: list[bytes]) -> list:
+    seconds = array("L", map(mod, _digest_words(digests, 2), repeat(86400)))
+    hours = map(floordiv, seconds, repeat(3600))
+    minutes = map(mod, map(floordiv, seconds, repeat(60)), repeat(60))
+    return list(
+        map(time.isoformat, map(time, hours, minutes, map(mod, seconds, repeat(60))))
+    )
+
+
+def _ipv4(digests: list[bytes]) -> list:
+    return list(map(inet_ntoa, map(getitem, digests, repeat(_IPV4_SLICE))))
+
+
+def _ipv6(digests: list[bytes]) -> list:
+    return list(
+        map(partial(inet_ntop, AF_INET6), map(getitem, digests, repeat(_IPV6_SLICE)))
+    )
+
+
+def _pool_provider(pool: Pool):
+    def provide(digests: list[bytes]) -> list:
+        indexes = map(mod, _digest_words(digests, 3), repeat(len(pool)))
+        return list(map(pool.__getitem__, indexes))
+
+    return provide
+
+
+class Providers:
+    """Anonymization generators driven by per-cell digests.
+
+    Each generator takes the digests of a whole column and returns one value
+    per digest. Numeric types are computed from the digest words with
+    array-wide arithmetic. Text types are looked up by index in the
+    memory-mapped pools when given, otherwise they are composed by a private
+    pt_BR Faker generator whose random source is a HashRandom, so switching
+    cells never reseeds a Mersenne Twister.
+    """
+
+    def __init__(self, pools: PoolSet = None) -> None:
+        self._random = HashRandom()
+        self._fake = Faker(locale=["pt_BR"])["pt_BR"]
+        self._fake.random = self._random
+
+        self.mapping = {
+            "name": self._faker_provider(self._fake.name),
+            "address": self._faker_provider(self._fake.address),
+            "email": self._faker_provider(self._fake.ascii_email),
+            "date_time": _date_time,
+            "date": _date,
+            "time": _time,
+            "cpf": self._faker_provider(lambda: fix_cpf(self._fake.cpf())),
+            "rg": self._faker_provider(lambda: fix_rg(self._fake.rg())),
+            "ipv4": _ipv4,
+            "ipv6": _ipv6,
+            "phone_number": self._faker_provider(self._fake.phone_number),
+            "cellphone_number": self._faker_provider(self._fake.cellphone_number),
+        }
+
+        if pools is not None:
+            for anonymization_type, pool in pools.pools.items():
+                self.mapping[anonymization_type] = _pool_provider(pool)
+
+    def _faker_provider(self, method):
+        seed = self._random.seed
+
+        def provide(digests: list[bytes]) -> list:
+            values = []
+            for digest in digests:
+                seed(digest)
+                values.append(method())
+            return values
+
+        return provide
+
+    def generate_batch(self, anonymization_type: str, digests: list[bytes]) -> list:
+        if not digests:
+            return []
+        return self.mapping[anonymization_type](digests)
+
+    def generate(self, anonymization_type: str, digest: bytes):
+        return self.mapping[anonymization_type]([digest])[0]
@@ -0,0 +1,181 @@
+from hashlib import blake2b
+
+from app.main.anonymization.pools import PoolSet
+from app.main.anonymization.providers import Providers
+from app.main.anonymization.value_cache import ValueCache
+
+_MISSING = object()
+
+
+class Pseudonymizer:
+    """Deterministic cell anonymizer keyed by a per-database secret.
+
+    Every cell is mapped to a keyed blake2b digest of
+    (database, table, column, row key, value) and the digest alone decides the
+    generated value, so the same inputs give the same output on every run.
+    Consistent columns leave the row key out of the digest, so equal original
+    values get equal fakes everywhere in the column.
+    """
+
+    digest_size = 32
+
+    def __init__(
+        self, secret: str, database_id: int, table_id: int, pools: PoolSet = None
+    ) -> None:
+        self._table_hasher = blake2b(
+            f"database{database_id}\x1ftable{table_id}".encode(),
+            key=bytes.fromhex(secret),
+            digest_size=self.digest_size,
+        )
+        self._column_hashers = {}
+        self.providers = Providers(pools=pools)
+
+    def _column_hasher(self, column_name: str):
+        hasher = self._column_hashers.get(column_name)
+        if hasher is None:
+            hasher = self._table_hasher.copy()
+            hasher.update(f"\x1fcolumn{column_name}\x1f".encode())
+            self._column_hashers[column_name] = hasher
+        return hasher
+
+    def digest(self, column_name: str, row_key, value) -> bytes:
+        hasher = self._column_hasher(column_name).copy()
+        hasher.update(f"row{row_key}\x1fvalue{value}".encode())
+        return hasher.digest()
+
+    def digests(self, column_name: str, row_keys, values) -> list[bytes]:
+        copy = self._column_hasher(column_name).copy
+        digests = []
+        for row_key, value in zip(row_keys, values):
+            hasher = copy()
+            hasher.update(f"row{row_key}\x1fvalue{value}".encode())
+            digests.append(hasher.digest())
+        return digests
+
+    def consistent_digests(self, column_name: str, values) -> list[bytes]:
+        copy = self._column_hasher(column_name).copy
+        digests = []
+        for value in values:
+            hasher = copy()
+            hasher.update(f"value{value}".encode())
+            digests.append(hasher.digest())
+        return digests
+
+    def anonymize(self, column_name: str, anonymization_type: str, row_key, value):
+        return self.providers.generate(
+            anonymization_type, self.digest(column_name, row_key, value)
+        )
+
+    def anonymize_column(
+        self, column_name: str, anonymization_type: str, row_keys, values
+    ) -> list:
+        return self.providers.generate_batch(
+            anonymization_type, self.digests(column_name, row_keys, values)
+        )
+
+    def anonymize_consistent_column(
+        self, column_name: str, anonymization_type: str, values, cache: ValueCache
+    ) -> list:
+        return _consistent(
+            copy=self._column_hasher(column_name).copy,
+            generate=self.providers.mapping[anonymization_type],
+            cache=cache,
+            values=values,
+        )
+
+
+class RowTransformer:
+    """Anonymize batches of rows, the key first, then the columns and any other values.
+
+    Everything a cell needs besides its value is resolved once, when the
+    transformer is built: the hasher, generator and cache of every column
+    and its position in the rows. Each batch is transposed once and the row
+    keys are formatted once for all of the columns, so the output is the
+    one of Pseudonymizer.anonymize_column and anonymize_consistent_column.
+    """
+
+    def __init__(
+        self,
+        pseudonymizer: Pseudonymizer,
+        columns: list[tuple],
+        key_count: int,
+        value_caches: dict,
+    ) -> None:
+        self.key_count = key_count
+        self.end = key_count + len(columns)
+        self.columns = [
+            (
+                pseudonymizer._column_hasher(name).copy,
+                pseudonymizer.providers.mapping[anonymization_type],
+                value_caches[name] if consistent else None,
+            )
+            for name, anonymization_type, consistent in columns
+        ]
+
+    def __call__(self, rows: list) -> list[tuple]:
+        if not rows:
+            return []
+
+        batch_columns = list(zip(*rows))
+        key_columns = batch_columns[: self.key_count]
+        prefixes = None
+
+        anonymized_columns = []
+        for index, (copy, generate, cache) in enumerate(
+            self.columns, start=self.key_count
+        ):
+            values = batch_columns[index]
+            if cache is not None:
+                anonymized_columns.append(
+                    _consistent(
+                        copy=copy, generate=generate, cache=cache, values=values
+                    )
+                )
+                continue
+
+            # Hashed as row{row key}\x1fvalue{value}, the first part shared by the columns
+            if prefixes is None:
+                row_keys = key_columns[0] if self.key_count == 1 else zip(*key_columns)
+                prefixes = [f"row{row_key}\x1fvalue".encode() for row_key in row_keys]
+
+            digests = []
+            append = digests.append
+            for prefix, value in zip(prefixes, values):
+                hasher = copy()
+                hasher.update(prefix)
+                hasher.update(f"{value}".encode())
+                append(hasher.digest())
+            anonymized_columns.append(generate(digests))
+
+        return list(zip(*key_columns, *anonymized_columns, *batch_columns[self.end :]))
+
+
+def _consistent(copy, generate, cache: ValueCache, values) -> list:
+    anonymized = []
+    # Positions of each original value that is not cached yet
+    missing = {}
+
+    for index, value in enumerate(values):
+        fake = cache.get(value, _MISSING)
+        if fake is _MISSING:
+            missing.setdefault(value, []).append(index)
+        anonymized.append(fake)
+
+    if missing:
+        distinct_values = list(missing)
+        digests = []
+        for value in distinct_values:
+            hasher = copy()
+            hasher.update(f"value{value}".encode())
+            digests.append(hasher.digest())
+
+        for value, fake in zip(distinct_values, generate(digests)):
+            cache.put(value, fake)
+            for index in missing[value]:
+                anonymized[index] = fake
+
+    # One generation per distinct value, every other cell is a hit
+    cache.misses += len(missing)
+    cache.hits += len(anonymized) - len(missing)
+
+    return anonymized
@@ -0,0 +1,223 @@
+from hashlib import sha256
+
+from sqlalchemy import Dialect
+from sqlalchemy import Table as saTable
+from sqlalchemy import TextClause, text
+
+from app.main.anonymization.providers import _DATE_SPAN, _DATE_TIME_SPAN
+
+# Types computed from the digest alone with arithmetic and string functions,
+# documents such as cpf or rg need check digits and are left to Python
+PUSHDOWN_TYPES = ["date_time", "date", "time", "ipv4", "ipv6"]
+
+PUSHDOWN_DIALECTS = ["postgresql", "mysql"]
+
+
+def pushdown_supported(dialect_name: str, anonymization_type: str) -> bool:
+    return dialect_name in PUSHDOWN_DIALECTS and anonymization_type in PUSHDOWN_TYPES
+
+
+class SqlPseudonymizer:
+    """Deterministic cell anonymizer compiled to SQL expressions of a dialect.
+
+    Every cell is mapped to an HMAC-SHA256, keyed by the secret, of
+    (database, table, column, row key, value), computed by the database, and
+    the digest alone decides the generated value as with Pseudonymizer.
+    Databases have no HMAC without extensions, so the statements hash twice
+    with SHA-256 and the inner and outer padded keys are bound instead of the
+    secret. Databases cannot compute the keyed blake2b digests of
+    Pseudonymizer, so the values differ from the Python ones, but they are as
+    deterministic: the same inputs give the same output on every run, and
+    consistent columns leave the row key out of the digest.
+    """
+
+    def __init__(
+        self, secret: str, database_id: int, table_id: int, dialect: Dialect
+    ) -> None:
+        if not dialect.name in PUSHDOWN_DIALECTS:
+            raise ValueError(f"Unsupported dialect: {dialect.name}")
+
+        self.dialect = dialect
+        self._pads = _hmac_pads(secret=secret)
+        self._prefix = f"database{database_id}\x1ftable{table_id}"
+        self._parameters = dict(self._pads)
+
+    def update(
+        self,
+        table: saTable,
+        columns: list[tuple],
+        key_columns: list[str],
+        lower: tuple = None,
+        upper: tuple = None,
+    ) -> TextClause:
+        """UPDATE anonymizing the given (name, type, consistent) columns.
+
+        Every row is updated, or only the rows whose key is above lower and
+        at most upper, compared as row values for composite keys.
+        """
+        preparer = self.dialect.identifier_preparer
+        self._parameters = dict(self._pads)
+        assignments = [
+            f"{preparer.quote(name)} = "
+            + self.expression(
+                table=table,
+                column_name=name,
+                anonymization_type=anonymization_type,
+                consistent=consistent,
+                key_columns=key_columns,
+            )
+            for name, anonymization_type, consistent in columns
+        ]
+
+        statement = (
+            f"UPDATE {preparer.format_table(table)} SET {', '.join(assignments)}"
+        )
+
+        # Bound like the prefixes, a parameter per key column
+        keys = ", ".join(preparer.quote(name) for name in key_columns)
+        conditions = []
+        for bound, operator, key in [("lower", ">", lower), ("upper", "<=", upper)]:
+            if key is None:
+                continue
+            names = [f"{bound}_{index}" for index in range(len(key_columns))]
+            self._parameters.update(zip(names, key))
+            values = ", ".join(f":{name}" for name in names)
+            conditions.append(f"({keys}) {operator} ({values})")
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+
+        return text(statement).bindparams(**self._parameters)
+
+    def expression(
+        self,
+        table: saTable,
+        column_name: str,
+        anonymization_type: str,
+        consistent: bool,
+        key_columns: list[str],
+    ) -> str:
+        if not anonymization_type in PUSHDOWN_TYPES:
+            raise ValueError(f"Unsupported anonymization type: {anonymization_type}")
+
+        # Each column hashes its own prefix, bound like the secret
+        parameter = f"column_{len(self._parameters)}"
+        self._parameters[parameter] = f"{self._prefix}\x1fcolumn{column_name}\x1f"
+
+        if self.dialect.name == "postgresql":
+            return self._postgresql(
+                table=table,
+                column_name=column_name,
+                anonymization_type=anonymization_type,
+                consistent=consistent,
+                key_columns=key_columns,
+                parameter=parameter,
+            )
+        return self._mysql(
+            column_name=column_name,
+            anonymization_type=anonymization_type,
+            consistent=consistent,
+            key_columns=key_columns,
+            parameter=parameter,
+        )
+
+    def _postgresql(
+        self,
+        table: saTable,
+        column_name: str,
+        anonymization_type: str,
+        consistent: bool,
+        key_columns: list[str],
+        parameter: str,
+    ) -> str:
+        quote = self.dialect.identifier_preparer.quote
+
+        # Cells hash as the text of the row key and value, None for null
+        data = [f"'value' || coalesce(CAST({quote(column_name)} AS text), 'None')"]
+        if not consistent:
+            key = "concat_ws(chr(31), " + ", ".join(quote(n) for n in key_columns) + ")"
+            data.insert(0, f"'row' || {key} || chr(31)")
+
+        inner = (
+            "sha256(decode(:inner_pad, 'hex') || "
+            f"convert_to(:{parameter} || {' || '.join(data)}, 'UTF8'))"
+        )
+        digest = f"encode(sha256(decode(:outer_pad, 'hex') || {inner}), 'hex')"
+
+        def word(slot: int) -> str:
+            # 48 bits of the 64-bit word number slot, as a bigint
+            return (
+                f"CAST(CAST('x' || substr({digest}, {slot * 16 + 1}, 12) "
+                "AS bit(48)) AS bigint)"
+            )
+
+        # Every expression is built, only the one of the type is used
+        generated = {
+            "date_time": "TIMESTAMP '1970-01-01' + "
+            f"mod({word(0)}, {_DATE_TIME_SPAN}) * INTERVAL '1 second'",
+            "date": "DATE '1970-01-01' + "
+            f"CAST(mod({word(1)}, {_DATE_SPAN}) AS integer)",
+            "time": f"TIME '00:00' + mod({word(2)}, 86400) * INTERVAL '1 second'",
+            "ipv4": "host(inet '0.0.0.0' + "
+            f"CAST(CAST('x' || substr({digest}, 1, 8) AS bit(32)) AS bigint))",
+            "ipv6": "host(CAST(regexp_replace(substr("
+            f"{digest}, 1, 32), '(.{{4}})(?!$)', '\\1:', 'g') AS inet))",
+        }[anonymization_type]
+
+        # Text has no assignment cast to every type, inet or date ones included
+        column_type = self.dialect.type_compiler_instance.process(
+            table.columns[column_name].type
+        )
+        return f"CAST({generated} AS {column_type})"
+
+    def _mysql(
+        self,
+        column_name: str,
+        anonymization_type: str,
+        consistent: bool,
+        key_columns: list[str],
+        parameter: str,
+    ) -> str:
+        quote = self.dialect.identifier_preparer.quote
+
+        # Cells hash as the text of the row key and value, None for null
+        data = ["'value'", f"COALESCE({quote(column_name)}, 'None')"]
+        if not consistent:
+            key = (
+                "CONCAT_WS(CHAR(31), " + ", ".join(quote(n) for n in key_columns) + ")"
+            )
+            data[:0] = ["'row'", key, "CHAR(31)"]
+
+        # A hexadecimal string, assignments convert the values to the column type
+        inner = f"UNHEX(SHA2(CONCAT(UNHEX(:inner_pad), :{parameter}, {', '.join(data)}), 256))"
+        digest = f"SHA2(CONCAT(UNHEX(:outer_pad), {inner}), 256)"
+
+        def word(slot: int) -> str:
+            # 48 bits of the 64-bit word number slot, unsigned
+            return (
+                f"CAST(CONV(SUBSTR({digest}, {slot * 16 + 1}, 12), 16, 10) AS UNSIGNED)"
+            )
+
+        return {
+            "date_time": f"TIMESTAMPADD(SECOND, MOD({word(0)}, {_DATE_TIME_SPAN}), "
+            "TIMESTAMP '1970-01-01 00:00:00')",
+            "date": f"DATE_ADD(DATE '1970-01-01', INTERVAL MOD({word(1)}, {_DATE_SPAN}) DAY)",
+            "time": f"SEC_TO_TIME(MOD({word(2)}, 86400))",
+            "ipv4": f"INET_NTOA(CONV(SUBSTR({digest}, 1, 8), 16, 10))",
+            "ipv6": f"INET6_NTOA(UNHEX(SUBSTR({digest}, 1, 32)))",
+        }[anonymization_type]
+
+
+def _hmac_pads(secret: str) -> dict:
+    """The hexadecimal inner and outer padded keys of the HMAC-SHA256 of secret.
+
+    HMAC(key, message) is sha256(outer_pad || sha256(inner_pad || message)).
+    """
+    key = bytes.fromhex(secret)
+    if len(key) > 64:
+        key = sha256(key).digest()
+    key = key.ljust(64, b"\0")
+
+    return {
+        "inner_pad": bytes(byte ^ 0x36 for byte in key).hex(),
+        "outer_pad": bytes(byte ^ 0x5C for byte in key).hex(),
+    }
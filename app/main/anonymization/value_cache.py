@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class ValueCache:
+    """Bounded original -> fake mapping with least recently used eviction."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, value, default=None):
+        fake = self._values.get(value, _MISSING)
+        if fake is _MISSING:
+            return default
+
+        self._values.move_to_end(value)
+        return fake
+
+    def put(self, value, fake) -> None:
+        self._values[value] = fake
+        self._values.move_to_end(value)
+        if len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+
+    def report(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
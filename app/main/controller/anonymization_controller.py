@@ -1,40 +1,220 @@
-from flask_restx import Resource
+from flask import request
+from flask_restx import Resource, inputs
 
-from app.main.service import delete_anonymization, save_new_anonymization
+from app.main.model import JOB_MODE
+from app.main.service import (
+    delete_anonymization,
+    explain_anonymization,
+    get_job_by_id,
+    get_job_group,
+    get_job_queue,
+    jwt_required,
+    resume_anonymization,
+    save_new_anonymization,
+    save_new_database_anonymization,
+)
 from app.main.util import AnonymizationDTO, DefaultResponsesDTO
 
 anonymization_ns = AnonymizationDTO.api
 api = anonymization_ns
 
+_anonymization_job = AnonymizationDTO.anonymization_job
+_anonymization_plan = AnonymizationDTO.anonymization_plan
+_anonymization_job_created = AnonymizationDTO.anonymization_job_created
+_anonymization_job_group = AnonymizationDTO.anonymization_job_group
+_job_queue = AnonymizationDTO.job_queue
+
 _default_message_response = DefaultResponsesDTO.message_response
 _validation_error_response = DefaultResponsesDTO.validation_error
 
+_anonymization_params = {
+    "workers": {
+        "description": "Worker processes, each one anonymizes a primary key range, "
+        "chosen from the rows by default",
+        "type": int,
+    },
+    "incremental": {
+        "description": "Anonymize only the rows added after the last anonymization",
+        "type": bool,
+    },
+    "mode": {
+        "description": "in_place updates the rows, swap builds an anonymized copy "
+        "of a PostgreSQL table and swaps it in, auto takes the cheapest one",
+        "enum": JOB_MODE + ["auto"],
+        "default": "in_place",
+    },
+}
+
 
 @api.route("/<int:table_id>")
 class AnonymizationByTableId(Resource):
-    @api.doc("Creates a new anonymization")
-    @api.response(201, "anonymization_created", _default_message_response)
-    @api.response(400, "Input payload validation failed", _validation_error_response)
+    @api.doc("Creates a new anonymization", params=_anonymization_params)
+    @api.response(202, "anonymization_job_created", _anonymization_job_created)
+    @api.response(
+        400,
+        "Input payload validation failed\nanonymization_mode_invalid",
+        _validation_error_response,
+    )
     @api.response(404, "table_not_found", _default_message_response)
     @api.response(
         409,
-        "database_not_exists\ntable_not_exists\ncolumn_not_exists\ntable_already_anonymized",
+        "table_already_anonymized\ntable_not_anonymized\ntable_columns_outdated\nswap_not_supported\n"
+        "database_not_exists\ntable_not_exists\njob_in_progress",
         _default_message_response,
     )
     def post(self, table_id):
-        """Creates a new anonymization"""
-        save_new_anonymization(table_id=table_id)
-        return {"message": "anonymization_created"}, 201
+        """Queues a new anonymization, follow it on /anonymization/jobs/<job_id>
+
+        On an anonymized table only the columns added or changed since are anonymized again.
+        The job runs the plan /anonymization/<table_id>/plan returns.
+        """
+        workers = request.args.get("workers", type=int)
+        incremental = request.args.get(
+            "incremental", type=inputs.boolean, default=False
+        )
+        mode = request.args.get("mode", type=str, default="in_place")
+        job = save_new_anonymization(
+            table_id=table_id, workers=workers, incremental=incremental, mode=mode
+        )
+        return {"message": "anonymization_job_created", "job_id": job.id}, 202
 
     @api.doc("Delete a anonymization")
-    @api.response(200, "anonymization_deleted", _default_message_response)
+    @api.response(202, "restore_job_created", _anonymization_job_created)
+    @api.response(404, "table_not_found", _default_message_response)
+    @api.response(409, "job_in_progress", _default_message_response)
+    def delete(self, table_id):
+        """Queues the restore of the original values, follow it on /anonymization/jobs/<job_id>"""
+        job = delete_anonymization(table_id=table_id)
+        return {"message": "restore_job_created", "job_id": job.id}, 202
+
+
+@api.route("/<int:table_id>/plan")
+class AnonymizationPlanByTableId(Resource):
+    @api.doc(
+        "Explain an anonymization", params=_anonymization_params, security="apikey"
+    )
+    @api.marshal_with(_anonymization_plan, code=200, description="anonymization_plan")
+    @api.response(
+        400,
+        "Input payload validation failed\nanonymization_mode_invalid",
+        _validation_error_response,
+    )
+    @api.response(401, "user_unauthorized", _default_message_response)
     @api.response(404, "table_not_found", _default_message_response)
     @api.response(
         409,
-        "database_not_exists\ncloud_database_not_exists\ntable_not_anonymized\ntable_not_exists",
+        "table_already_anonymized\ntable_not_anonymized\ntable_columns_outdated\nswap_not_supported\n"
+        "database_not_exists\ntable_not_exists",
         _default_message_response,
     )
-    def delete(self, table_id):
-        """Delete a anonymization"""
-        delete_anonymization(table_id=table_id)
-        return {"message": "anonymization_deleted"}, 200
+    @jwt_required()
+    def get(self, current_user, table_id):
+        """Get the plan of an anonymization with its estimated costs, without running it
+
+        The rows come from the statistics of the database or the registered estimate,
+        null when neither knows them; the job counts them when it starts.
+        """
+        return explain_anonymization(
+            current_user=current_user,
+            table_id=table_id,
+            workers=request.args.get("workers", type=int),
+            incremental=request.args.get(
+                "incremental", type=inputs.boolean, default=False
+            ),
+            mode=request.args.get("mode", type=str, default="in_place"),
+        )
+
+
+@api.route("/database/<int:database_id>")
+class AnonymizationByDatabaseId(Resource):
+    @api.doc(
+        "Creates the anonymizations of every table of a database",
+        params=_anonymization_params,
+        security="apikey",
+    )
+    @api.marshal_with(
+        _anonymization_job_group, code=202, description="anonymization_job_group"
+    )
+    @api.response(
+        400,
+        "Input payload validation failed\nanonymization_mode_invalid",
+        _validation_error_response,
+    )
+    @api.response(401, "user_unauthorized", _default_message_response)
+    @api.response(404, "database_not_found", _default_message_response)
+    @api.response(409, "no_table_to_anonymize", _default_message_response)
+    @jwt_required()
+    def post(self, current_user, database_id):
+        """Queues an anonymization of every registered table of a database as a job group
+
+        Tables that can not be anonymized are listed in skipped with the error a single
+        anonymization would return. The jobs run concurrently, at most JOB_SERVER_CONNECTIONS
+        connections on each database server they touch, largest table first.
+        Follow them on /anonymization/groups/<group_id>.
+        """
+        workers = request.args.get("workers", type=int)
+        incremental = request.args.get(
+            "incremental", type=inputs.boolean, default=False
+        )
+        mode = request.args.get("mode", type=str, default="in_place")
+        group = save_new_database_anonymization(
+            current_user=current_user,
+            database_id=database_id,
+            workers=workers,
+            incremental=incremental,
+            mode=mode,
+        )
+        return group, 202
+
+
+@api.route("/groups/<int:group_id>")
+class AnonymizationJobGroupById(Resource):
+    @api.doc("Get a job group", security="apikey")
+    @api.marshal_with(_anonymization_job_group, code=200, description="job_group_info")
+    @api.response(401, "user_unauthorized", _default_message_response)
+    @api.response(404, "job_group_not_found", _default_message_response)
+    @jwt_required()
+    def get(self, current_user, group_id):
+        """Get the state of the jobs of a group and their aggregate progress"""
+        return get_job_group(current_user=current_user, group_id=group_id)
+
+
+@api.route("/queue")
+class AnonymizationJobQueue(Resource):
+    @api.doc("Get the job queue", security="apikey")
+    @api.marshal_with(_job_queue, code=200, description="job_queue")
+    @jwt_required()
+    def get(self, current_user):
+        """Get the queued and running jobs, by user and database server, with their waits
+
+        Jobs start by fair share between the users, then smallest table first, as their
+        database servers have connections left. Users other than administrators only see
+        the jobs of their own databases.
+        """
+        return get_job_queue(current_user=current_user)
+
+
+@api.route("/jobs/<int:job_id>")
+class AnonymizationJobById(Resource):
+    @api.doc("Get an anonymization or restore job", security="apikey")
+    @api.marshal_with(_anonymization_job, code=200, description="job_info")
+    @api.response(401, "user_unauthorized", _default_message_response)
+    @api.response(404, "job_not_found", _default_message_response)
+    @jwt_required()
+    def get(self, current_user, job_id):
+        """Get the state, processed rows, rows per second and ETA of a job"""
+        return get_job_by_id(current_user=current_user, job_id=job_id)
+
+
+@api.route("/jobs/<int:job_id>/resume")
+class AnonymizationJobResume(Resource):
+    @api.doc("Resume a failed or killed job", security="apikey")
+    @api.response(202, "job_resumed", _anonymization_job_created)
+    @api.response(401, "user_unauthorized", _default_message_response)
+    @api.response(404, "job_not_found", _default_message_response)
+    @api.response(409, "job_not_resumable", _default_message_response)
+    @jwt_required()
+    def post(self, current_user, job_id):
+        """Resume a failed or killed job from its last checkpoint"""
+        job = resume_anonymization(current_user=current_user, job_id=job_id)
+        return {"message": "job_resumed", "job_id": job.id}, 202
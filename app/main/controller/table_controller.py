@@ -7,6 +7,7 @@ from app.main.service import (
     get_table_by_id,
     get_tables,
     jwt_required,
+    refresh_table_schema,
     save_new_table,
     update_table,
 )
@@ -88,6 +89,28 @@ class TableById(Resource):
         return get_table_by_id(current_user=current_user, table_id=table_id)
 
 
+@api.route("/<int:table_id>/refresh")
+class TableSchemaRefresh(Resource):
+    @api.doc(
+        "Refresh the schema of a table",
+        description="Introspect the remote table again for its primary key, column types and row estimate.",
+        security="apikey",
+    )
+    @api.response(200, "table_schema_refreshed", _default_message_response)
+    @api.response(401, "user_unauthorized", _default_message_response)
+    @api.response(404, "table_not_found", _default_message_response)
+    @api.response(
+        409,
+        "database_not_exists\ntable_not_exists",
+        _default_message_response,
+    )
+    @jwt_required()
+    def post(self, current_user, table_id: int):
+        """Refresh the schema of a table"""
+        refresh_table_schema(current_user=current_user, table_id=table_id)
+        return {"message": "table_schema_refreshed"}, 200
+
+
 @api.route("/<int:database_id>")
 class TableByDatabaseId(Resource):
     @api.doc("Creates a new table", security="apikey")
@@ -1,4 +1,5 @@
 from .column_model import *
 from .database_model import *
+from .job_model import *
 from .table_model import *
 from .user_model import *
@@ -1,4 +1,5 @@
 from app.main import db
+from app.main.anonymization import GENERATOR_VERSION, POOL_TYPES, get_pools
 
 ANONYMIZATION_TYPE = [
     "name",
@@ -16,6 +17,23 @@ ANONYMIZATION_TYPE = [
 ]
 
 
+def anonymization_applied(
+    name: str, anonymization_type: str, consistent: bool, pools: str
+) -> dict:
+    # What decides the anonymized values of a column, see Column.outdated
+    applied = {
+        "name": name,
+        "type": anonymization_type,
+        "consistent": consistent,
+        "version": GENERATOR_VERSION,
+    }
+
+    # The checksum of the pool file its values were drawn from, None for Faker
+    if anonymization_type in POOL_TYPES:
+        applied["pools"] = pools
+    return applied
+
+
 class Column(db.Model):
     __tablename__ = "column"
     _table_args_ = (
@@ -34,8 +52,25 @@ class Column(db.Model):
         db.Enum(*ANONYMIZATION_TYPE, name="column_anonymization_type_enum"),
         nullable=False,
     )
+    # Anonymize from the original value only, so equal values get equal fakes
+    consistent = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="false"
+    )
+    # Anonymization the values in the table went through, None while they are original
+    applied_anonymization = db.Column(db.JSON, nullable=True)
 
     table = db.relationship("Table", back_populates="columns")
 
     def __repr__(self) -> str:
         return f"<Column {self.id}>"
+
+    @property
+    def outdated(self) -> bool:
+        # Added, renamed or changed since its values were anonymized, or its pools
+        pools = get_pools()
+        return self.applied_anonymization != anonymization_applied(
+            name=self.name,
+            anonymization_type=self.anonymization_type,
+            consistent=self.consistent,
+            pools=pools.checksum if pools is not None else None,
+        )
@@ -1,3 +1,5 @@
+import secrets
+
 from app.main import db
 from app.main.config import Config
 
@@ -26,6 +28,10 @@ class Database(db.Model):
     host = db.Column(db.String(255), nullable=False)
     port = db.Column(db.Integer, nullable=False)
     name = db.Column(db.String(255), nullable=False)
+    # Key of the deterministic pseudonymizer, never exposed by the API
+    secret = db.Column(
+        db.String(64), nullable=False, default=lambda: secrets.token_hex(32)
+    )
 
     user = db.relationship("User", back_populates="databases")
     tables = db.relationship("Table", back_populates="database")
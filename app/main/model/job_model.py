@@ -0,0 +1,218 @@
+from datetime import datetime
+
+from app.main import db
+
+JOB_TYPE = ["anonymization", "restore"]
+
+JOB_STATE = ["queued", "running", "succeeded", "failed"]
+
+# Anonymizations update the rows in place or swap in a table built from them
+JOB_MODE = ["in_place", "swap"]
+
+
+class Job(db.Model):
+    __tablename__ = "job"
+
+    id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
+    table_id = db.Column(db.Integer, db.ForeignKey("table.id"), nullable=False)
+    # Group of the jobs queued together for the tables of a database
+    group_id = db.Column(db.Integer, db.ForeignKey("job_group.id"), nullable=True)
+
+    type = db.Column(db.Enum(*JOB_TYPE, name="job_type_enum"), nullable=False)
+    state = db.Column(
+        db.Enum(*JOB_STATE, name="job_state_enum"),
+        nullable=False,
+        default="queued",
+        server_default="queued",
+    )
+    workers = db.Column(db.Integer, nullable=True)
+    # None until the plan chooses it when the job starts
+    mode = db.Column(
+        db.Enum(*JOB_MODE, name="job_mode_enum"),
+        nullable=True,
+        default="in_place",
+        server_default="in_place",
+    )
+    # Whether only the rows after the watermark of the table are anonymized
+    incremental = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="false"
+    )
+    # Columns anonymized again, None when every column is anonymized
+    columns = db.Column(db.JSON, nullable=True)
+    # Columns whose original values are first copied into the backup
+    backup_columns = db.Column(db.JSON, nullable=True)
+    # How the job runs, chosen by the planner from the statistics of the database
+    plan = db.Column(db.JSON, nullable=True)
+    # Columns anonymized by the database with a single UPDATE, and whether it ran
+    pushdown_columns = db.Column(db.JSON, nullable=True)
+    pushed_down = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="false"
+    )
+    # Key of the last row the committed UPDATEs reached, they continue after it
+    pushdown_key = db.Column(db.JSON, nullable=True)
+    # Checksum of the pool file the job started with, None when it had none
+    pools = db.Column(db.String(64), nullable=True)
+    # host:pid of the process running the job, to tell when it was killed
+    owner = db.Column(db.String(255), nullable=True)
+    # Whether the backup was copied whole on the server instead of batch by batch
+    backup_copied = db.Column(db.Boolean, nullable=True)
+
+    # Estimated rows of the table when the job started, used for the ETA
+    rows_total = db.Column(db.BigInteger, nullable=True)
+    rows_processed = db.Column(
+        db.BigInteger, nullable=False, default=0, server_default="0"
+    )
+    report = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # When the job was last queued, again on a resume
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    table = db.relationship("Table", back_populates="jobs")
+    group = db.relationship("JobGroup", back_populates="jobs")
+    ranges = db.relationship(
+        "JobRange",
+        back_populates="job",
+        order_by="JobRange.id",
+        cascade="all, delete-orphan",
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id}>"
+
+    @property
+    def wait_seconds(self) -> float:
+        # Seconds in the queue so far, or until the scheduler started it
+        if self.state == "queued":
+            return (datetime.utcnow() - self.queued_at).total_seconds()
+        if self.started_at is None:
+            return None
+
+        return max((self.started_at - self.queued_at).total_seconds(), 0.0)
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+
+        elapsed = (
+            (self.finished_at or datetime.utcnow()) - self.started_at
+        ).total_seconds()
+        return self.rows_processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> float:
+        if self.state != "running" or not self.rows_total:
+            return None
+
+        rows_per_second = self.rows_per_second
+        if not rows_per_second:
+            return None
+
+        return max(self.rows_total - self.rows_processed, 0) / rows_per_second
+
+
+class JobRange(db.Model):
+    """Primary key range of an anonymization job and its committed watermark."""
+
+    __tablename__ = "job_range"
+
+    id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey("job.id"), nullable=False)
+
+    # Range lower < primary key <= upper as lists of key values, null is unbounded
+    lower = db.Column(db.JSON, nullable=True)
+    upper = db.Column(db.JSON, nullable=True)
+    # Key of the last row whose anonymization was committed
+    last_key = db.Column(db.JSON, nullable=True)
+    done = db.Column(db.Boolean, nullable=False, default=False, server_default="false")
+
+    job = db.relationship("Job", back_populates="ranges")
+
+    def __repr__(self) -> str:
+        return f"<JobRange {self.id}>"
+
+
+class JobGroup(db.Model):
+    """Jobs queued together for the registered tables of a database."""
+
+    __tablename__ = "job_group"
+
+    id = db.Column(db.Integer, nullable=False, autoincrement=True, primary_key=True)
+    database_id = db.Column(db.Integer, db.ForeignKey("database.id"), nullable=False)
+
+    type = db.Column(db.Enum(*JOB_TYPE, name="job_type_enum"), nullable=False)
+    # Tables left out of the group, each with the reason
+    skipped = db.Column(db.JSON, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    database = db.relationship("Database")
+    jobs = db.relationship("Job", back_populates="group", order_by="Job.id")
+
+    def __repr__(self) -> str:
+        return f"<JobGroup {self.id}>"
+
+    @property
+    def state(self) -> str:
+        states = {job.state for job in self.jobs}
+
+        if states <= {"queued"}:
+            return "queued"
+        if states & {"queued", "running"}:
+            return "running"
+        return "failed" if "failed" in states else "succeeded"
+
+    @property
+    def jobs_by_state(self) -> dict:
+        return {
+            state: sum(job.state == state for job in self.jobs) for state in JOB_STATE
+        }
+
+    @property
+    def rows_total(self) -> int:
+        return sum(job.rows_total or 0 for job in self.jobs)
+
+    @property
+    def rows_processed(self) -> int:
+        return sum(job.rows_processed for job in self.jobs)
+
+    @property
+    def started_at(self) -> datetime:
+        return min(
+            (job.started_at for job in self.jobs if job.started_at is not None),
+            default=None,
+        )
+
+    @property
+    def finished_at(self) -> datetime:
+        if self.state in ["queued", "running"]:
+            return None
+
+        return max(
+            (job.finished_at for job in self.jobs if job.finished_at is not None),
+            default=None,
+        )
+
+    @property
+    def rows_per_second(self) -> float:
+        started_at = self.started_at
+        if started_at is None:
+            return 0.0
+
+        elapsed = ((self.finished_at or datetime.utcnow()) - started_at).total_seconds()
+        return self.rows_processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> float:
+        if self.state not in ["queued", "running"] or not self.rows_total:
+            return None
+
+        rows_per_second = self.rows_per_second
+        if not rows_per_second:
+            return None
+
+        return max(self.rows_total - self.rows_processed, 0) / rows_per_second
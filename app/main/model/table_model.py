@@ -1,8 +1,6 @@
-from sqlalchemy import MetaData
-from sqlalchemy import Table as saTable
-from sqlalchemy import create_engine
-
 from app.main import db
+from app.main.exceptions import DefaultException
+from app.main.remote import get_engine, table_schema
 
 
 class Table(db.Model):
@@ -21,19 +19,33 @@ class Table(db.Model):
     name = db.Column(db.String(255), nullable=False)
 
     anonymized = db.Column(db.Boolean, nullable=False, server_default="false")
+    # Highest primary key anonymized, where an incremental anonymization starts
+    watermark = db.Column(db.JSON, nullable=True)
+
+    # Introspected from the remote table when registered and on a schema refresh
+    primary_key_columns = db.Column(db.JSON, nullable=True)
+    column_types = db.Column(db.JSON, nullable=True)
+    row_estimate = db.Column(db.BigInteger, nullable=True)
+    schema_refreshed_at = db.Column(db.DateTime, nullable=True)
 
     database = db.relationship("Database", back_populates="tables")
     columns = db.relationship("Column", back_populates="table")
+    jobs = db.relationship("Job", back_populates="table", cascade="all, delete-orphan")
 
     def __repr__(self) -> str:
         return f"<Table {self.id}>"
 
     @property
     def primary_key(self):
-        # create engine, reflect existing columns, and create table object for oldTable
-        engine = create_engine(url=self.database.url)
-        metadata = MetaData()
-        tableObj = saTable(self.name, metadata, autoload_with=engine)
-        primary_key = tableObj.primary_key.columns.keys()[0]
-        engine.dispose()
-        return primary_key
+        return self.primary_keys[0]
+
+    @property
+    def primary_keys(self) -> list[str]:
+        # stored when the table was registered, otherwise reflected from the cache
+        if self.primary_key_columns:
+            return self.primary_key_columns
+
+        schema = table_schema(get_engine(url=self.database.url), self.name)
+        if schema is None:
+            raise DefaultException("table_not_exists", code=409)
+        return schema["primary_keys"]
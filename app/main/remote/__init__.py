@@ -0,0 +1,7 @@
+from .engines import *
+from .loader import *
+from .reader import *
+from .schema import *
+from .shadow import *
+from .stats import *
+from .writer import *
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.pool import NullPool
+
+from app.main.config import Config
+
+
+class EngineRegistry:
+    """Process-wide engines of the registered databases, keyed by URL.
+
+    Every engine keeps its connection pool between requests and jobs, so
+    connecting and authenticating is paid once per connection instead of
+    once per call. At most max_size engines are kept: the least recently
+    used one is disposed to make room, and engines not asked for in
+    idle_seconds are disposed on the next lookup. Disposing only closes the
+    pooled connections, the ones still checked out are closed as they are
+    returned, so callers may keep using an engine that was evicted.
+
+    The registry is safe across threads, and a forked child drops the
+    engines of its parent without closing their connections, which still
+    belong to the parent.
+    """
+
+    def __init__(self, max_size: int, idle_seconds: float, pool_recycle: int) -> None:
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.pool_recycle = pool_recycle
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Fork on POSIX, Windows only spawns processes, which start with no engine
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, url: str, **kwargs) -> Engine:
+        key = (str(url), repr(sorted(kwargs.items())))
+
+        with self._lock:
+            now = time.monotonic()
+            self._dispose_idle(now=now)
+
+            entry = self._engines.get(key)
+            if entry is None:
+                entry = [self._create(url=url, **kwargs), now]
+                self._engines[key] = entry
+                while len(self._engines) > self.max_size:
+                    _, (engine, _) = self._engines.popitem(last=False)
+                    engine.dispose()
+
+            entry[1] = now
+            self._engines.move_to_end(key)
+            return entry[0]
+
+    def dispose(self, url: str = None) -> None:
+        """Dispose the engines of url, every engine without one."""
+        with self._lock:
+            for key in list(self._engines):
+                if url is None or key[0] == str(url):
+                    engine, _ = self._engines.pop(key)
+                    engine.dispose()
+
+    def _create(self, url: str, **kwargs) -> Engine:
+        # SQLite connections are files opened in the process, nothing to pool
+        if make_url(url).get_backend_name() == "sqlite":
+            kwargs.setdefault("poolclass", NullPool)
+        else:
+            # Connections dropped by the server are replaced before they are used
+            kwargs.setdefault("pool_pre_ping", True)
+            kwargs.setdefault("pool_recycle", self.pool_recycle)
+
+        return create_engine(url=url, **kwargs)
+
+    def _dispose_idle(self, now: float) -> None:
+        # The least recently used engines come first
+        while self._engines:
+            key, (engine, used) = next(iter(self._engines.items()))
+            if now - used < self.idle_seconds:
+                break
+            del self._engines[key]
+            engine.dispose()
+
+    def _after_fork(self) -> None:
+        # Another thread of the parent may have held the lock while forking
+        self._lock = threading.Lock()
+
+        # The sockets are shared with the parent, closing them would break its sessions
+        for engine, _ in self._engines.values():
+            engine.dispose(close=False)
+        self._engines.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def engine_registry() -> EngineRegistry:
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = EngineRegistry(
+                max_size=Config.ENGINE_REGISTRY_SIZE,
+                idle_seconds=Config.ENGINE_IDLE_SECONDS,
+                pool_recycle=Config.ENGINE_POOL_RECYCLE,
+            )
+        return _registry
+
+
+def get_engine(url: str, **kwargs) -> Engine:
+    """Shared engine of url, created with kwargs the first time. Never dispose it."""
+    return engine_registry().get(url, **kwargs)
+
+
+def dispose_engines(url: str = None) -> None:
+    engine_registry().dispose(url=url)
@@ -0,0 +1,751 @@
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+
+from sqlalchemy import ARRAY, URL, Connection, Dialect, MetaData
+from sqlalchemy import Table as saTable
+from sqlalchemy import exc, make_url, select, text
+from sqlalchemy.dialects.postgresql import HSTORE, Range
+from sqlalchemy.dialects.postgresql.ranges import AbstractMultiRange
+
+from .engines import get_engine
+from .reader import stream_batches
+
+LOAD_STRATEGIES = ["copy", "load_data", "insert"]
+
+_DEFAULT_PORTS = {"mysql": 3306, "postgresql": 5432}
+
+# Escapes of the default LOAD DATA format, tab separated and \N for NULL
+_MYSQL_ESCAPES = [
+    (b"\\", b"\\\\"),
+    (b"\t", b"\\t"),
+    (b"\n", b"\\n"),
+    (b"\r", b"\\r"),
+    (b"\0", b"\\0"),
+]
+
+
+def loader_connect_args(url: str) -> dict:
+    # mysqlclient refuses LOAD DATA LOCAL unless the connection allows it
+    if make_url(url).get_backend_name() == "mysql":
+        return {"local_infile": 1}
+    return {}
+
+
+def load_strategy(src_connection: Connection, dest_connection: Connection) -> str:
+    src_driver = (src_connection.dialect.name, src_connection.dialect.driver)
+    dest_driver = (dest_connection.dialect.name, dest_connection.dialect.driver)
+
+    if src_driver == dest_driver == ("postgresql", "psycopg2"):
+        return "copy"
+
+    if dest_driver == ("mysql", "mysqldb"):
+        # The server must also accept local files, it does not by default on MySQL 8
+        local_infile = dest_connection.exec_driver_sql("SELECT @@GLOBAL.local_infile")
+        if local_infile.scalar():
+            return "load_data"
+
+    return "insert"
+
+
+def copy_rows(
+    src_connection: Connection,
+    src_table: saTable,
+    dest_connection: Connection,
+    dest_table: saTable,
+    batch_size: int,
+    strategy: str = None,
+) -> None:
+    """Copy every row of src_table into dest_table, which has the same columns.
+
+    "copy" pipes COPY ... TO STDOUT on the source into COPY ... FROM STDIN on
+    the destination, both PostgreSQL, so rows are never parsed in Python.
+    "load_data" streams the source rows as LOAD DATA text through a FIFO into
+    LOAD DATA LOCAL INFILE on a MySQL destination, checked for skipped rows
+    and warnings since it would not fail on them. "insert" runs executemany
+    INSERTs of batch_size rows and works everywhere. dest_connection must be
+    inside a transaction begun by the caller, who commits it; when the source
+    side fails the error is raised before that, so no partial copy is kept.
+    """
+    strategy = strategy or load_strategy(src_connection, dest_connection)
+
+    if strategy == "copy":
+        _copy_rows_copy(src_connection, src_table, dest_connection, dest_table)
+    elif strategy == "load_data":
+        _copy_rows_load_data(
+            src_connection, src_table, dest_connection, dest_table, batch_size
+        )
+    elif strategy == "insert":
+        _copy_rows_insert(
+            src_connection, src_table, dest_connection, dest_table, batch_size
+        )
+    else:
+        raise ValueError(f"Unknown load strategy: {strategy}")
+
+
+def insert_rows(
+    connection: Connection, table: saTable, column_names: list[str], rows: list
+) -> None:
+    """Insert rows, tuples in column_names order, into table.
+
+    psycopg2 streams them with COPY ... FROM STDIN in the transaction of
+    connection, begun if need be, the other drivers run an executemany INSERT with positional
+    parameters, so the rows are passed on as they are.
+    """
+    if not rows:
+        return
+
+    if (connection.dialect.name, connection.dialect.driver) == (
+        "postgresql",
+        "psycopg2",
+    ):
+        preparer = connection.dialect.identifier_preparer
+        columns = ", ".join(preparer.quote(name) for name in column_names)
+        fields = _copy_fields([table.columns[name].type for name in column_names])
+        buffer = io.BytesIO(b"".join(_copy_line(row, fields) for row in rows))
+
+        # The driver cursor does not begin the transaction of connection, so
+        # its commit would do nothing and its close would roll the rows back
+        if not connection.in_transaction():
+            connection.begin()
+
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {preparer.format_table(table)} ({columns}) FROM STDIN", buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        statement, processors = _positional_insert(
+            dialect=connection.dialect, table=table, column_names=column_names
+        )
+        if statement is None:
+            connection.execute(
+                table.insert(), [dict(zip(column_names, row)) for row in rows]
+            )
+            return
+
+        # Convert only the values of the types the dialect binds itself
+        if any(processors):
+            rows = [
+                tuple(
+                    process(value) if process else value
+                    for process, value in zip(processors, row)
+                )
+                for row in rows
+            ]
+        elif not isinstance(rows[0], tuple):
+            # Result rows are not tuples to the driver
+            rows = [tuple(row) for row in rows]
+        connection.exec_driver_sql(statement, rows)
+
+
+def _positional_insert(dialect: Dialect, table: saTable, column_names: list[str]):
+    # Placeholders of the positional paramstyles, named ones fall back to Core
+    paramstyle = dialect.paramstyle
+    if paramstyle in ["format", "pyformat"]:
+        placeholders = ["%s"] * len(column_names)
+    elif paramstyle == "qmark":
+        placeholders = ["?"] * len(column_names)
+    elif paramstyle == "numeric":
+        placeholders = [f":{index}" for index in range(1, len(column_names) + 1)]
+    elif paramstyle == "numeric_dollar":
+        placeholders = [f"${index}" for index in range(1, len(column_names) + 1)]
+    else:
+        return None, None
+
+    preparer = dialect.identifier_preparer
+    statement = (
+        f"INSERT INTO {preparer.format_table(table)} "
+        f"({', '.join(preparer.quote(name) for name in column_names)})"
+    )
+    if paramstyle in ["format", "pyformat"]:
+        statement = statement.replace("%", "%%")
+    statement += f" VALUES ({', '.join(placeholders)})"
+
+    processors = [
+        table.columns[name].type.dialect_impl(dialect).bind_processor(dialect)
+        for name in column_names
+    ]
+    return statement, processors
+
+
+def same_server(src_url: str, dest_url: str) -> bool:
+    src_url = make_url(src_url)
+    dest_url = make_url(dest_url)
+
+    if src_url.get_backend_name() != dest_url.get_backend_name():
+        return False
+
+    return _server_addresses(src_url) & _server_addresses(dest_url) != set()
+
+
+def server_key(url: str) -> str:
+    """host:port of the server of url, without resolving it, the file of a SQLite database."""
+    url = make_url(url)
+
+    if url.get_backend_name() == "sqlite":
+        return f"sqlite:{url.database or ':memory:'}"
+
+    port = url.port or _DEFAULT_PORTS.get(url.get_backend_name())
+    return f"{url.host or 'localhost'}:{port}"
+
+
+def _server_addresses(url: URL) -> set:
+    port = url.port or _DEFAULT_PORTS.get(url.get_backend_name())
+    host = url.host or "localhost"
+
+    # Compare resolved addresses, so localhost and 127.0.0.1 are the same server
+    try:
+        return {
+            (address[4][0], port)
+            for address in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        }
+    except OSError:
+        return {(host, port)}
+
+
+def copy_rows_on_server(
+    src_url: str,
+    src_table: saTable,
+    dest_connection: Connection,
+    dest_table: saTable,
+) -> bool:
+    """Copy every row of src_table into dest_table without leaving the server.
+
+    Only for a source database on the server of dest_connection, see
+    same_server. MySQL runs a cross-database INSERT ... SELECT; PostgreSQL
+    can not query another database, so it reads the source through dblink
+    when that extension is installed in the destination database, see
+    _execute_through_dblink. Returns False, with the destination untouched,
+    when the server can not do it, for instance when the destination user
+    can not read the source.
+    """
+    dialect = dest_connection.dialect.name
+
+    if dialect == "mysql":
+        statement = _insert_from_database(src_url, src_table, dest_table)
+        return _execute_on_server(dest_connection, statement) is not None
+    elif dialect == "postgresql" and _has_dblink(dest_connection):
+        statement = _insert_from_dblink(
+            src_url,
+            dest_connection.engine.url,
+            src_table,
+            dest_table,
+            dest_connection.dialect,
+        )
+        return (
+            _execute_through_dblink(src_url, src_table, dest_connection, statement)
+            is not None
+        )
+
+    return False
+
+
+def update_rows_on_server(
+    src_url: str,
+    src_table: saTable,
+    dest_connection: Connection,
+    dest_table: saTable,
+    key_columns: list[str],
+) -> int:
+    """Write the other columns of src_table over the rows of dest_table with the same key.
+
+    A single UPDATE joined on key_columns that runs on the server, under the
+    same conditions as copy_rows_on_server: a multi-table UPDATE on MySQL,
+    UPDATE ... FROM dblink on PostgreSQL. Returns the rows updated, or None,
+    with the destination untouched, when the server can not do it.
+    """
+    dialect = dest_connection.dialect.name
+
+    if dialect == "mysql":
+        statement = _update_from_database(src_url, src_table, dest_table, key_columns)
+        return _execute_on_server(dest_connection, statement)
+    elif dialect == "postgresql" and _has_dblink(dest_connection):
+        statement = _update_from_dblink(
+            src_url,
+            dest_connection.engine.url,
+            src_table,
+            dest_table,
+            key_columns,
+            dest_connection.dialect,
+        )
+        return _execute_through_dblink(src_url, src_table, dest_connection, statement)
+
+    return None
+
+
+def _execute_on_server(connection: Connection, statement) -> int:
+    # Run in a savepoint, so a statement the server refuses leaves nothing behind
+    savepoint = connection.begin_nested()
+    try:
+        result = connection.execute(statement)
+    except exc.DBAPIError:
+        savepoint.rollback()
+        return None
+
+    savepoint.commit()
+    return result.rowcount
+
+
+def _execute_through_dblink(
+    src_url: str, src_table: saTable, dest_connection: Connection, statement
+) -> int:
+    """Run a statement of dest_connection reading src_table through dblink.
+
+    dblink connects to the source as the user of dest_connection, so the SQL
+    run there holds no credential but its own, and in particular restores
+    never send the password of the cloud database to the server of a
+    registered one. Both databases are on the same server, whose users are
+    shared, so the source lets that user read src_table only meanwhile.
+    """
+    role = dest_connection.engine.url.username
+    src_engine = get_engine(url=src_url)
+
+    try:
+        with src_engine.begin() as src_connection:
+            granted = _grant_select(src_connection, src_table, role)
+    except exc.DBAPIError:
+        return None
+
+    try:
+        return _execute_on_server(dest_connection, statement)
+    finally:
+        if granted:
+            with src_engine.begin() as src_connection:
+                _revoke_select(src_connection, src_table, role)
+
+
+def _grant_select(connection: Connection, table: saTable, role: str) -> bool:
+    # Returns whether it granted, a user that already reads the table keeps its privilege
+    preparer = connection.dialect.identifier_preparer
+    readable = connection.execute(
+        text("SELECT has_table_privilege(:role, :table, 'SELECT')"),
+        {"role": role, "table": preparer.format_table(table)},
+    ).scalar()
+    if readable:
+        return False
+
+    connection.execute(
+        text(
+            f"GRANT SELECT ON {preparer.format_table(table)} TO {preparer.quote(role)}"
+        )
+    )
+    return True
+
+
+def _revoke_select(connection: Connection, table: saTable, role: str) -> None:
+    preparer = connection.dialect.identifier_preparer
+    connection.execute(
+        text(
+            f"REVOKE SELECT ON {preparer.format_table(table)} "
+            f"FROM {preparer.quote(role)}"
+        )
+    )
+
+
+def _insert_from_database(src_url: str, src_table: saTable, dest_table: saTable):
+    names = dest_table.columns.keys()
+
+    # The source table qualified with its database, `name`.`table` on MySQL
+    src_table = src_table.to_metadata(MetaData(), schema=make_url(src_url).database)
+
+    return dest_table.insert().from_select(
+        names, select(*[src_table.columns[name] for name in names])
+    )
+
+
+def _update_from_database(
+    src_url: str, src_table: saTable, dest_table: saTable, key_columns: list[str]
+):
+    # The source table qualified with its database, `name`.`table` on MySQL, and
+    # aliased since both tables share a name MySQL would not tell apart
+    src_table = src_table.to_metadata(
+        MetaData(), schema=make_url(src_url).database
+    ).alias("source")
+
+    return (
+        dest_table.update()
+        .where(
+            *[
+                dest_table.columns[name] == src_table.columns[name]
+                for name in key_columns
+            ]
+        )
+        .values(
+            {
+                dest_table.columns[name]: src_table.columns[name]
+                for name in src_table.columns.keys()
+                if not name in key_columns
+            }
+        )
+    )
+
+
+def _has_dblink(connection: Connection) -> bool:
+    extension = connection.execute(
+        text("SELECT 1 FROM pg_extension WHERE extname = 'dblink'")
+    )
+    return extension.scalar() is not None
+
+
+def _insert_from_dblink(
+    src_url: str,
+    dest_url: URL,
+    src_table: saTable,
+    dest_table: saTable,
+    dialect: Dialect,
+):
+    names = dest_table.columns.keys()
+    preparer = dialect.identifier_preparer
+    columns = ", ".join(preparer.quote(name) for name in names)
+
+    return text(
+        f"INSERT INTO {preparer.format_table(dest_table)} ({columns}) "
+        f"SELECT {columns} FROM " + _dblink_source(dest_table, names, dialect)
+    ).bindparams(
+        conninfo=_dblink_conninfo(src_url, dest_url),
+        query=_dblink_query(src_table, names, dialect),
+    )
+
+
+def _update_from_dblink(
+    src_url: str,
+    dest_url: URL,
+    src_table: saTable,
+    dest_table: saTable,
+    key_columns: list[str],
+    dialect: Dialect,
+):
+    names = src_table.columns.keys()
+    preparer = dialect.identifier_preparer
+    target = preparer.format_table(dest_table)
+
+    assignments = ", ".join(
+        "{0} = source.{0}".format(preparer.quote(name))
+        for name in names
+        if not name in key_columns
+    )
+    conditions = " AND ".join(
+        "{0}.{1} = source.{1}".format(target, preparer.quote(name))
+        for name in key_columns
+    )
+
+    return text(
+        f"UPDATE {target} SET {assignments} FROM "
+        + _dblink_source(dest_table, names, dialect)
+        + f" WHERE {conditions}"
+    ).bindparams(
+        conninfo=_dblink_conninfo(src_url, dest_url),
+        query=_dblink_query(src_table, names, dialect),
+    )
+
+
+def _dblink_conninfo(src_url: str, dest_url: URL) -> str:
+    src_url = make_url(src_url)
+
+    # libpq connection string to the source as the destination user, every value quoted
+    return " ".join(
+        "{}='{}'".format(key, str(value).replace("\\", "\\\\").replace("'", "\\'"))
+        for key, value in [
+            ("host", src_url.host),
+            ("port", src_url.port),
+            ("dbname", src_url.database),
+            ("user", dest_url.username),
+            ("password", dest_url.password),
+        ]
+        if value is not None
+    )
+
+
+def _dblink_query(src_table: saTable, names: list[str], dialect: Dialect) -> str:
+    query = select(*[src_table.columns[name] for name in names])
+    return str(query.compile(dialect=dialect))
+
+
+def _dblink_source(dest_table: saTable, names: list[str], dialect: Dialect) -> str:
+    # dblink returns records, whose column types have to be spelled out
+    definitions = ", ".join(
+        "{} {}".format(
+            dialect.identifier_preparer.quote(name),
+            dest_table.columns[name].type.compile(dialect=dialect),
+        )
+        for name in names
+    )
+    return f"dblink(:conninfo, :query) AS source({definitions})"
+
+
+def _copy_rows_insert(
+    src_connection, src_table, dest_connection, dest_table, batch_size
+):
+    names = src_table.columns.keys()
+
+    # Stream all rows of the source table from a server-side cursor in batches
+    for rows in stream_batches(
+        connection=src_connection,
+        statement=select(*[src_table.columns[name] for name in names]),
+        batch_size=batch_size,
+    ):
+        dest_connection.execute(
+            dest_table.insert(), [dict(zip(names, row)) for row in rows]
+        )
+
+
+def _copy_rows_copy(src_connection, src_table, dest_connection, dest_table):
+    src_copy = f"COPY {_table_columns(src_connection, src_table)} TO STDOUT"
+    dest_copy = f"COPY {_table_columns(dest_connection, dest_table)} FROM STDIN"
+
+    src_cursor = src_connection.connection.dbapi_connection.cursor()
+    dest_cursor = dest_connection.connection.dbapi_connection.cursor()
+    read_fd, write_fd = os.pipe()
+
+    def produce():
+        with os.fdopen(write_fd, "wb") as pipe:
+            src_cursor.copy_expert(src_copy, pipe)
+
+    producer = _Producer(target=produce)
+    producer.start()
+
+    try:
+        with os.fdopen(read_fd, "rb") as pipe:
+            dest_cursor.copy_expert(dest_copy, pipe)
+    finally:
+        producer.join()
+        src_cursor.close()
+        dest_cursor.close()
+
+    producer.raise_error()
+
+
+def _copy_rows_load_data(
+    src_connection, src_table, dest_connection, dest_table, batch_size
+):
+    names = src_table.columns.keys()
+    directory = tempfile.mkdtemp()
+    fifo = os.path.join(directory, "rows")
+    os.mkfifo(fifo, 0o600)
+    produced = [0]
+
+    def produce():
+        with open(fifo, "wb") as pipe:
+            for rows in stream_batches(
+                connection=src_connection,
+                statement=select(*[src_table.columns[name] for name in names]),
+                batch_size=batch_size,
+            ):
+                pipe.write(b"".join(_mysql_line(row) for row in rows))
+                produced[0] += len(rows)
+
+    producer = _Producer(target=produce)
+    producer.start()
+
+    try:
+        result = dest_connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{fifo}' "
+            f"INTO TABLE {_table_columns(dest_connection, dest_table)} "
+            "CHARACTER SET utf8mb4"
+        )
+    finally:
+        # When the load stopped early, open and close the FIFO until the
+        # producer, blocked opening or writing it, fails with a broken pipe
+        while producer.is_alive():
+            os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+            producer.join(timeout=0.1)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    producer.raise_error()
+    _check_load_data(
+        connection=dest_connection, produced=produced[0], loaded=result.rowcount
+    )
+
+
+def _check_load_data(connection: Connection, produced: int, loaded: int) -> None:
+    """Raise unless LOAD DATA kept every row as it was sent.
+
+    LOCAL loads behave as IGNORE, duplicate keys skip their rows and invalid
+    values are truncated or converted, each reported only as a warning.
+    """
+    warnings = connection.exec_driver_sql("SELECT @@warning_count").scalar()
+    if warnings or loaded != produced:
+        messages = [
+            row[2] for row in connection.exec_driver_sql("SHOW WARNINGS LIMIT 3")
+        ]
+        raise ValueError(
+            f"LOAD DATA loaded {loaded} of {produced} rows with {warnings} "
+            f"warnings: {'; '.join(messages)}"
+        )
+
+
+def _table_columns(connection: Connection, table: saTable) -> str:
+    preparer = connection.dialect.identifier_preparer
+    columns = ", ".join(preparer.quote(name) for name in table.columns.keys())
+    return f"{preparer.format_table(table)} ({columns})"
+
+
+def _copy_fields(types: list) -> list:
+    """The function writing the values of each column type as COPY text.
+
+    A list is an array or a json value and a dict a hstore or a json one,
+    so the type of the column decides; json is the one _copy_field writes.
+    """
+    fields = []
+    for type_ in types:
+        if isinstance(type_, ARRAY):
+            fields.append(_copy_array_field)
+        elif isinstance(type_, HSTORE):
+            fields.append(_copy_hstore_field)
+        elif isinstance(type_, AbstractMultiRange):
+            fields.append(_copy_multirange_field)
+        else:
+            fields.append(_copy_field)
+    return fields
+
+
+def _copy_line(row, fields: list = None) -> bytes:
+    # COPY text format, the LOAD DATA one but with bytea in hex
+    if fields is None:
+        return b"\t".join(_copy_field(value) for value in row) + b"\n"
+    return b"\t".join(field(value) for field, value in zip(fields, row)) + b"\n"
+
+
+def _copy_field(value) -> bytes:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return _mysql_field("\\x" + bytes(value).hex())
+    if isinstance(value, Range):
+        return _mysql_field(_range_literal(value))
+    return _mysql_field(value)
+
+
+def _copy_array_field(value) -> bytes:
+    if value is None:
+        return b"\\N"
+    return _mysql_field(_array_literal(value))
+
+
+def _copy_hstore_field(value) -> bytes:
+    if value is None:
+        return b"\\N"
+    return _mysql_field(
+        ", ".join(
+            "{}=>{}".format(
+                _quote_literal(key), "NULL" if item is None else _quote_literal(item)
+            )
+            for key, item in value.items()
+        )
+    )
+
+
+def _copy_multirange_field(value) -> bytes:
+    if value is None:
+        return b"\\N"
+    return _mysql_field("{" + ",".join(_range_literal(item) for item in value) + "}")
+
+
+def _array_literal(value: list) -> str:
+    # {...} with every element quoted but NULL, nested lists for more dimensions
+    return (
+        "{"
+        + ",".join(
+            (
+                "NULL"
+                if item is None
+                else (
+                    _array_literal(item)
+                    if isinstance(item, (list, tuple))
+                    else _quote_literal(_literal_text(item))
+                )
+            )
+            for item in value
+        )
+        + "}"
+    )
+
+
+def _range_literal(value: Range) -> str:
+    if value.empty:
+        return "empty"
+
+    lower = "" if value.lower is None else _quote_literal(_literal_text(value.lower))
+    upper = "" if value.upper is None else _quote_literal(_literal_text(value.upper))
+    return f"{value.bounds[0]}{lower},{upper}{value.bounds[1]}"
+
+
+def _literal_text(value) -> str:
+    # The input text of a value inside an array or range literal
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, Range):
+        return _range_literal(value)
+    if isinstance(value, timedelta):
+        return _time_field(value)
+    return str(value)
+
+
+def _quote_literal(value: str) -> str:
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _mysql_line(row) -> bytes:
+    return b"\t".join(_mysql_field(value) for value in row) + b"\n"
+
+
+def _mysql_field(value) -> bytes:
+    if value is None:
+        return b"\\N"
+    if isinstance(value, bool):
+        return b"1" if value else b"0"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        field = bytes(value)
+    elif isinstance(value, (dict, list)):
+        field = json.dumps(value).encode()
+    elif isinstance(value, (set, frozenset)):
+        # SET members separated by commas, in any order
+        field = ",".join(sorted(value)).encode()
+    elif isinstance(value, timedelta):
+        field = _time_field(value).encode()
+    else:
+        field = str(value).encode()
+
+    for character, escaped in _MYSQL_ESCAPES:
+        field = field.replace(character, escaped)
+    return field
+
+
+def _time_field(value: timedelta) -> str:
+    # [-]hours:mm:ss[.ffffff], hours past 24 as MySQL TIME and intervals read them
+    microseconds = abs(value) // timedelta(microseconds=1)
+    seconds, fraction = divmod(microseconds, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hours, minute = divmod(minutes, 60)
+
+    field = f"{'-' if value < timedelta(0) else ''}{hours}:{minute:02}:{second:02}"
+    return field + (f".{fraction:06}" if fraction else "")
+
+
+class _Producer(threading.Thread):
+    """Thread feeding one end of a pipe, keeping its error for the caller."""
+
+    def __init__(self, target) -> None:
+        super().__init__(daemon=True)
+        self.produce = target
+        self.error = None
+
+    def run(self) -> None:
+        try:
+            self.produce()
+        except BaseException as e:
+            self.error = e
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,97 @@
+import operator
+from typing import Iterator
+
+from sqlalchemy import Connection, Engine, Executable
+from sqlalchemy import Table as saTable
+from sqlalchemy import select, tuple_
+
+
+def stream_batches(
+    connection: Connection, statement: Executable, batch_size: int
+) -> Iterator[list]:
+    """Yield the rows of statement in lists of at most batch_size rows.
+
+    The statement runs on a server-side cursor (a named cursor on psycopg2, an
+    SSCursor on mysqlclient), so the driver never buffers more than
+    batch_size rows. The connection can not run other statements while the
+    result is open, so writes must go through another connection.
+    """
+    result = connection.execution_options(
+        stream_results=True, max_row_buffer=batch_size
+    ).execute(statement)
+
+    try:
+        for rows in result.partitions(batch_size):
+            yield rows
+    finally:
+        result.close()
+
+
+class KeysetReader:
+    """Read a table in primary key order with short keyset queries.
+
+    Every batch is a WHERE pk > :last ORDER BY pk LIMIT :n query that walks
+    the primary key index, and its transaction ends before the batch is
+    yielded, so no snapshot is held between batches. Composite primary keys
+    are compared as tuples. last_key holds the key of the last row yielded,
+    so an interrupted read can resume from it with after=last_key.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        table: saTable,
+        primary_key: list[str],
+        batch_size: int,
+        columns: list[str] = None,
+        after: tuple = None,
+        upper: tuple = None,
+    ) -> None:
+        self.engine = engine
+        self.table = table
+        self.primary_key = primary_key
+        self.batch_size = batch_size
+        self.columns = list(columns or table.columns.keys())
+        self.last_key = tuple(after) if after is not None else None
+        self.upper = tuple(upper) if upper is not None else None
+
+    def _statement(self):
+        key_columns = [self.table.columns[name] for name in self.primary_key]
+
+        filters = []
+        if self.last_key is not None:
+            filters.append(key_compare(key_columns, self.last_key, operator.gt))
+        if self.upper is not None:
+            filters.append(key_compare(key_columns, self.upper, operator.le))
+
+        return (
+            select(*[self.table.columns[name] for name in self.columns])
+            .where(*filters)
+            .order_by(*key_columns)
+            .limit(self.batch_size)
+        )
+
+    def __iter__(self) -> Iterator[list]:
+        key_indexes = [self.columns.index(name) for name in self.primary_key]
+
+        with self.engine.connect() as connection:
+            while True:
+                rows = connection.execute(self._statement()).all()
+                # End the read transaction so its snapshot is not held meanwhile
+                connection.rollback()
+
+                if not rows:
+                    return
+
+                self.last_key = tuple(rows[-1][index] for index in key_indexes)
+                yield rows
+
+                if len(rows) < self.batch_size:
+                    return
+
+
+def key_compare(key_columns: list, key: tuple, compare):
+    # A single column key keeps the plain comparison, the most index friendly one
+    if len(key_columns) == 1:
+        return compare(key_columns[0], key[0])
+    return compare(tuple_(*key_columns), tuple_(*key))
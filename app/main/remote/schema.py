@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import Column, Connection, Engine, MetaData
+from sqlalchemy import Table as saTable
+from sqlalchemy import inspect, make_url, text
+from sqlalchemy.exc import NoSuchTableError
+
+from app.main.config import Config
+
+# Cheap query per dialect whose result changes with the columns, the primary
+# key and the indexes of the table, None when it does not exist
+_FINGERPRINTS = {
+    "postgresql": text(
+        "SELECT CAST(c.xmin AS text) || ':' || (SELECT string_agg(CAST(a.xmin AS text), "
+        "',' ORDER BY a.attnum) FROM pg_attribute a WHERE a.attrelid = c.oid "
+        "AND a.attnum > 0) || ':' || coalesce((SELECT string_agg(CAST(i.indexrelid AS "
+        "text) || '.' || CAST(i.xmin AS text), ',' ORDER BY i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = c.oid), '') FROM pg_class c "
+        "WHERE c.oid = to_regclass(quote_ident(:table))"
+    ),
+    # A sum of hashes per column and index entry, GROUP_CONCAT would be truncated
+    # past group_concat_max_len
+    "mysql": text(
+        "SELECT CONCAT(COUNT(*), ':', SUM(CRC32(CONCAT_WS(':', ordinal_position, "
+        "column_name, column_type, is_nullable))), ':', (SELECT CONCAT(COUNT(*), ':', "
+        "COALESCE(SUM(CRC32(CONCAT_WS(':', index_name, seq_in_index, column_name, "
+        "non_unique))), 0)) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = :table)) "
+        "FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = :table "
+        "HAVING COUNT(*) > 0"
+    ),
+    "sqlite": text(
+        "SELECT sql || ';' || coalesce((SELECT group_concat(coalesce(sql, name), ';') "
+        "FROM sqlite_master WHERE type = 'index' AND tbl_name = :table), '') "
+        "FROM sqlite_master WHERE type = 'table' AND name = :table"
+    ),
+}
+
+
+class SchemaCache:
+    """Reflected columns, primary key and indexes of remote tables.
+
+    Entries are keyed by database URL and table name. Reflecting a table
+    takes a query per kind of object, each a round trip, so a lookup only
+    runs the fingerprint query of the dialect, which changes with the
+    columns, primary key and indexes of the table, and reflects again when
+    it differs. Entries are also reflected again after ttl seconds, for the
+    changes a fingerprint misses and the dialects without one. At most
+    max_size tables are kept, the least recently used ones are dropped first.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bind: Engine | Connection, table_name: str) -> dict:
+        """Schema of table_name, None when it does not exist."""
+        if isinstance(bind, Engine):
+            with bind.connect() as connection:
+                return self.get(connection, table_name)
+
+        key = (str(bind.engine.url), table_name)
+        statement = _FINGERPRINTS.get(bind.dialect.name)
+
+        # A missing table has no fingerprint
+        fingerprint = None
+        if statement is not None:
+            fingerprint = bind.execute(statement, {"table": table_name}).scalar()
+
+        with self._lock:
+            entry = self._schemas.get(key)
+        if (
+            entry is not None
+            and time.monotonic() - entry["reflected_at"] < self.ttl
+            and (statement is None or entry["fingerprint"] == fingerprint)
+        ):
+            with self._lock:
+                if key in self._schemas:
+                    self._schemas.move_to_end(key)
+            return entry["schema"]
+
+        if statement is not None and fingerprint is None:
+            schema = None
+        else:
+            schema = _reflect(connection=bind, table_name=table_name)
+
+        with self._lock:
+            if schema is None:
+                self._schemas.pop(key, None)
+            else:
+                self._schemas[key] = {
+                    "schema": schema,
+                    "fingerprint": fingerprint,
+                    "reflected_at": time.monotonic(),
+                }
+                self._schemas.move_to_end(key)
+                while len(self._schemas) > self.max_size:
+                    self._schemas.popitem(last=False)
+
+        return schema
+
+    def invalidate(self, url: str = None, table_name: str = None) -> None:
+        # Keys hold the URLs as engines render them, without the password
+        url = str(make_url(url)) if url is not None else None
+
+        with self._lock:
+            for key in list(self._schemas):
+                if (url is None or key[0] == url) and (
+                    table_name is None or key[1] == table_name
+                ):
+                    del self._schemas[key]
+
+
+def _reflect(connection: Connection, table_name: str) -> dict:
+    inspector = inspect(connection)
+    if not inspector.has_table(table_name):
+        return None
+
+    return {
+        "columns": inspector.get_columns(table_name),
+        "primary_keys": inspector.get_pk_constraint(table_name)["constrained_columns"],
+        "indexes": inspector.get_indexes(table_name),
+    }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def schema_cache() -> SchemaCache:
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = SchemaCache(
+                max_size=Config.SCHEMA_CACHE_SIZE, ttl=Config.SCHEMA_CACHE_TTL
+            )
+        return _cache
+
+
+def table_schema(bind: Engine | Connection, table_name: str) -> dict:
+    """Columns, primary_keys and indexes of table_name, None when it does not exist."""
+    return schema_cache().get(bind, table_name)
+
+
+def schema_table(
+    bind: Engine | Connection, table_name: str, include_columns: list[str] = None
+) -> saTable:
+    """Table object of the columns of table_name, with their types and the primary key.
+
+    Enough to read and write rows, reflect the table for its constraints and
+    indexes. Raises NoSuchTableError like a reflection when it does not exist.
+    """
+    schema = table_schema(bind, table_name)
+    if schema is None:
+        raise NoSuchTableError(table_name)
+
+    return saTable(
+        table_name,
+        MetaData(),
+        *[
+            Column(
+                column["name"],
+                column["type"],
+                primary_key=column["name"] in schema["primary_keys"],
+                nullable=column["nullable"],
+            )
+            for column in schema["columns"]
+            if include_columns is None or column["name"] in include_columns
+        ],
+    )
+
+
+def invalidate_schema(url: str = None, table_name: str = None) -> None:
+    schema_cache().invalidate(url=url, table_name=table_name)
@@ -0,0 +1,280 @@
+import re
+
+from sqlalchemy import Connection, MetaData
+from sqlalchemy import Table as saTable
+from sqlalchemy import text
+
+# An identifier of a PostgreSQL definition, maybe quoted or schema qualified
+_NAME = r'(?:"(?:[^"]|"")*"|[^\s"])+'
+
+# pg_get_indexdef output, CREATE [UNIQUE] INDEX name ON [ONLY] table USING ...
+_INDEX_DEFINITION = re.compile(
+    rf"^CREATE (UNIQUE )?INDEX {_NAME} ON (?:ONLY )?{_NAME} (USING .*)$", re.DOTALL
+)
+
+
+def shadow_name(table_name: str, suffix: str) -> str:
+    # Identifiers are cut at 63 bytes by PostgreSQL, keep the suffix
+    return f"{table_name[: 62 - len(suffix)]}_{suffix}"
+
+
+def swap_blockers(connection: Connection, table: saTable) -> list[str]:
+    """What of table a swap would lose or fail on, nothing when it can be swapped.
+
+    The shadow table is created LIKE table, which copies its columns but not
+    its privileges, triggers or row security policies, and foreign keys and
+    views keep pointing at the table that is dropped, or stop the drop.
+    """
+    row = connection.execute(
+        text(
+            "SELECT "
+            "EXISTS (SELECT 1 FROM pg_constraint "
+            "WHERE confrelid = c.oid AND contype = 'f') AS referenced, "
+            "c.relacl IS NOT NULL AS privileges, "
+            "EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = c.oid "
+            "AND NOT tgisinternal AND tgname <> :changes) AS triggers, "
+            "c.relrowsecurity OR EXISTS (SELECT 1 FROM pg_policy "
+            "WHERE polrelid = c.oid) AS policies, "
+            "EXISTS (SELECT 1 FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid "
+            "WHERE d.classid = CAST('pg_rewrite' AS regclass) "
+            "AND d.refobjid = c.oid AND r.ev_class <> c.oid) AS views "
+            "FROM pg_class c WHERE c.oid = CAST(:table AS regclass)"
+        ),
+        # The trigger capturing the changes of a resumed swap is ours
+        {
+            "table": _format(connection, table),
+            "changes": shadow_name(table.name, "changes"),
+        },
+    ).one()
+
+    return [name for name, blocked in row._mapping.items() if blocked]
+
+
+def capture_changes(
+    connection: Connection, table: saTable, key_columns: list[str], changes: str
+) -> None:
+    """Record the key of every row written to table from now on into changes.
+
+    An AFTER trigger inserts the old key of updated and deleted rows and the
+    new key of inserted and updated rows into an unlogged table, which
+    take_changes empties.
+    """
+    preparer = connection.dialect.identifier_preparer
+    source = _format(connection, table)
+    target = _format(connection, saTable(changes, MetaData(), schema=table.schema))
+    keys = ", ".join(preparer.quote(name) for name in key_columns)
+
+    connection.exec_driver_sql(
+        f"CREATE UNLOGGED TABLE IF NOT EXISTS {target} "
+        f"AS SELECT {keys} FROM {source} WITH NO DATA"
+    )
+    connection.exec_driver_sql(
+        f"CREATE OR REPLACE FUNCTION {target}() RETURNS trigger "
+        "LANGUAGE plpgsql AS $$ BEGIN "
+        f"IF TG_OP <> 'INSERT' THEN INSERT INTO {target} VALUES "
+        f"({', '.join('OLD.' + preparer.quote(name) for name in key_columns)}); "
+        "END IF; "
+        f"IF TG_OP <> 'DELETE' THEN INSERT INTO {target} VALUES "
+        f"({', '.join('NEW.' + preparer.quote(name) for name in key_columns)}); "
+        "END IF; "
+        "RETURN NULL; END $$"
+    )
+    connection.exec_driver_sql(
+        f"DROP TRIGGER IF EXISTS {preparer.quote(changes)} ON {source}"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER {preparer.quote(changes)} "
+        f"AFTER INSERT OR UPDATE OR DELETE ON {source} "
+        f"FOR EACH ROW EXECUTE PROCEDURE {target}()"
+    )
+
+
+def take_changes(
+    connection: Connection, table: saTable, key_columns: list[str], changes: str
+) -> list[tuple]:
+    # Empty the captured keys in the transaction of the caller, once each
+    preparer = connection.dialect.identifier_preparer
+    target = _format(connection, saTable(changes, MetaData(), schema=table.schema))
+    keys = ", ".join(preparer.quote(name) for name in key_columns)
+
+    rows = connection.exec_driver_sql(f"DELETE FROM {target} RETURNING {keys}")
+    return list(dict.fromkeys(tuple(row) for row in rows))
+
+
+def create_shadow_table(connection: Connection, table: saTable, shadow: str) -> None:
+    # Same columns, defaults and identities, the indexes and constraints come last
+    target = _format(connection, saTable(shadow, MetaData(), schema=table.schema))
+
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {target}")
+    connection.exec_driver_sql(
+        f"CREATE TABLE {target} (LIKE {_format(connection, table)} INCLUDING ALL "
+        "EXCLUDING INDEXES EXCLUDING CONSTRAINTS EXCLUDING STATISTICS)"
+    )
+
+
+def copy_indexes(connection: Connection, table: saTable, shadow: str) -> list:
+    """Build the constraints and indexes of table on the filled shadow table.
+
+    Names are unique in a schema, so they get a suffix until swap_tables
+    gives them back their own names; the renames are returned for it.
+    """
+    preparer = connection.dialect.identifier_preparer
+    source = _format(connection, table)
+    target = _format(connection, saTable(shadow, MetaData(), schema=table.schema))
+    renames = []
+
+    # A resumed job may have built some of them already
+    built = (
+        connection.execute(
+            text(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass)"
+            ),
+            {"table": target},
+        )
+        .scalars()
+        .all()
+    )
+
+    # Primary key, unique, exclusion and check constraints, with their indexes
+    constraints = connection.execute(
+        text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = CAST(:table AS regclass) "
+            "AND contype IN ('p', 'u', 'x', 'c', 'f') ORDER BY contype = 'f', conname"
+        ),
+        {"table": source},
+    ).all()
+    for name, definition in constraints:
+        temporary = shadow_name(name, "shadow")
+        if temporary not in built:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {target} ADD CONSTRAINT {preparer.quote(temporary)} "
+                f"{definition}"
+            )
+        renames.append(("constraint", temporary, name))
+
+    # The other indexes, every one built in a single pass over the rows
+    indexes = connection.execute(
+        text(
+            "SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid) "
+            "FROM pg_index JOIN pg_class AS index_class "
+            "ON index_class.oid = pg_index.indexrelid "
+            "WHERE pg_index.indrelid = CAST(:table AS regclass) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint "
+            "WHERE conindid = pg_index.indexrelid AND conrelid = pg_index.indrelid) "
+            "ORDER BY index_class.relname"
+        ),
+        {"table": source},
+    ).all()
+    for name, definition in indexes:
+        temporary = shadow_name(name, "shadow")
+        connection.exec_driver_sql(
+            index_definition(
+                definition=definition,
+                name=preparer.quote(temporary),
+                table=target,
+            )
+        )
+        renames.append(("index", temporary, name))
+
+    return renames
+
+
+def index_definition(definition: str, name: str, table: str) -> str:
+    # The same index under another name, on another table
+    match = _INDEX_DEFINITION.match(definition)
+    if match is None:
+        raise ValueError(f"Unknown index definition: {definition}")
+
+    unique, method = match.groups()
+    return f"CREATE {unique or ''}INDEX IF NOT EXISTS {name} ON {table} {method}"
+
+
+def swap_tables(
+    connection: Connection, table: saTable, shadow: str, renames: list
+) -> None:
+    """Put the shadow table in the place of table, which is dropped.
+
+    Runs in the transaction of the caller, who should hold a lock on table
+    that keeps writers out. Sequences owned by the columns of table are
+    handed to the shadow ones and identities continue where table stopped.
+    """
+    preparer = connection.dialect.identifier_preparer
+    source = _format(connection, table)
+    target = _format(connection, saTable(shadow, MetaData(), schema=table.schema))
+    old = shadow_name(table.name, "old")
+
+    sequences = connection.execute(
+        text(
+            "SELECT attname, pg_get_serial_sequence(:table, attname), "
+            "attidentity <> '' FROM pg_attribute "
+            "WHERE attrelid = CAST(:table AS regclass) "
+            "AND attnum > 0 AND NOT attisdropped"
+        ),
+        {"table": source},
+    ).all()
+
+    for column, sequence, identity in sequences:
+        if sequence is None:
+            continue
+        if identity:
+            # The shadow identity has its own sequence, continue from the old one
+            connection.execute(
+                text(
+                    "SELECT setval(pg_get_serial_sequence(:shadow, :column), "
+                    f"last_value, is_called) FROM {sequence}"
+                ),
+                {"shadow": target, "column": column},
+            )
+        else:
+            # A serial column default, keep the sequence when the old table is dropped
+            connection.exec_driver_sql(
+                f"ALTER SEQUENCE {sequence} OWNED BY {target}.{preparer.quote(column)}"
+            )
+
+    connection.exec_driver_sql(f"ALTER TABLE {source} RENAME TO {preparer.quote(old)}")
+    connection.exec_driver_sql(
+        f"ALTER TABLE {target} RENAME TO {preparer.quote(table.name)}"
+    )
+    connection.exec_driver_sql(
+        "DROP TABLE "
+        + _format(connection, saTable(old, MetaData(), schema=table.schema))
+    )
+
+    # Give the constraints and indexes their names back
+    for kind, temporary, name in renames:
+        if kind == "constraint":
+            connection.exec_driver_sql(
+                f"ALTER TABLE {source} RENAME CONSTRAINT "
+                f"{preparer.quote(temporary)} TO {preparer.quote(name)}"
+            )
+        else:
+            index = saTable(temporary, MetaData(), schema=table.schema)
+            connection.exec_driver_sql(
+                f"ALTER INDEX {_format(connection, index)} "
+                f"RENAME TO {preparer.quote(name)}"
+            )
+
+
+def drop_shadow(connection: Connection, table: saTable) -> None:
+    # Remove what a swap left behind, the trigger on table included
+    changes = shadow_name(table.name, "changes")
+    preparer = connection.dialect.identifier_preparer
+
+    connection.exec_driver_sql(
+        f"DROP TRIGGER IF EXISTS {preparer.quote(changes)} "
+        f"ON {_format(connection, table)}"
+    )
+    for name in [changes, shadow_name(table.name, "shadow")]:
+        target = _format(connection, saTable(name, MetaData(), schema=table.schema))
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {target}")
+    connection.exec_driver_sql(
+        "DROP FUNCTION IF EXISTS "
+        + _format(connection, saTable(changes, MetaData(), schema=table.schema))
+        + "()"
+    )
+
+
+def _format(connection: Connection, table: saTable) -> str:
+    return connection.dialect.identifier_preparer.format_table(table)
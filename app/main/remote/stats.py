@@ -0,0 +1,131 @@
+import operator
+
+from sqlalchemy import Connection
+from sqlalchemy import Table as saTable
+from sqlalchemy import column, func, select
+from sqlalchemy import table as sql_table
+from sqlalchemy import text
+
+from app.main.remote.reader import key_compare
+
+
+def estimate_rows(connection: Connection, table: saTable, count: bool = True) -> int:
+    """Row count of table from the server statistics, counted when there are none.
+
+    The statistics are only as fresh as the last ANALYZE (PostgreSQL) or
+    InnoDB sample (MySQL), good enough for progress estimates and planning
+    but not for exact counts. Without count a table the server has no
+    statistics for is not scanned, its estimate is None.
+    """
+    estimate = None
+    dialect = connection.dialect.name
+
+    if dialect == "postgresql":
+        # reltuples is -1 on PostgreSQL 14+ and 0 before it for never analyzed tables
+        estimate = connection.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"
+            ),
+            {"name": connection.dialect.identifier_preparer.format_table(table)},
+        ).scalar()
+        if estimate is not None and estimate <= 0:
+            estimate = None
+
+    elif dialect == "mysql":
+        estimate = connection.execute(
+            text(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :name"
+            ),
+            {"name": table.name},
+        ).scalar()
+
+    if estimate is None:
+        if not count:
+            return None
+        estimate = connection.execute(select(func.count()).select_from(table)).scalar()
+
+    return int(estimate)
+
+
+def count_rows(
+    connection: Connection,
+    table_name: str,
+    primary_keys: list[str],
+    after: tuple = None,
+) -> int:
+    # Exact row count, of the rows with a primary key after the given one only
+    table = sql_table(table_name, *[column(name) for name in primary_keys])
+    key_columns = [table.columns[name] for name in primary_keys]
+
+    filters = []
+    if after is not None:
+        filters.append(key_compare(key_columns, after, operator.gt))
+
+    return connection.execute(
+        select(func.count()).select_from(table).where(*filters)
+    ).scalar()
+
+
+def table_bytes(connection: Connection, table: saTable) -> int:
+    # Size of the rows and indexes of table, None when the server does not tell
+    dialect = connection.dialect.name
+
+    if dialect == "postgresql":
+        size = connection.execute(
+            text("SELECT pg_total_relation_size(to_regclass(:name))"),
+            {"name": connection.dialect.identifier_preparer.format_table(table)},
+        ).scalar()
+    elif dialect == "mysql":
+        size = connection.execute(
+            text(
+                "SELECT data_length + index_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :name"
+            ),
+            {"name": table.name},
+        ).scalar()
+    else:
+        size = None
+
+    return int(size) if size is not None else None
+
+
+def distinct_values(connection: Connection, table: saTable, rows: int) -> dict:
+    """Estimated distinct values of the columns of table the server has statistics for.
+
+    PostgreSQL samples every analyzed column, a negative n_distinct being a
+    fraction of the rows; MySQL only keeps the cardinality of the columns
+    leading an index. Other columns are left out.
+    """
+    dialect = connection.dialect.name
+
+    if dialect == "postgresql":
+        statistics = connection.execute(
+            text(
+                "SELECT attname, n_distinct FROM pg_stats "
+                "WHERE schemaname = coalesce(:schema, current_schema()) "
+                "AND tablename = :name"
+            ),
+            {"schema": table.schema, "name": table.name},
+        ).all()
+        return {
+            name: int(-n_distinct * rows) if n_distinct < 0 else int(n_distinct)
+            for name, n_distinct in statistics
+        }
+
+    if dialect == "mysql":
+        statistics = connection.execute(
+            text(
+                "SELECT column_name, MAX(cardinality) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = :name "
+                "AND seq_in_index = 1 GROUP BY column_name"
+            ),
+            {"name": table.name},
+        ).all()
+        return {
+            name: int(cardinality)
+            for name, cardinality in statistics
+            if cardinality is not None
+        }
+
+    return {}
@@ -0,0 +1,149 @@
+from typing import Sequence
+
+from sqlalchemy import Column, Connection, MetaData
+from sqlalchemy import Table as saTable
+from sqlalchemy import bindparam, text
+from sqlalchemy.schema import DropTable
+
+from .loader import insert_rows
+
+# Bulk update strategy used by each dialect, the others fall back to executemany
+DIALECT_STRATEGIES = {
+    "postgresql": "join",
+    "mysql": "join",
+    "sqlite": "join",
+}
+
+UPDATE_STRATEGIES = ["executemany", "join"]
+
+
+def update_strategy(connection: Connection) -> str:
+    dialect = connection.dialect
+
+    # UPDATE ... FROM is only understood by SQLite 3.33 and later
+    if dialect.name == "sqlite" and dialect.dbapi.sqlite_version_info < (3, 33):
+        return "executemany"
+
+    return DIALECT_STRATEGIES.get(dialect.name, "executemany")
+
+
+def add_columns(connection: Connection, table: saTable, columns: list[Column]) -> None:
+    """Add nullable copies of columns, taken from another table, to table."""
+    dialect = connection.dialect
+    preparer = dialect.identifier_preparer
+
+    for column in columns:
+        connection.execute(
+            text(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {preparer.quote(column.name)} "
+                f"{column.type.compile(dialect=dialect)}"
+            )
+        )
+
+
+class BulkUpdater:
+    """Update many rows of a table, matched by their primary key, at once.
+
+    Rows are tuples with the key values first and then the new values. The
+    "executemany" strategy runs one UPDATE ... WHERE pk = :_pk per row, which
+    psycopg2 and mysqlclient send as one round trip per row. The "join"
+    strategy inserts the batch into a temporary staging table with
+    insert_rows, COPY on psycopg2 and a positional executemany otherwise,
+    and applies it with a single UPDATE joined on the primary key
+    (UPDATE ... FROM on PostgreSQL and SQLite, a multi-table UPDATE on
+    MySQL). The staging table lives on the connection, so every batch must
+    go through the same one, and close() drops it.
+    """
+
+    def __init__(
+        self,
+        connection: Connection,
+        table: saTable,
+        key_columns: list[str],
+        value_columns: list[str],
+        strategy: str = None,
+    ) -> None:
+        self.connection = connection
+        self.table = table
+        self.key_columns = key_columns
+        self.value_columns = value_columns
+        self.strategy = strategy or update_strategy(connection)
+        self.staging = None
+
+        if self.strategy not in UPDATE_STRATEGIES:
+            raise ValueError(f"Unknown update strategy: {self.strategy}")
+
+    def update(self, rows: Sequence[tuple]) -> None:
+        if not rows or not self.value_columns:
+            return
+
+        if self.strategy == "join":
+            self._update_join(rows=rows)
+        else:
+            self._update_executemany(rows=rows)
+
+    def _update_executemany(self, rows: Sequence[tuple]) -> None:
+        # Parameter names of the update statement, the key columns prefixed
+        update_keys = ["_" + name for name in self.key_columns] + self.value_columns
+        update = self.table.update().where(
+            *[
+                self.table.columns[name] == bindparam("_" + name)
+                for name in self.key_columns
+            ]
+        )
+
+        self.connection.execute(update, [dict(zip(update_keys, row)) for row in rows])
+
+    def _update_join(self, rows: Sequence[tuple]) -> None:
+        if self.staging is None:
+            self.staging = self._create_staging()
+        else:
+            self.connection.execute(self.staging.delete())
+
+        # Load the batch into the staging table with a single bulk insert
+        insert_rows(
+            connection=self.connection,
+            table=self.staging,
+            column_names=self.key_columns + self.value_columns,
+            rows=rows,
+        )
+
+        # Copy the new values over in one statement joined on the primary key
+        self.connection.execute(
+            self.table.update()
+            .where(
+                *[
+                    self.table.columns[name] == self.staging.columns[name]
+                    for name in self.key_columns
+                ]
+            )
+            .values(
+                {
+                    self.table.columns[name]: self.staging.columns[name]
+                    for name in self.value_columns
+                }
+            )
+        )
+
+    def _create_staging(self) -> saTable:
+        staging = saTable(
+            f"staging_{self.table.name}"[:63],
+            MetaData(),
+            *[
+                Column(
+                    name,
+                    self.table.columns[name].type,
+                    primary_key=name in self.key_columns,
+                )
+                for name in self.key_columns + self.value_columns
+            ],
+            prefixes=["TEMPORARY"],
+        )
+        staging.create(bind=self.connection)
+        return staging
+
+    def close(self) -> None:
+        if self.staging is not None:
+            self.connection.execute(DropTable(self.staging, if_exists=True))
+            self.staging = None
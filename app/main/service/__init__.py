@@ -1,5 +1,7 @@
 from .anonymization_service import *
 from .column_service import *
 from .database_service import *
+from .job_service import *
+from .plan_service import *
 from .table_service import *
 from .user import *
@@ -1,247 +1,1253 @@
-import re
+import operator
 import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
 
-from sqlalchemy import MetaData, Table, create_engine, exc, inspect, text
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import (
+    Engine,
+    MetaData,
+    Table,
+    exc,
+    func,
+    make_url,
+    select,
+)
+from sqlalchemy import table as sql_table
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
 from sqlalchemy_utils import database_exists
 
-from app.main import db, faker
+from app.main import db
+from app.main.anonymization import (
+    Pseudonymizer,
+    RowTransformer,
+    SqlPseudonymizer,
+    ValueCache,
+    get_pools,
+    job_pools,
+)
+from app.main.config import Config
 from app.main.exceptions import DefaultException
+from app.main.model import (
+    JOB_MODE,
+    Database,
+    Job,
+    JobGroup,
+    JobRange,
+)
 from app.main.model import Table as AnonTable
+from app.main.model import User, anonymization_applied
+from app.main.remote import (
+    BulkUpdater,
+    KeysetReader,
+    capture_changes,
+    copy_indexes,
+    count_rows,
+    create_shadow_table,
+    drop_shadow,
+    estimate_rows,
+    get_engine,
+    insert_rows,
+    key_compare,
+    same_server,
+    schema_table,
+    shadow_name,
+    swap_blockers,
+    swap_tables,
+    table_schema,
+    take_changes,
+    update_rows_on_server,
+)
 
 
-def fix_cpf(cpf: str):
-    if cpf is None:
-        return None
+def save_new_anonymization(
+    table_id: int,
+    workers: int = None,
+    incremental: bool = False,
+    mode: str = "in_place",
+) -> Job:
+    table, columns = _validate_anonymization(
+        table_id=table_id, incremental=incremental, mode=mode
+    )
+
+    # Choose how to run it from the statistics of the database, the mode of auto included
+    plan = plan_anonymization(
+        table=table,
+        workers=workers,
+        incremental=incremental,
+        mode=mode,
+        columns=columns,
+        count=False,
+    )
+
+    # Run the anonymization outside of the request, once the job scheduler takes it
+    return save_new_job(
+        table_id=table_id,
+        type="anonymization",
+        workers=workers,
+        incremental=incremental,
+        columns=columns,
+        mode=plan["mode"],
+        plan=plan,
+    )
+
+
+def save_new_database_anonymization(
+    current_user: User,
+    database_id: int,
+    workers: int = None,
+    incremental: bool = False,
+    mode: str = "in_place",
+) -> JobGroup:
+    """Queue the anonymization of every registered table of a database as a job group.
+
+    Each table is validated like save_new_anonymization, from the registered
+    tables alone; a table that can not be anonymized is left out with its
+    error. No remote database is read here, each job is planned when it
+    starts, see anonymize_table. The jobs are queued largest first by the
+    registered row estimates, so the longest ones start first and the
+    shorter ones fill the slots left by them.
+    """
+    if not mode in JOB_MODE + ["auto"]:
+        raise DefaultException("anonymization_mode_invalid", code=400)
+
+    database = get_database(
+        database_id=database_id, options=[joinedload(Database.tables)]
+    )
+
+    verify_user(current_user=current_user, user_id=database.user_id)
+
+    in_progress = {
+        table_id
+        for table_id, in db.session.query(Job.table_id).filter(
+            Job.table_id.in_([table.id for table in database.tables]),
+            Job.state.in_(["queued", "running"]),
+        )
+    }
+
+    jobs = []
+    skipped = []
+    for table in sorted(database.tables, key=lambda table: table.id):
+        try:
+            if table.id in in_progress:
+                raise DefaultException("job_in_progress", code=409)
+
+            table, columns = _validate_anonymization(
+                table_id=table.id, incremental=incremental, mode=mode
+            )
+
+        except DefaultException as e:
+            skipped.append(
+                {"table_id": table.id, "name": table.name, "error": e.description}
+            )
+            continue
+
+        jobs.append(
+            {
+                "table_id": table.id,
+                "kwargs": {
+                    "workers": workers,
+                    "incremental": incremental,
+                    "columns": columns,
+                    # Left to the plan of the job
+                    "mode": mode if mode != "auto" else None,
+                    "rows_total": table.row_estimate,
+                },
+            }
+        )
+
+    if not jobs:
+        raise DefaultException("no_table_to_anonymize", code=409)
+
+    # Longest processing time first keeps the last jobs to finish short
+    jobs.sort(key=lambda job: job["kwargs"]["rows_total"] or 0, reverse=True)
+
+    return save_new_job_group(
+        database_id=database_id, type="anonymization", jobs=jobs, skipped=skipped
+    )
+
+
+def explain_anonymization(
+    current_user: User,
+    table_id: int,
+    workers: int = None,
+    incremental: bool = False,
+    mode: str = "in_place",
+) -> dict:
+    table, columns = _validate_anonymization(
+        table_id=table_id, incremental=incremental, mode=mode
+    )
+
+    verify_user(current_user=current_user, user_id=table.database.user_id)
+
+    # The plan save_new_anonymization would run, nothing is queued or counted
+    return plan_anonymization(
+        table=table,
+        workers=workers,
+        incremental=incremental,
+        mode=mode,
+        columns=columns,
+        count=False,
+    )
+
+
+def _validate_anonymization(table_id: int, incremental: bool, mode: str) -> tuple:
+    if not mode in JOB_MODE + ["auto"]:
+        raise DefaultException("anonymization_mode_invalid", code=400)
 
-    cpf = re.sub("[.-]", "", cpf)
-    return cpf
+    # Get the table object with the specified ID, before anything is queued
+    table = get_table(table_id=table_id, options=[joinedload(AnonTable.columns)])
 
+    # The swap rebuilds a whole table, which only PostgreSQL can capture writes to meanwhile
+    if mode == "swap" and (
+        table.anonymized
+        or make_url(table.database.url).get_backend_name() != "postgresql"
+    ):
+        raise DefaultException("swap_not_supported", code=409)
 
-def fix_rg(rg: str):
-    if rg is None:
-        return None
+    # An incremental anonymization extends a previous one, a full one starts anew
+    if incremental and not table.anonymized:
+        raise DefaultException("table_not_anonymized", code=409)
+
+    # On an anonymized table only the columns added or changed since are anonymized again
+    columns = None
+    if table.anonymized:
+        outdated = [column.name for column in table.columns if column.outdated]
+        if incremental and outdated:
+            raise DefaultException("table_columns_outdated", code=409)
+        if not incremental and not outdated:
+            raise DefaultException("table_already_anonymized", code=409)
+        if not incremental:
+            columns = outdated
+
+    return table, columns
 
-    return rg.replace("X", "0")
 
+def anonymize_table(job: Job) -> dict:
+    """Anonymize the table of job, or on an incremental job the rows after its watermark.
 
-anonymization_mapping = {
-    "name": faker.name,
-    "address": faker.address,
-    "email": faker.ascii_email,
-    "date_time": faker.date_time,
-    "date": faker.date,
-    "time": faker.time,
-    "cpf": lambda: fix_cpf(faker.cpf()),
-    "rg": lambda: fix_rg(faker.rg()),
-    "ipv4": faker.ipv4,
-    "ipv6": faker.ipv6,
-    "phone_number": faker.phone_number,
-    "cellphone_number": faker.cellphone_number,
-}
+    The watermark is the highest primary key anonymized so far, so the
+    incremental mode relies on new rows getting higher keys, as with auto
+    increment keys. Their original values are appended to the backup.
 
+    A job with columns anonymizes only those columns of the rows in the
+    backup again, from the original values there; the values of columns the
+    backup does not have yet are copied into it from the table first.
+
+    A swap job leaves the table untouched: the anonymized rows go into a
+    shadow table that takes its place at the end, see _swap_shadow_table.
+
+    The job runs its plan, see plan_anonymization: the columns it pushes
+    down are anonymized with a single UPDATE on the server once the backup
+    holds every original value, and only the others go through the primary
+    key ranges.
+    """
+    table_id = job.table_id
 
-def save_new_anonymization(table_id: int) -> None:
     # Get the table object with the specified ID, including the associated database information
     table = get_table(table_id=table_id, options=[joinedload(AnonTable.database)])
 
-    # Check if the cloud database exists
-    if database_exists(url=table.database.cloud_url):
-        # Create an engine based on the cloud URL of the table's database
-        engine = create_engine(url=table.database.cloud_url)
-        # Check if the database has the table, and if so, raise an exception
-        if inspect(engine).has_table(table.name):
+    # A job with ranges or UPDATEs already run, so it continues from there
+    resuming = bool(job.ranges) or job.pushed_down or job.pushdown_key is not None
+
+    if not resuming:
+        # Check if the cloud database has the backup table
+        backed_up = False
+        if database_exists(url=table.database.cloud_url):
+            backup_schema = table_schema(
+                get_engine(url=table.database.cloud_url), table.name
+            )
+            backed_up = backup_schema is not None
+            if backed_up and job.backup_columns is None and job.columns is not None:
+                # Keep the columns to back up, on a resume some may be half copied
+                backup_names = [column["name"] for column in backup_schema["columns"]]
+                job.backup_columns = [
+                    name for name in job.columns if not name in backup_names
+                ]
+                db.session.commit()
+
+        extends_backup = job.incremental or job.columns is not None
+        if extends_backup and not backed_up:
+            raise DefaultException("table_not_anonymized", code=409)
+        if not extends_backup and backed_up:
             raise DefaultException("table_already_anonymized", code=409)
-        engine.dispose()
 
-    # Get the primary key of the table
-    primary_key = table.primary_key
+        # Jobs of a group, queued before plans were kept or whose rows the request
+        # could not count, are planned now
+        if job.plan is None or job.plan["rows"] is None:
+            job.plan = plan_anonymization(
+                table=table,
+                workers=job.workers,
+                incremental=job.incremental,
+                mode=job.mode or "auto",
+                columns=job.columns,
+            )
+            job.mode = job.plan["mode"]
 
-    # Clone the table by creating a destination table with the same structure and columns
-    clone_table(
-        table=table,
-        dest_columns=[primary_key] + [column.name for column in table.columns],
+        # Columns anonymized again hold fake values but for the ones just backed up
+        job.pushdown_columns = [
+            name
+            for name in pushdown_columns(plan=job.plan)
+            if job.columns is None or name in (job.backup_columns or [])
+        ] or None
+
+    # Get the primary key columns of the table
+    primary_keys = table.primary_keys
+
+    watermark = None
+    if job.incremental:
+        # Tables anonymized before watermarks were kept resume from the backup
+        watermark = _key(table.watermark) or _max_key(
+            url=table.database.cloud_url,
+            table_name=table.name,
+            primary_keys=primary_keys,
+        )
+
+    if not resuming:
+        # Every range and every resume draws from the pools the job started with
+        pools = get_pools(path=Config.ANONYMIZATION_POOL_PATH)
+        job.pools = pools.checksum if pools is not None else None
+
+        if job.columns is not None:
+            # Every original value is read from the backup, once it has every column
+            if job.backup_columns:
+                clone_columns(table=table, column_names=job.backup_columns)
+            job.backup_copied = True
+        elif job.incremental:
+            # The new rows are appended to the backup batch by batch
+            job.backup_copied = False
+        elif job.mode == "swap":
+            # Capture the writes to the table before it is backed up whole
+            _create_shadow_table(table=table, primary_keys=primary_keys)
+            job.backup_copied = clone_table(
+                table=table,
+                dest_columns=primary_keys + [column.name for column in table.columns],
+            )
+        else:
+            # Create the cloud backup table, copying the rows only when the server can do it alone,
+            # unless the plan loads them in bulk or an UPDATE on the server needs them first
+            job.backup_copied = clone_table(
+                table=table,
+                dest_columns=primary_keys + [column.name for column in table.columns],
+                server_only=job.plan["backup"] != "bulk_copy"
+                and not job.pushdown_columns,
+            )
+
+        # Estimate the rows to anonymize for the progress of the job, the backed up ones for columns
+        engine = get_engine(
+            url=(
+                table.database.cloud_url
+                if job.columns is not None
+                else table.database.url
+            )
+        )
+        with engine.connect() as connection:
+            job.rows_total = (
+                count_rows(
+                    connection=connection,
+                    table_name=table.name,
+                    primary_keys=primary_keys,
+                    after=watermark,
+                )
+                if job.incremental
+                else estimate_rows(connection=connection, table=sql_table(table.name))
+            )
+        db.session.commit()
+
+    # Describe the job with plain values so it can be shipped to worker processes
+    spec = {
+        "url": table.database.url,
+        "table_name": table.name,
+        "primary_keys": primary_keys,
+        "columns": [
+            (column.name, column.anonymization_type, column.consistent)
+            for column in table.columns
+            if job.columns is None or column.name in job.columns
+        ],
+        # A swap reads the table, backed up whole and untouched until the swap
+        "backup_url": table.database.cloud_url if job.mode != "swap" else None,
+        # Copied whole on the server, otherwise written batch by batch along the anonymization
+        "backup_copied": job.backup_copied if job.mode != "swap" else False,
+        "secret": table.database.secret,
+        "database_id": table.database_id,
+        "table_id": table_id,
+        "pool_path": Config.ANONYMIZATION_POOL_PATH,
+        "pools": job.pools,
+        "cache_size": Config.ANONYMIZATION_CACHE_SIZE,
+        "batch_size": Config.ANONYMIZATION_BATCH_SIZE,
+        "commit_batches": Config.ANONYMIZATION_COMMIT_BATCHES,
+        # Where the ranges save their checkpoints
+        "job": {
+            "url": db.engine.url.render_as_string(hide_password=False),
+            "id": job.id,
+        },
+        "shadow": None,
+    }
+
+    if job.mode == "swap":
+        spec["shadow"] = _shadow_spec(spec=spec)
+
+    # Anonymize the columns the database can compute before the ranges, only once
+    pushdown = job.pushdown_columns or []
+    if pushdown and not job.pushed_down:
+        _push_down_columns(
+            job=job,
+            spec=spec,
+            column_names=pushdown,
+            progress=len(pushdown) == len(spec["columns"]),
+        )
+        job.pushed_down = True
+        db.session.commit()
+
+    # The ranges anonymize the other columns, if any
+    range_spec = {
+        **spec,
+        "columns": [column for column in spec["columns"] if not column[0] in pushdown],
+    }
+
+    if not job.ranges and range_spec["columns"]:
+        workers = max(
+            1,
+            min(
+                (job.plan or {}).get("workers")
+                or job.workers
+                or Config.ANONYMIZATION_WORKERS,
+                Config.ANONYMIZATION_MAX_WORKERS,
+            ),
+        )
+
+        # Split the primary key, after the watermark, into one range per worker process
+        ranges = (
+            _primary_key_ranges(spec=range_spec, partitions=workers, after=watermark)
+            if workers > 1
+            else [(watermark, None)]
+        )
+        job.ranges = [
+            JobRange(
+                lower=list(lower) if lower is not None else None,
+                upper=list(upper) if upper is not None else None,
+            )
+            for lower, upper in ranges
+        ]
+        db.session.commit()
+
+    ranges = [
+        {
+            "lower": _key(job_range.lower),
+            "upper": _key(job_range.upper),
+            "after": _key(job_range.last_key),
+            "range_id": job_range.id,
+            "resumed": resuming,
+        }
+        for job_range in job.ranges
+        if not job_range.done
+    ]
+    report = (
+        anonymize_ranges(spec=range_spec, ranges=ranges)
+        if ranges
+        else {"rows_processed": 0, "cache": {}}
     )
 
-    # Create a new engine based on the URL of the table's database
-    engine = create_engine(url=table.database.url)
-    metadata = MetaData()
+    if job.mode == "swap":
+        _swap_shadow_table(spec=spec, backup_url=table.database.cloud_url)
 
-    # Create a table object for the table, including the primary key and other columns
-    tableObj = Table(
-        table.name,
-        metadata,
-        include_columns=[primary_key] + [column.name for column in table.columns],
-        extend_existing=True,
-        autoload_with=engine,
+    # The ranges saved their checkpoints on their own connections
+    db.session.expire_all()
+
+    # Without ranges every row went through the UPDATE
+    if not job.ranges:
+        report["rows_processed"] = job.rows_processed
+
+    # Record the highest key anonymized, where the next incremental run starts
+    last_keys = [
+        _key(job_range.last_key)
+        for job_range in job.ranges
+        if job_range.last_key is not None
+    ]
+    if last_keys:
+        table.watermark = list(max(last_keys + ([watermark] if watermark else [])))
+
+    # Record how each column was anonymized, to tell which ones change later
+    applied = {
+        name: anonymization_applied(
+            name=name,
+            anonymization_type=anonymization_type,
+            consistent=consistent,
+            pools=spec["pools"],
+        )
+        for name, anonymization_type, consistent in spec["columns"]
+    }
+    for column in table.columns:
+        if column.name in applied:
+            column.applied_anonymization = applied[column.name]
+
+    table.anonymized = True
+    db.session.commit()
+
+    return report
+
+
+def _push_down_columns(
+    job: Job, spec: dict, column_names: list[str], progress: bool
+) -> int:
+    """Anonymize the given columns of every row with UPDATEs on the server.
+
+    No row is transferred, the database computes every value from the
+    original one still in the table. Only the rows up to the highest key of
+    the backup are updated, the ones inserted after it was copied are left,
+    unsaved, to the next incremental run.
+
+    The rows are updated in primary key ranges of ANONYMIZATION_PUSHDOWN_ROWS,
+    each one committed and then saved as the checkpoint of the job, so no
+    transaction spans the table and a resumed job continues after the last
+    saved range; a range committed by a job killed before it was saved is
+    anonymized again, from fake values. With progress the rows count for the
+    job. Returns the rows updated.
+    """
+    primary_keys = spec["primary_keys"]
+
+    # An empty backup leaves no row to update
+    upper = _max_key(
+        url=spec["backup_url"], table_name=spec["table_name"], primary_keys=primary_keys
     )
+    if upper is None:
+        return 0
+
+    engine = get_engine(url=spec["url"])
+    tableObj = schema_table(
+        engine, spec["table_name"], include_columns=primary_keys + column_names
+    )
+    pseudonymizer = SqlPseudonymizer(
+        secret=spec["secret"],
+        database_id=spec["database_id"],
+        table_id=spec["table_id"],
+        dialect=engine.dialect,
+    )
+
+    key_columns = [tableObj.columns[name] for name in primary_keys]
+    columns = [column for column in spec["columns"] if column[0] in column_names]
+
+    lower = _key(job.pushdown_key)
+    rows_processed = 0
+    while lower != upper:
+        with engine.begin() as connection:
+            # The key closing the next range, the highest one of the backup at most
+            filters = [key_compare(key_columns, upper, operator.le)]
+            if lower is not None:
+                filters.append(key_compare(key_columns, lower, operator.gt))
+            bound = connection.execute(
+                select(*key_columns)
+                .where(*filters)
+                .order_by(*key_columns)
+                .offset(Config.ANONYMIZATION_PUSHDOWN_ROWS - 1)
+                .limit(1)
+            ).first()
+            bound = tuple(bound) if bound is not None else upper
+
+            rows = connection.execute(
+                pseudonymizer.update(
+                    table=tableObj,
+                    columns=columns,
+                    key_columns=primary_keys,
+                    lower=lower,
+                    upper=bound,
+                )
+            ).rowcount
+
+        # Save the checkpoint of the committed range
+        job.pushdown_key = list(bound)
+        db.session.commit()
+        if progress:
+            add_job_rows(engine=db.engine, job_id=job.id, rows=rows)
+
+        rows_processed += rows
+        lower = bound
+
+    return rows_processed
+
 
-    # Create a dictionary mapping column names to column indexes for the table
-    column_indexes = {
-        column_name: index for index, column_name in enumerate(tableObj.columns.keys())
+def _create_shadow_table(table: AnonTable, primary_keys: list[str]) -> None:
+    engine = get_engine(url=table.database.url)
+    tableObj = schema_table(engine, table.name, include_columns=primary_keys)
+
+    with engine.begin() as connection:
+        # Foreign keys, views, privileges and the like would be lost, or stop the drop
+        blockers = swap_blockers(connection=connection, table=tableObj)
+        if "referenced" in blockers:
+            raise DefaultException("table_referenced", code=409)
+        if blockers:
+            raise DefaultException("swap_not_supported", code=409)
+
+        capture_changes(
+            connection=connection,
+            table=tableObj,
+            key_columns=primary_keys,
+            changes=shadow_name(table.name, "changes"),
+        )
+        create_shadow_table(
+            connection=connection,
+            table=tableObj,
+            shadow=shadow_name(table.name, "shadow"),
+        )
+
+
+def _shadow_spec(spec: dict) -> dict:
+    anonymized = spec["primary_keys"] + [name for name, _, _ in spec["columns"]]
+
+    # The other columns are copied as they are, but for the generated ones
+    columns = table_schema(get_engine(url=spec["url"]), spec["table_name"])["columns"]
+
+    return {
+        "table": shadow_name(spec["table_name"], "shadow"),
+        "columns": [
+            column["name"]
+            for column in columns
+            if not column["name"] in anonymized and not "computed" in column
+        ],
     }
 
-    # Create a session for the engine
-    session = Session(bind=engine)
 
-    try:
-        # Retrieve the results from the table in batches
-        results = session.execute(
-            tableObj.select().order_by(tableObj.columns[table.primary_key])
+def _swap_shadow_table(spec: dict, backup_url: str) -> None:
+    """Build the indexes of the filled shadow table and swap it in for the table.
+
+    The rows written to the table during the build, whose keys the trigger
+    captured, are anonymized again into the shadow table and backed up, in
+    rounds while those keep coming. The last round runs with writers locked
+    out, in the transaction that swaps the tables, so it is short.
+    """
+    shadow = spec["shadow"]
+
+    engine = get_engine(url=spec["url"])
+    backup_engine = get_engine(url=backup_url)
+
+    # A resumed job may have swapped the tables already
+    if table_schema(engine, shadow["table"]) is None:
+        return
+
+    # The indexes and constraints of the table are built on the shadow one
+    tableObj = Table(spec["table_name"], MetaData(), autoload_with=engine)
+    shadow_table = schema_table(engine, shadow["table"])
+    backup_table = schema_table(backup_engine, spec["table_name"])
+
+    replay = partial(
+        _replay_changes,
+        spec=spec,
+        table=tableObj,
+        shadow_table=shadow_table,
+        backup_table=backup_table,
+        transform=RowTransformer(
+            pseudonymizer=Pseudonymizer(
+                secret=spec["secret"],
+                database_id=spec["database_id"],
+                table_id=spec["table_id"],
+                pools=job_pools(path=spec["pool_path"], checksum=spec["pools"]),
+            ),
+            columns=spec["columns"],
+            key_count=len(spec["primary_keys"]),
+            value_caches={
+                name: ValueCache(max_size=spec["cache_size"])
+                for name, _, consistent in spec["columns"]
+                if consistent
+            },
+        ),
+    )
+
+    # Build every constraint and index once, over all of the rows
+    with engine.begin() as connection:
+        renames = copy_indexes(
+            connection=connection, table=tableObj, shadow=shadow["table"]
+        )
+
+    with backup_engine.connect() as backup_connection:
+        while True:
+            with engine.begin() as connection:
+                replayed = replay(
+                    connection=connection, backup_connection=backup_connection
+                )
+            if replayed < spec["batch_size"]:
+                break
+
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "LOCK TABLE "
+                + connection.dialect.identifier_preparer.format_table(tableObj)
+                + " IN EXCLUSIVE MODE"
+            )
+            replay(connection=connection, backup_connection=backup_connection)
+            swap_tables(
+                connection=connection,
+                table=tableObj,
+                shadow=shadow["table"],
+                renames=renames,
+            )
+            drop_shadow(connection=connection, table=tableObj)
+
+
+def _replay_changes(
+    connection,
+    backup_connection,
+    spec: dict,
+    table: Table,
+    shadow_table: Table,
+    backup_table: Table,
+    transform: RowTransformer,
+) -> int:
+    primary_keys = spec["primary_keys"]
+    backup_names = primary_keys + [name for name, _, _ in spec["columns"]]
+    column_names = backup_names + spec["shadow"]["columns"]
+
+    # Take the keys written since the last round, in the transaction of connection
+    keys = take_changes(
+        connection=connection,
+        table=table,
+        key_columns=primary_keys,
+        changes=shadow_name(table.name, "changes"),
+    )
+
+    for start in range(0, len(keys), spec["batch_size"]):
+        batch_keys = keys[start : start + spec["batch_size"]]
+        rows = connection.execute(
+            select(*[table.columns[name] for name in column_names]).where(
+                tuple_(*[table.columns[name] for name in primary_keys]).in_(batch_keys)
+            )
+        ).all()
+
+        # Back up the current values of the rows first, the deleted ones are left out
+        backup_connection.execute(
+            backup_table.delete().where(
+                tuple_(*[backup_table.columns[name] for name in primary_keys]).in_(
+                    batch_keys
+                )
+            )
         )
+        insert_rows(
+            connection=backup_connection,
+            table=backup_table,
+            column_names=backup_names,
+            rows=[row[: len(backup_names)] for row in rows],
+        )
+        backup_connection.commit()
+
+        # Replace the rows of the shadow table with the anonymized current ones
+        connection.execute(
+            shadow_table.delete().where(
+                tuple_(*[shadow_table.columns[name] for name in primary_keys]).in_(
+                    batch_keys
+                )
+            )
+        )
+        if rows:
+            insert_rows(
+                connection=connection,
+                table=shadow_table,
+                column_names=column_names,
+                rows=transform(rows),
+            )
+
+    return len(keys)
+
+
+def _max_key(url: str, table_name: str, primary_keys: list[str]) -> tuple:
+    engine = get_engine(url=url)
+    tableObj = schema_table(engine, table_name, include_columns=primary_keys)
+    key_columns = [tableObj.columns[name] for name in primary_keys]
+
+    with engine.connect() as connection:
+        key = connection.execute(
+            select(*key_columns)
+            .order_by(*[column.desc() for column in key_columns])
+            .limit(1)
+        ).first()
+
+    return tuple(key) if key is not None else None
+
+
+def resume_anonymization(current_user: User, job_id: int) -> Job:
+    # Only the owner of the database resumes its jobs
+    get_job_by_id(current_user=current_user, job_id=job_id)
 
-        # Fetch the rows in batches of a specified size
-        batch_size = 100000
-        rows = results.fetchmany(batch_size)
+    # Anonymizations continue from their checkpoints, restores are simply run again
+    return resume_job(job_id=job_id)
 
-        while rows:
-            rows_to_update = []
-            for row in rows:
-                values = {}
-                values["_" + primary_key] = row[0]
 
-                # Anonymize the values of each column in the row
-                for column in table.columns:
-                    # Seed the faker instance with a specific value based on the database, table, column, and row
-                    faker.seed_instance(
-                        f"database{table.database_id}table{table_id}column{column.name}row{row[0]}value{str(row[column_indexes[column.name]])}"
-                    )
-                    # Apply the anonymization mapping function for the column's anonymization type
-                    values[column.name] = anonymization_mapping.get(
-                        column.anonymization_type
-                    )()
-                rows_to_update.append(values)
+def _key(values: list) -> tuple:
+    return tuple(values) if values is not None else None
 
-            # Update the corresponding rows in the table using the anonymized values
-            session.execute(
-                tableObj.update().where(text(f"{primary_key} = :_{primary_key}")),
-                rows_to_update,
+
+def anonymize_ranges(spec: dict, workers: int = 1, ranges: list[dict] = None) -> dict:
+    """Anonymize the given ranges, the table split in workers ranges otherwise.
+
+    Every range is a dict of _anonymize_range keyword arguments. A single
+    range runs in this thread, more run one per process.
+    """
+    if ranges is None:
+        ranges = [
+            {"lower": lower, "upper": upper}
+            for lower, upper in (
+                _primary_key_ranges(spec=spec, partitions=workers)
+                if workers > 1
+                else [(None, None)]
             )
+        ]
+
+    if len(ranges) == 1:
+        return _merge_reports(reports=[_anonymize_range(spec, **ranges[0])])
+
+    # Anonymize each range in its own process
+    with ProcessPoolExecutor(
+        max_workers=len(ranges), mp_context=get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(_anonymize_range, spec, **range_kwargs)
+            for range_kwargs in ranges
+        ]
+        return _merge_reports(reports=[future.result() for future in futures])
+
+
+def _primary_key_ranges(
+    spec: dict, partitions: int, after: tuple = None
+) -> list[tuple]:
+    engine = get_engine(url=spec["url"])
+    tableObj = schema_table(
+        engine, spec["table_name"], include_columns=spec["primary_keys"]
+    )
+    key_columns = [tableObj.columns[name] for name in spec["primary_keys"]]
+
+    # Only the rows after the given key, all of them without one
+    filters = []
+    if after is not None:
+        filters.append(key_compare(key_columns, after, operator.gt))
+
+    # Number the rows in primary key order, composite keys included
+    numbered = (
+        select(
+            *key_columns,
+            func.row_number().over(order_by=key_columns).label("row_number"),
+        )
+        .where(*filters)
+        .subquery()
+    )
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(func.count()).select_from(tableObj).where(*filters)
+        )
+        step = -(-rows.scalar() // partitions)
+
+        # The key closing each range is the last one of every step rows
+        bounds = []
+        if step:
+            bounds = connection.execute(
+                select(*[numbered.columns[name] for name in spec["primary_keys"]])
+                .where(numbered.c.row_number % step == 0)
+                .order_by(numbered.c.row_number)
+            ).all()
 
-            rows = results.fetchmany(batch_size)
+    # Ranges are (lower, upper], the last one is open to catch rows inserted meanwhile
+    bounds = [tuple(bound) for bound in bounds[: partitions - 1]]
+    lowers = [after] + bounds
+    uppers = bounds + [None]
+    return list(zip(lowers, uppers))
 
-        session.commit()
 
-    except Exception as e:
-        session.rollback()
+def _anonymize_range(
+    spec: dict,
+    lower: tuple = None,
+    upper: tuple = None,
+    after: tuple = None,
+    range_id: int = None,
+    resumed: bool = False,
+) -> dict:
+    """Anonymize the rows with lower < primary key <= upper, None meaning unbounded.
+
+    Only takes plain values, so it runs the same in the request thread and in
+    a worker process, and the output does not depend on how rows are split.
+    Every commit_batches batches the updates are committed and, for a job
+    range, the key of the last one is saved as its checkpoint; after resumes
+    the range from such a key.
+
+    Original values come from the backup when it has them: all of the rows
+    of a backup copied on the server, and the rows a resumed range backed up
+    after its checkpoint, maybe anonymized already, so resuming does not
+    anonymize fake values. The other rows are read from the table, committed
+    to the backup and only then anonymized, so a failed backup write stops
+    the range before its batch is touched.
+
+    With a shadow table the rows are inserted there, with the values of the
+    other columns, instead of updated in place. A resumed range first deletes
+    the ones it committed after its checkpoint, the shadow table has no
+    primary key yet to keep them from being inserted twice.
+    """
+    primary_keys = spec["primary_keys"]
+    columns = spec["columns"]
+    shadow = spec["shadow"]
+    column_names = (
+        primary_keys
+        + [name for name, _, _ in columns]
+        + (shadow["columns"] if shadow else [])
+    )
+
+    # Get the shared engine of the table's database
+    engine = get_engine(url=spec["url"])
+
+    # Create a table object for the table, including the primary key and other columns
+    tableObj = schema_table(engine, spec["table_name"], include_columns=column_names)
+
+    # Create a deterministic pseudonymizer keyed by the database secret
+    pseudonymizer = Pseudonymizer(
+        secret=spec["secret"],
+        database_id=spec["database_id"],
+        table_id=spec["table_id"],
+        pools=job_pools(path=spec["pool_path"], checksum=spec["pools"]),
+    )
+
+    # Create one bounded original -> fake cache per consistent column
+    value_caches = {
+        name: ValueCache(max_size=spec["cache_size"])
+        for name, _, consistent in columns
+        if consistent
+    }
+    rows_processed = 0
+
+    # Resolve the hasher, generator and cache of every column once for the range
+    transform = RowTransformer(
+        pseudonymizer=pseudonymizer,
+        columns=columns,
+        key_count=len(primary_keys),
+        value_caches=value_caches,
+    )
+
+    # Get an engine on the metadata database for the checkpoints of the job
+    job_engine = get_engine(url=spec["job"]["url"]) if range_id else None
 
-        # Print any exceptions that occur during the process
-        print(e)
+    # Open the connection the backup is read and written through
+    backup_engine = backup_table = backup_connection = None
+    if spec["backup_url"]:
+        backup_engine = get_engine(url=spec["backup_url"])
+        backup_table = schema_table(backup_engine, spec["table_name"])
+        backup_connection = backup_engine.connect()
 
+    def batches():
+        # Read the range in primary key order with short keyset queries, the backup first
+        last_key = after if after is not None else lower
+        if backup_table is not None:
+            backup_reader = KeysetReader(
+                engine=backup_engine,
+                table=backup_table,
+                primary_key=primary_keys,
+                batch_size=spec["batch_size"],
+                columns=column_names,
+                after=last_key,
+                upper=upper,
+            )
+            for rows in backup_reader:
+                yield rows, False
+            last_key = backup_reader.last_key
+
+        if not spec["backup_copied"]:
+            reader = KeysetReader(
+                engine=engine,
+                table=tableObj,
+                primary_key=primary_keys,
+                batch_size=spec["batch_size"],
+                columns=column_names,
+                after=last_key,
+                upper=upper,
+            )
+            for rows in reader:
+                yield rows, backup_connection is not None
+
+    # Open the connection the batches are written through
+    connection = engine.connect()
+    if shadow:
+        shadow_table = schema_table(engine, shadow["table"])
+        if resumed:
+            key_columns = [shadow_table.columns[name] for name in primary_keys]
+            start = after if after is not None else lower
+            filters = []
+            if start is not None:
+                filters.append(key_compare(key_columns, start, operator.gt))
+            if upper is not None:
+                filters.append(key_compare(key_columns, upper, operator.le))
+            connection.execute(shadow_table.delete().where(*filters))
+            connection.commit()
     else:
-        table.anonymized = True
-        db.session.commit()
+        updater = BulkUpdater(
+            connection=connection,
+            table=tableObj,
+            key_columns=primary_keys,
+            value_columns=[name for name, _, _ in columns],
+        )
+    last_key = None
+    uncommitted_batches = uncommitted_rows = 0
+
+    def commit(done: bool = False):
+        connection.commit()
+
+        # Save the checkpoint only once the updates up to it are committed
+        if job_engine is not None:
+            save_checkpoint(
+                engine=job_engine,
+                job_id=spec["job"]["id"],
+                range_id=range_id,
+                last_key=last_key,
+                rows=uncommitted_rows,
+                done=done,
+            )
+
+    try:
+        for rows, backup in batches():
+            # Back up the original batch first, it is not anonymized if that fails
+            if backup:
+                insert_rows(
+                    connection=backup_connection,
+                    table=backup_table,
+                    column_names=column_names,
+                    rows=rows,
+                )
+                backup_connection.commit()
+
+            anonymized_rows = transform(rows)
+
+            # Write the anonymized rows to the shadow table, or over the original ones
+            if shadow:
+                insert_rows(
+                    connection=connection,
+                    table=shadow_table,
+                    column_names=column_names,
+                    rows=anonymized_rows,
+                )
+            else:
+                updater.update(rows=anonymized_rows)
+
+            rows_processed += len(rows)
+            last_key = tuple(rows[-1][: len(primary_keys)])
+            uncommitted_batches += 1
+            uncommitted_rows += len(rows)
+
+            # Commit every few batches, so locks and lost work stay bounded
+            if uncommitted_batches == spec["commit_batches"]:
+                commit()
+                uncommitted_batches = uncommitted_rows = 0
+
+        if not shadow:
+            updater.close()
+        commit(done=True)
+
+    except Exception:
+        connection.rollback()
+        raise
 
     finally:
-        # Close the session
-        session.close()
+        # Close the connections
+        connection.close()
+        if backup_connection is not None:
+            backup_connection.close()
+
+    return {
+        "rows_processed": rows_processed,
+        "cache": {
+            column_name: value_cache.report()
+            for column_name, value_cache in value_caches.items()
+        },
+    }
+
+
+def _merge_reports(reports: list[dict]) -> dict:
+    caches = {}
+    for report in reports:
+        for column_name, cache in report["cache"].items():
+            merged = caches.setdefault(column_name, {"size": 0, "hits": 0, "misses": 0})
+            merged["hits"] += cache["hits"]
+            merged["misses"] += cache["misses"]
+
+            # Every worker process has its own cache, the size is the largest one
+            merged["size"] = max(merged["size"], cache["size"])
+
+    for cache in caches.values():
+        lookups = cache["hits"] + cache["misses"]
+        cache["hit_rate"] = cache["hits"] / lookups if lookups else 0.0
+
+    return {
+        "rows_processed": sum(report["rows_processed"] for report in reports),
+        "cache": caches,
+    }
+
+
+def delete_anonymization(table_id: int) -> Job:
+    # Get the table object with the specified ID, before anything is queued
+    get_table(table_id=table_id)
+
+    # Run the restore outside of the request, once the job scheduler takes it
+    return save_new_job(table_id=table_id, type="restore")
 
-        # Dispose the engine
-        engine.dispose()
 
+def restore_table(job: Job) -> dict:
+    # A restore run again writes every original value again
+    job.rows_processed = 0
 
-def delete_anonymization(table_id: int):
     # Get the table object with the specified ID, including the associated database information
-    table = get_table(table_id=table_id, options=[joinedload(AnonTable.database)])
+    table = get_table(table_id=job.table_id, options=[joinedload(AnonTable.database)])
 
-    # Get the primary key of the table
-    primary_key = table.primary_key
+    # Get the primary key columns of the table
+    primary_keys = table.primary_keys
 
     try:
         # Create a source engine based on the cloud URL of the table's database
-        src_engine = create_engine(url=table.database.cloud_url)
+        src_engine = get_engine(url=table.database.cloud_url)
     except exc.OperationalError:
         raise DefaultException("cloud_database_not_exists", code=409)
 
     # Check if the source engine has the table
-    if not inspect(src_engine).has_table(table.name):
+    src_schema = table_schema(src_engine, table.name)
+    if src_schema is None:
         raise DefaultException("table_not_anonymized", code=409)
 
-    # Create metadata and table objects for the source table
-    src_metadata = MetaData()
-    src_table = Table(
-        table.name,
-        src_metadata,
-        autoload_with=src_engine,
-    )
-
-    # Create a session for the source engine
-    src_session = Session(bind=src_engine)
-
-    # Create a dictionary mapping column indices to column names for the source table
-    column_names = {
-        index: column_name for index, column_name in enumerate(src_table.columns.keys())
-    }
-
     try:
         # Create a destination engine based on the URL of the table's database
-        dest_engine = create_engine(url=table.database.url)
+        dest_engine = get_engine(url=table.database.url)
     except exc.OperationalError:
         raise DefaultException("database_not_exists", code=409)
 
     # Check if the destination engine has the table
-    if not inspect(dest_engine).has_table(table.name):
+    dest_schema = table_schema(dest_engine, table.name)
+    if dest_schema is None:
         raise DefaultException("table_not_exists", code=409)
 
-    # Create metadata and table objects for the destination table
-    dest_metadata = MetaData()
-    dest_table = Table(table.name, dest_metadata, autoload_with=src_engine)
+    # Drop what a failed swap left behind, its trigger would capture the restore
+    if dest_engine.dialect.name == "postgresql":
+        with dest_engine.begin() as dest_connection:
+            drop_shadow(connection=dest_connection, table=sql_table(table.name))
 
-    # Create a session for the destination engine
-    dest_session = Session(bind=dest_engine)
+    # Only the primary key and the backed up columns the table still has are written
+    dest_names = [column["name"] for column in dest_schema["columns"]]
+    column_names = primary_keys + [
+        column["name"]
+        for column in src_schema["columns"]
+        if column["name"] in dest_names and not column["name"] in primary_keys
+    ]
 
-    try:
-        # Retrieve the results from the source table in batches
-        results = src_session.execute(
-            src_table.select().order_by(src_table.columns[table.primary_key])
+    # Create table objects for the source and destination tables with just those columns
+    src_table = schema_table(src_engine, table.name, include_columns=column_names)
+    dest_table = schema_table(dest_engine, table.name, include_columns=column_names)
+
+    # Estimate the rows to restore for the progress of the job
+    with src_engine.connect() as src_connection:
+        job.rows_total = estimate_rows(connection=src_connection, table=src_table)
+    db.session.commit()
+
+    # Restore with a single joined UPDATE on the server when the backup shares it
+    rows_processed = None
+    if same_server(src_url=table.database.cloud_url, dest_url=table.database.url):
+        with dest_engine.begin() as dest_connection:
+            rows_processed = update_rows_on_server(
+                src_url=table.database.cloud_url,
+                src_table=src_table,
+                dest_connection=dest_connection,
+                dest_table=dest_table,
+                key_columns=primary_keys,
+            )
+
+    # Otherwise stream the backup through joined updates batch by batch
+    if rows_processed is None:
+        rows_processed = _restore_rows(
+            job=job,
+            src_engine=src_engine,
+            src_table=src_table,
+            dest_engine=dest_engine,
+            dest_table=dest_table,
+            primary_keys=primary_keys,
         )
+    else:
+        add_job_rows(engine=db.engine, job_id=job.id, rows=rows_processed)
 
-        # Fetch the rows in batches of a specified size
-        batch_size = 100000
-        rows = results.fetchmany(batch_size)
+    # Drop the source table only once the original values are back
+    src_table.drop(bind=src_engine, checkfirst=True)
 
-        while rows:
-            rows_to_update = []
-            for row in rows:
-                values = {}
+    table.anonymized = False
+    table.watermark = None
+    for column in table.columns:
+        column.applied_anonymization = None
+    db.session.commit()
 
-                # Iterate over the columns of the row and construct a dictionary of values
-                for i, value in enumerate(row):
-                    if i == 0:
-                        values["_" + column_names[i]] = value
-                    else:
-                        values[column_names[i]] = value
-                rows_to_update.append(values)
+    return {"rows_processed": rows_processed, "cache": {}}
 
-            # Update the corresponding rows in the destination table using the constructed values
-            dest_session.execute(
-                dest_table.update().where(text(f"{primary_key} = :_{primary_key}")),
-                rows_to_update,
-            )
 
-            rows = results.fetchmany(batch_size)
+def _restore_rows(
+    job: Job,
+    src_engine: Engine,
+    src_table: Table,
+    dest_engine: Engine,
+    dest_table: Table,
+    primary_keys: list[str],
+) -> int:
+    value_columns = [
+        name for name in src_table.columns.keys() if not name in primary_keys
+    ]
 
-        dest_session.commit()
+    # Read the backup in primary key order with short keyset queries, the key first
+    reader = KeysetReader(
+        engine=src_engine,
+        table=src_table,
+        primary_key=primary_keys,
+        batch_size=Config.ANONYMIZATION_BATCH_SIZE,
+        columns=primary_keys + value_columns,
+    )
 
-    except Exception as e:
-        dest_session.rollback()
+    # Open the connection the batches are written through
+    dest_connection = dest_engine.connect()
+    updater = BulkUpdater(
+        connection=dest_connection,
+        table=dest_table,
+        key_columns=primary_keys,
+        value_columns=value_columns,
+    )
+    rows_processed = uncommitted_batches = uncommitted_rows = 0
 
-        # Print any exceptions that occur during the process
-        print(e)
-    finally:
-        # Close the source and destination sessions
-        src_session.close()
-        dest_session.close()
+    try:
+        for rows in reader:
+            # Update the corresponding rows in the destination table using the backed up values
+            updater.update(rows=rows)
 
-        # Drop the source table from the source engine
-        src_table.drop(bind=src_engine, checkfirst=True)
+            rows_processed += len(rows)
+            uncommitted_batches += 1
+            uncommitted_rows += len(rows)
 
-        # Dispose the source and destination engines
-        src_engine.dispose()
-        dest_engine.dispose()
+            # Commit every few batches, writing the original values again is harmless
+            if uncommitted_batches == Config.ANONYMIZATION_COMMIT_BATCHES:
+                dest_connection.commit()
+                add_job_rows(engine=db.engine, job_id=job.id, rows=uncommitted_rows)
+                uncommitted_batches = uncommitted_rows = 0
+
+        updater.close()
+        dest_connection.commit()
+        add_job_rows(engine=db.engine, job_id=job.id, rows=uncommitted_rows)
+
+    except Exception:
+        dest_connection.rollback()
+        raise
+
+    finally:
+        # Close the destination connection
+        dest_connection.close()
+
+    return rows_processed
 
-    table.anonymized = False
-    db.session.commit()
 
+from app.main.service.database_service import get_database
+from app.main.service.job_service import (
+    add_job_rows,
+    get_job_by_id,
+    register_job_target,
+    resume_job,
+    save_checkpoint,
+    save_new_job,
+    save_new_job_group,
+)
+from app.main.service.plan_service import plan_anonymization, pushdown_columns
+from app.main.service.table_service import clone_columns, clone_table, get_table
+from app.main.service.user.user_service import verify_user
 
-from app.main.service.table_service import clone_table, get_table
+register_job_target(type="anonymization", target=anonymize_table)
+register_job_target(type="restore", target=restore_table)
@@ -67,7 +67,10 @@ def save_new_column(current_user: User, table_id: int, data: dict[str, str]) ->
     _validate_column_unique_constraint(table_id=table_id, name=name)
 
     new_column = Column(
-        table=table, name=name, anonymization_type=data.get("anonymization_type")
+        table=table,
+        name=name,
+        anonymization_type=data.get("anonymization_type"),
+        consistent=data.get("consistent", False),
     )
 
     db.session.add(new_column)
@@ -92,6 +95,7 @@ def update_column(current_user: User, column_id: int, data: dict[str, any]) -> N
 
     column.name = new_name
     column.anonymization_type = data.get("anonymization_type")
+    column.consistent = data.get("consistent", False)
 
     db.session.commit()
 
@@ -8,6 +8,7 @@ from app.main import db
 from app.main.config import Config
 from app.main.exceptions import DefaultException
 from app.main.model import Database, User
+from app.main.remote import dispose_engines, invalidate_schema
 
 _CONTENT_PER_PAGE = Config.DEFAULT_CONTENT_PER_PAGE
 
@@ -111,6 +112,9 @@ def update_database(current_user: User, database_id: int, data: dict[str, any])
         filters=[Database.id != database_id],
     )
 
+    # The pooled connections were opened with the old credentials, maybe to another server
+    urls = [database.url, database.cloud_url]
+
     database.type = new_type
     database.username = new_username
     database.password = data.get("password")
@@ -120,15 +124,25 @@ def update_database(current_user: User, database_id: int, data: dict[str, any])
 
     db.session.commit()
 
+    for url in urls:
+        dispose_engines(url=url)
+        invalidate_schema(url=url)
+
 
 def delete_database(current_user: User, database_id: int) -> None:
     database = get_database(database_id=database_id)
 
     verify_user(current_user=current_user, user_id=database.user_id)
 
+    urls = [database.url, database.cloud_url]
+
     db.session.delete(database)
     db.session.commit()
 
+    for url in urls:
+        dispose_engines(url=url)
+        invalidate_schema(url=url)
+
 
 def get_database(database_id: int, options: list = None) -> Database:
     query = Database.query
@@ -0,0 +1,528 @@
+import logging
+import os
+import socket
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from math import log10
+
+from flask import current_app
+from sqlalchemy import Engine, update
+from sqlalchemy.orm import joinedload
+
+from app.main import db
+from app.main.config import Config
+from app.main.exceptions import DefaultException
+from app.main.model import Database, Job, JobGroup, JobRange, Table, User
+from app.main.remote import server_key
+
+logger = logging.getLogger(__name__)
+
+# The API processes run the jobs, or they leave them to a local worker, see run_job_worker
+JOB_SCHEDULERS = ["in_process", "worker"]
+
+# Local pool running the jobs outside of the request threads
+_executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix="job")
+
+# Function running each type of job, see register_job_target
+_targets = {}
+
+# Ids of the jobs this process handed to its pool, guarded by the dispatch lock
+_active = set()
+_dispatch_lock = threading.Lock()
+
+# Identifies this process as the owner of the jobs it runs
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def register_job_target(type: str, target) -> None:
+    """Run the jobs of type with target(job=job), in whichever process takes them.
+
+    target runs in a worker thread with its own application context and
+    returns the report stored on the job; an exception fails the job with
+    its message. Everything target needs is read from the job, so a job
+    queued by one process can run in another.
+    """
+    _targets[type] = target
+
+
+def get_job(job_id: int, options: list = None) -> Job:
+    query = Job.query
+
+    if options is not None:
+        query = query.options(*options)
+
+    job = query.filter(Job.id == job_id).one_or_none()
+
+    if job is None:
+        raise DefaultException("job_not_found", code=404)
+
+    return job
+
+
+def get_job_by_id(current_user: User, job_id: int) -> Job:
+    job = get_job(job_id=job_id)
+
+    verify_user(current_user=current_user, user_id=job.table.database.user_id)
+
+    return job
+
+
+def get_job_group(current_user: User, group_id: int) -> JobGroup:
+    group = (
+        JobGroup.query.options(joinedload(JobGroup.jobs))
+        .filter(JobGroup.id == group_id)
+        .one_or_none()
+    )
+
+    if group is None:
+        raise DefaultException("job_group_not_found", code=404)
+
+    verify_user(current_user=current_user, user_id=group.database.user_id)
+
+    return group
+
+
+def get_job_queue(current_user: User) -> dict:
+    """Queued and running jobs, overall, by user and by database server, with their waits.
+
+    Administrators see every job, other users only the jobs of their databases.
+    """
+    now = datetime.utcnow()
+
+    queued = []
+    running = []
+    for job in _unfinished_jobs():
+        if not current_user.is_admin and _job_user(job=job) != current_user.id:
+            continue
+        if job.owner is None:
+            queued.append(job)
+        elif not _is_orphan(job=job):
+            running.append(job)
+
+    def waits(jobs: list[Job]) -> dict:
+        seconds = [(now - job.queued_at).total_seconds() for job in jobs]
+        return {
+            "oldest_wait_seconds": max(seconds, default=None),
+            "average_wait_seconds": sum(seconds) / len(seconds) if seconds else None,
+        }
+
+    # How long the latest jobs waited before they started
+    query = Job.query.filter(Job.started_at.isnot(None))
+    if not current_user.is_admin:
+        query = query.filter(
+            Job.table.has(Table.database.has(Database.user_id == current_user.id))
+        )
+    started = query.order_by(Job.started_at.desc()).limit(Config.JOB_WAIT_SAMPLE).all()
+    started_waits = [
+        max((job.started_at - job.queued_at).total_seconds(), 0.0) for job in started
+    ]
+
+    def breakdown(keys, name: str) -> list[dict]:
+        # keys gives the connections of a job by each user or server it counts for
+        return [
+            {
+                name: value,
+                "queued": len([job for job in queued if value in keys(job)]),
+                "running": len([job for job in running if value in keys(job)]),
+                "connections": sum(keys(job)[value] for job in running),
+                **waits([job for job in queued if value in keys(job)]),
+            }
+            for value in sorted(
+                {value for job in queued + running for value in keys(job)}
+            )
+        ]
+
+    return {
+        "queued": len(queued),
+        "running": len(running),
+        **waits(queued),
+        "started_wait_seconds": (
+            sum(started_waits) / len(started_waits) if started_waits else None
+        ),
+        "users": breakdown(
+            keys=lambda job: Counter(
+                {_job_user(job=job): _job_connections(job=job).total()}
+            ),
+            name="user_id",
+        ),
+        "servers": breakdown(keys=lambda job: _job_connections(job=job), name="server"),
+    }
+
+
+def save_new_job(table_id: int, type: str, **kwargs) -> Job:
+    """Queue a job of type for its registered target, kwargs set its columns.
+
+    The job starts once the scheduler takes it, see _dispatch.
+    """
+    new_job = _new_job(table_id=table_id, type=type, kwargs=kwargs)
+
+    db.session.add(new_job)
+    db.session.commit()
+
+    _schedule()
+
+    return new_job
+
+
+def save_new_job_group(
+    database_id: int, type: str, jobs: list[dict], skipped: list[dict] = None
+) -> JobGroup:
+    """Queue a job per item of jobs, with the table_id and kwargs of save_new_job.
+
+    The jobs of the group start in the given order.
+    """
+    new_group = JobGroup(database_id=database_id, type=type, skipped=skipped)
+    new_group.jobs = [
+        _new_job(table_id=job["table_id"], type=type, kwargs=job["kwargs"])
+        for job in jobs
+    ]
+
+    db.session.add(new_group)
+    db.session.commit()
+
+    _schedule()
+
+    return new_group
+
+
+def _new_job(table_id: int, type: str, kwargs: dict) -> Job:
+    if Job.query.filter(
+        Job.table_id == table_id, Job.state.in_(["queued", "running"])
+    ).first():
+        raise DefaultException("job_in_progress", code=409)
+
+    return Job(
+        table_id=table_id,
+        type=type,
+        workers=kwargs.get("workers"),
+        mode=kwargs.get("mode", "in_place"),
+        incremental=kwargs.get("incremental", False),
+        columns=kwargs.get("columns"),
+        plan=kwargs.get("plan"),
+        # The estimate of the planner, or the registered one, until the job counts its rows
+        rows_total=kwargs.get("rows_total") or (kwargs.get("plan") or {}).get("rows"),
+    )
+
+
+def resume_job(job_id: int) -> Job:
+    """Queue a failed or killed job again, its target continuing from its checkpoints."""
+    job = get_job(job_id=job_id)
+
+    if job.state != "failed" and not _is_orphan(job=job):
+        raise DefaultException("job_not_resumable", code=409)
+
+    job.state = "queued"
+    job.error = None
+    job.finished_at = None
+    job.owner = None
+    job.queued_at = datetime.utcnow()
+    db.session.commit()
+
+    _schedule()
+
+    return job
+
+
+def run_job_worker(poll_seconds: float = None, stop: threading.Event = None) -> None:
+    """Run the queued jobs in this process until stop is set.
+
+    The local worker of the worker scheduler, started with flask run_jobs
+    inside an application context. It looks at the queue every poll_seconds
+    besides whenever one of its jobs finishes. Several workers, and API
+    processes of the in_process scheduler, can share the metadata database.
+    """
+    stop = stop or threading.Event()
+
+    while not stop.is_set():
+        try:
+            _dispatch()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Jobs not dispatched")
+
+        stop.wait(poll_seconds or Config.JOB_POLL_SECONDS)
+
+
+def start_job_scheduler(app, stop: threading.Event = None) -> threading.Thread:
+    """Dispatch the queue of the in_process scheduler from a thread of this process.
+
+    Jobs are otherwise only dispatched when one is queued, resumed or
+    finishes, so after a restart the queued ones, and the ones claimed by a
+    process since killed, would wait for the next request. The thread looks
+    at the queue at once and then every JOB_POLL_SECONDS until stop is set.
+    Returns None with the worker scheduler, whose workers poll themselves.
+    """
+    if Config.JOB_SCHEDULER != "in_process":
+        return None
+
+    def poll():
+        with app.app_context():
+            run_job_worker(stop=stop)
+
+    thread = threading.Thread(target=poll, daemon=True, name="job-scheduler")
+    thread.start()
+
+    return thread
+
+
+def _is_orphan(job: Job) -> bool:
+    # A job handed to a process, on this host, that is gone was killed
+    if job.state not in ["queued", "running"] or job.owner is None:
+        return False
+
+    host, pid = job.owner.rsplit(":", 1)
+    if host != socket.gethostname():
+        return False
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+
+    return False
+
+
+def _schedule() -> None:
+    # A worker process takes the jobs otherwise, see run_job_worker
+    if Config.JOB_SCHEDULER == "in_process":
+        _dispatch()
+
+
+def _dispatch() -> None:
+    """Hand queued jobs to the pool of this process while a thread is free.
+
+    The queue is the queued jobs of the metadata database, so a job queued
+    by any process is taken by whichever process has a thread first; a
+    conditional update makes sure only one does. The next job is chosen by:
+
+    - fair share: the user whose running jobs hold the fewest connections,
+      the one waiting the longest on a tie, goes first, so a user with a
+      huge table does not hold back the others;
+    - size: among the jobs of that user the smallest one by estimated rows,
+      every JOB_AGING_SECONDS waited counting as a table ten times smaller
+      so large ones still start. The jobs of a group keep their order,
+      largest first, and the group competes with its next job;
+    - servers: the connections of a job, see _job_connections, must fit in
+      the JOB_SERVER_CONNECTIONS of every database server it touches, its
+      own and the one of its backup, beside the jobs running there from any
+      process; a job taking more runs alone on such a server. A job that
+      does not fit lets the next one go first.
+    """
+    with _dispatch_lock:
+        free = Config.JOB_WORKERS - len(_active)
+        if free <= 0:
+            return
+
+        now = datetime.utcnow()
+
+        # Connections held on each server and by each user, and the queues of each user
+        load = Counter()
+        shares = Counter()
+        queues = defaultdict(dict)
+        for job in _unfinished_jobs():
+            # Claimed by a process killed before it started the job
+            if job.owner is not None and job.state == "queued" and _is_orphan(job=job):
+                db.session.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.owner == job.owner)
+                    .values(owner=None)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                job.owner = None
+
+            if job.owner is None:
+                key = ("group", job.group_id) if job.group_id else ("job", job.id)
+                queues[_job_user(job=job)].setdefault(key, []).append(job)
+            elif not _is_orphan(job=job):
+                connections = _job_connections(job=job)
+                load.update(connections)
+                shares[_job_user(job=job)] += connections.total()
+
+        started = []
+        while len(started) < free:
+            job = _next_job(queues=queues, load=load, shares=shares, now=now)
+            if job is None:
+                break
+
+            # Another process may have taken it meanwhile
+            claimed = db.session.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.state == "queued", Job.owner.is_(None))
+                .values(owner=_OWNER)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                continue
+
+            connections = _job_connections(job=job)
+            load.update(connections)
+            shares[_job_user(job=job)] += connections.total()
+            _active.add(job.id)
+            started.append(job.id)
+
+    for job_id in started:
+        _executor.submit(_run_job, current_app._get_current_object(), job_id)
+
+
+def _next_job(queues: dict, load: Counter, shares: Counter, now: datetime) -> Job:
+    def oldest(user) -> datetime:
+        return min(queue[0].queued_at for queue in queues[user].values())
+
+    for user in sorted(queues, key=lambda user: (shares[user], oldest(user))):
+        for key, queue in sorted(
+            queues[user].items(), key=lambda item: _job_priority(item[1][0], now)
+        ):
+            job = queue[0]
+
+            # Every server the job touches must have room for its connections there
+            connections = _job_connections(job=job)
+            if any(
+                load[server] and load[server] + count > Config.JOB_SERVER_CONNECTIONS
+                for server, count in connections.items()
+            ):
+                continue
+
+            queue.pop(0)
+            if not queue:
+                del queues[user][key]
+            if not queues[user]:
+                del queues[user]
+            return job
+
+    return None
+
+
+def _unfinished_jobs() -> list[Job]:
+    return (
+        Job.query.options(joinedload(Job.table).joinedload(Table.database))
+        .filter(Job.state.in_(["queued", "running"]))
+        .order_by(Job.id)
+        .all()
+    )
+
+
+def _job_priority(job: Job, now: datetime) -> float:
+    # Lower first, the order of magnitude of the rows less the waiting
+    rows = job.rows_total if job.rows_total is not None else job.table.row_estimate
+    waited = (now - job.queued_at).total_seconds()
+    return log10(1 + (rows or 0)) - waited / Config.JOB_AGING_SECONDS
+
+
+def _job_user(job: Job) -> int:
+    return job.table.database.user_id
+
+
+def _job_connections(job: Job) -> Counter:
+    """Connections job holds at once on each database server it touches.
+
+    Every worker process of an anonymization writes the table through one
+    connection while it reads it through another, and reads and writes the
+    backup on the cloud server through two more; a swap copies the backup
+    before the ranges and only reads it at the end. A restore reads the
+    backup through one connection and writes the table through another.
+    When the backup shares the server of the table, both count there.
+    """
+    database = job.table.database
+    connections = Counter()
+
+    if job.type == "restore":
+        connections[server_key(database.url)] += 1
+        connections[server_key(database.cloud_url)] += 1
+        return connections
+
+    workers = max(
+        1,
+        min(
+            (job.plan or {}).get("workers")
+            or job.workers
+            or Config.ANONYMIZATION_WORKERS,
+            Config.ANONYMIZATION_MAX_WORKERS,
+        ),
+    )
+    connections[server_key(database.url)] += 2 * workers
+    connections[server_key(database.cloud_url)] += (
+        2 if job.mode == "swap" else 2 * workers
+    )
+    return connections
+
+
+def _run_job(app, job_id: int) -> None:
+    with app.app_context():
+        try:
+            _execute_job(job_id=job_id)
+        finally:
+            with _dispatch_lock:
+                _active.discard(job_id)
+
+            # The thread and connections of the job are free for the next one
+            _dispatch()
+
+
+def _execute_job(job_id: int) -> None:
+    job = get_job(job_id=job_id)
+    job.state = "running"
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        report = _targets[job.type](job=job)
+
+    except Exception as e:
+        db.session.rollback()
+
+        logger.exception("Job %s failed", job_id)
+
+        job = get_job(job_id=job_id)
+        job.state = "failed"
+        job.error = getattr(e, "description", None) or str(e)
+
+    else:
+        job = get_job(job_id=job_id)
+        job.state = "succeeded"
+        job.report = report
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def add_job_rows(engine: Engine, job_id: int, rows: int) -> None:
+    # A plain statement on the metadata database, so worker processes can report too
+    with engine.begin() as connection:
+        connection.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(rows_processed=Job.rows_processed + rows)
+        )
+
+
+def save_checkpoint(
+    engine: Engine,
+    job_id: int,
+    range_id: int,
+    last_key: tuple,
+    rows: int,
+    done: bool = False,
+) -> None:
+    """Persist the committed watermark of a job range with the rows it added."""
+    with engine.begin() as connection:
+        values = {"done": done}
+        if last_key is not None:
+            values["last_key"] = list(last_key)
+
+        connection.execute(
+            update(JobRange).where(JobRange.id == range_id).values(values)
+        )
+        connection.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(rows_processed=Job.rows_processed + rows)
+        )
+
+
+from app.main.service.user.user_service import verify_user
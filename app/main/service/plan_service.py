@@ -0,0 +1,418 @@
+from math import ceil
+
+from sqlalchemy import exc, make_url
+from sqlalchemy import table as sql_table
+
+from app.main.anonymization import get_pools, pushdown_supported
+from app.main.config import Config
+from app.main.exceptions import DefaultException
+from app.main.model import Table
+from app.main.remote import (
+    count_rows,
+    distinct_values,
+    estimate_rows,
+    get_engine,
+    same_server,
+    swap_blockers,
+    table_bytes,
+    table_schema,
+)
+
+# Relative cost of each operation of a job, in reads of a row through the app
+COSTS = {
+    # Reading a row through the app and writing it back with a staged joined update
+    "read": 1.0,
+    "update": 3.0,
+    # Appending a row to another table, by load strategy, or without leaving the server
+    "insert": 2.0,
+    "copy": 0.5,
+    "load_data": 0.5,
+    "server_copy": 0.2,
+    # Computing a cell in an UPDATE on the server, and writing its row
+    "pushdown": 0.2,
+    "server_update": 1.0,
+    # Hashing a cell in Python and generating its value by arithmetic, pool or Faker
+    "digest": 0.2,
+    "compute": 0.3,
+    "pool": 0.3,
+    "faker": 5.0,
+    # Looking a consistent cell up in the value cache
+    "cache_lookup": 0.1,
+    # Building one index over a row of a shadow table
+    "index": 0.3,
+    # Starting a worker process
+    "worker": 20000.0,
+}
+
+# Types generated from the digest words alone, the others by pool or Faker
+_COMPUTED_TYPES = ["date_time", "date", "time", "ipv4", "ipv6"]
+
+
+def plan_anonymization(
+    table: Table,
+    workers: int = None,
+    incremental: bool = False,
+    mode: str = "in_place",
+    columns: list = None,
+    count: bool = True,
+) -> dict:
+    """Choose how to anonymize table from the statistics of its database.
+
+    Every way to run the job that fits the request, the mode, whether the
+    database computes the columns it can with an UPDATE and how the backup
+    is written, is costed with COSTS and the cheapest one is returned with
+    the cost of each step, column and alternative. An auto mode picks swap
+    or in_place, any other mode is kept.
+
+    Without count, as inside requests, no rows are counted: the rows come
+    from the server statistics or the registered estimate, None when
+    neither knows them, and the job plans again when it starts.
+    """
+    statistics = _read_statistics(table=table, incremental=incremental, count=count)
+
+    backend_name = make_url(table.database.url).get_backend_name()
+
+    plan = choose_plan(
+        backend_name=backend_name,
+        columns=[
+            {
+                "name": column.name,
+                "type": column.anonymization_type,
+                "consistent": bool(column.consistent),
+                # Columns anonymized before hold fake values in the table
+                "anonymized": column.applied_anonymization is not None,
+            }
+            for column in table.columns
+            if columns is None or column.name in columns
+        ],
+        statistics=statistics,
+        workers=workers,
+        incremental=incremental,
+        mode=mode,
+        delta=columns is not None,
+        server_copy=backend_name in ["mysql", "postgresql"]
+        and same_server(src_url=table.database.url, dest_url=table.database.cloud_url),
+        load_strategy=_load_strategy(
+            src_url=table.database.url, dest_url=table.database.cloud_url
+        ),
+    )
+
+    # A swap asked for would lose what the table has besides its rows
+    if plan["mode"] == "swap" and statistics["swap_blockers"]:
+        raise DefaultException("swap_not_supported", code=409)
+
+    return plan
+
+
+def choose_plan(
+    backend_name: str,
+    columns: list[dict],
+    statistics: dict,
+    workers: int = None,
+    incremental: bool = False,
+    mode: str = "in_place",
+    delta: bool = False,
+    server_copy: bool = False,
+    load_strategy: str = "insert",
+) -> dict:
+    # Unknown rows are costed as none, the job plans again once it can count them
+    rows = statistics["rows"] or 0
+
+    # Processes pay off only once each one has enough rows
+    if not workers:
+        workers = max(
+            Config.ANONYMIZATION_WORKERS,
+            ceil(rows / Config.ANONYMIZATION_ROWS_PER_WORKER),
+        )
+    workers = max(1, min(workers, Config.ANONYMIZATION_MAX_WORKERS))
+
+    # A swap rebuilds a whole PostgreSQL table with nothing it would lose, see swap_blockers
+    modes = [mode] if mode != "auto" else ["in_place"]
+    if (
+        mode == "auto"
+        and backend_name == "postgresql"
+        and not incremental
+        and not delta
+        and not statistics["swap_blockers"]
+    ):
+        modes.append("swap")
+
+    # The UPDATE reads the table, so only original values still there are pushed
+    # down, and consistent columns stay with the keyed digests later runs compute
+    eligible = [
+        column["name"]
+        for column in columns
+        if Config.ANONYMIZATION_PUSHDOWN
+        and not column["consistent"]
+        and not (delta and column["anonymized"])
+        and pushdown_supported(backend_name, column["type"])
+    ]
+
+    candidates = []
+    for candidate_mode in modes:
+        pushdowns = [[]]
+        if eligible and candidate_mode == "in_place" and not incremental:
+            pushdowns.append(eligible)
+
+        for pushdown in pushdowns:
+            for backup in _backup_strategies(
+                mode=candidate_mode,
+                incremental=incremental,
+                delta=delta,
+                pushdown=bool(pushdown),
+                server_copy=server_copy,
+            ):
+                candidates.append(
+                    _cost_plan(
+                        columns=columns,
+                        statistics=statistics,
+                        workers=workers,
+                        mode=candidate_mode,
+                        pushdown=pushdown,
+                        backup=backup,
+                        load_strategy=load_strategy,
+                    )
+                )
+
+    candidates.sort(key=lambda candidate: candidate["cost"])
+    plan = candidates[0]
+
+    return {
+        **plan,
+        "rows": statistics["rows"],
+        "table_bytes": statistics["table_bytes"],
+        "indexes": statistics["indexes"],
+        "swap_blockers": statistics["swap_blockers"],
+        "alternatives": [
+            {
+                "mode": candidate["mode"],
+                "backup": candidate["backup"],
+                "pushdown": any(
+                    column["strategy"] == "pushdown" for column in candidate["columns"]
+                ),
+                "cost": candidate["cost"],
+            }
+            for candidate in candidates
+        ],
+    }
+
+
+def pushdown_columns(plan: dict) -> list[str]:
+    return [
+        column["name"] for column in plan["columns"] if column["strategy"] == "pushdown"
+    ]
+
+
+def _backup_strategies(
+    mode: str,
+    incremental: bool,
+    delta: bool,
+    pushdown: bool,
+    server_copy: bool,
+) -> list[str]:
+    # New rows and new columns go into the existing backup as they are read
+    if incremental:
+        return ["batched"]
+    if delta:
+        return ["columns_copy"]
+
+    # Otherwise a server copying the rows alone beats any loader
+    if server_copy:
+        return ["server_copy"]
+    if mode == "swap" or pushdown:
+        return ["bulk_copy"]
+    return ["batched", "bulk_copy"]
+
+
+def _cost_plan(
+    columns: list[dict],
+    statistics: dict,
+    workers: int,
+    mode: str,
+    pushdown: list[str],
+    backup: str,
+    load_strategy: str,
+) -> dict:
+    rows = statistics["rows"] or 0
+    pooled = statistics["pooled"]
+
+    planned = []
+    for column in columns:
+        distinct = statistics["distinct"].get(column["name"])
+        if column["name"] in pushdown:
+            strategy = "pushdown"
+            cost = rows * COSTS["pushdown"]
+        else:
+            if column["type"] in _COMPUTED_TYPES:
+                generate = COSTS["compute"]
+            elif column["type"] in pooled:
+                generate = COSTS["pool"]
+            else:
+                generate = COSTS["faker"]
+
+            if column["consistent"]:
+                # Every distinct value the cache can not hold is generated again
+                strategy = "python_cached"
+                misses = _cache_misses(
+                    rows=rows,
+                    distinct=distinct,
+                    cache_size=Config.ANONYMIZATION_CACHE_SIZE,
+                )
+                cost = (
+                    misses * (COSTS["digest"] + generate) + rows * COSTS["cache_lookup"]
+                )
+            else:
+                strategy = "python"
+                cost = rows * (COSTS["digest"] + generate)
+
+        planned.append(
+            {
+                "name": column["name"],
+                "type": column["type"],
+                "consistent": column["consistent"],
+                "strategy": strategy,
+                "distinct": distinct,
+                "cost": cost,
+            }
+        )
+
+    steps = []
+
+    # The backup, before or along the ranges
+    if backup == "server_copy":
+        backup_cost = rows * COSTS["server_copy"]
+    elif backup == "bulk_copy":
+        backup_cost = rows * (COSTS["read"] + COSTS[load_strategy])
+    elif backup == "batched":
+        backup_cost = rows * COSTS["insert"]
+    else:
+        new_columns = [column for column in columns if not column["anonymized"]]
+        backup_cost = rows * (COSTS["read"] + COSTS["update"]) if new_columns else 0.0
+    steps.append(
+        {"step": "backup", "strategy": backup, "rows": rows, "cost": backup_cost}
+    )
+
+    if pushdown:
+        steps.append(
+            {
+                "step": "pushdown",
+                "strategy": "server_update",
+                "rows": rows,
+                "cost": rows * COSTS["server_update"]
+                + sum(
+                    column["cost"]
+                    for column in planned
+                    if column["strategy"] == "pushdown"
+                ),
+            }
+        )
+
+    # Every range reads its rows and writes them back, or into the shadow table
+    python_columns = [column for column in planned if column["strategy"] != "pushdown"]
+    if python_columns:
+        write = COSTS[load_strategy if mode == "swap" else "update"]
+        range_cost = rows * (COSTS["read"] + write) + sum(
+            column["cost"] for column in python_columns
+        )
+        steps.append(
+            {
+                "step": "ranges",
+                "strategy": "parallel" if workers > 1 else "serial",
+                "rows": rows,
+                "cost": range_cost / workers
+                + (COSTS["worker"] * workers if workers > 1 else 0.0),
+            }
+        )
+
+    if mode == "swap":
+        steps.append(
+            {
+                "step": "swap",
+                "strategy": "index_build",
+                "rows": rows,
+                "cost": rows * COSTS["index"] * statistics["indexes"],
+            }
+        )
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "backup": backup,
+        "columns": planned,
+        "steps": steps,
+        "cost": sum(step["cost"] for step in steps),
+    }
+
+
+def _cache_misses(rows: int, distinct: int, cache_size: int) -> float:
+    # Without statistics every value is taken as distinct
+    if distinct is None or distinct >= rows:
+        return rows
+    if distinct <= cache_size:
+        return distinct
+
+    # Values evicted before they come again are missed, in proportion
+    return distinct + (rows - distinct) * (1 - cache_size / distinct)
+
+
+def _load_strategy(src_url: str, dest_url: str) -> str:
+    # The bulk loader copy_rows would pick, without connecting
+    src_url = make_url(src_url)
+    dest_url = make_url(dest_url)
+
+    if (
+        src_url.get_backend_name() == dest_url.get_backend_name() == "postgresql"
+        and src_url.get_driver_name() == dest_url.get_driver_name() == "psycopg2"
+    ):
+        return "copy"
+    if (
+        dest_url.get_backend_name() == "mysql"
+        and dest_url.get_driver_name() == "mysqldb"
+    ):
+        return "load_data"
+    return "insert"
+
+
+def _read_statistics(table: Table, incremental: bool, count: bool) -> dict:
+    try:
+        connection = get_engine(url=table.database.url).connect()
+    except exc.SQLAlchemyError:
+        raise DefaultException("database_not_exists", code=409)
+
+    try:
+        schema = table_schema(connection, table.name)
+        if schema is None:
+            raise DefaultException("table_not_exists", code=409)
+
+        tableObj = sql_table(table.name)
+        rows = estimate_rows(connection=connection, table=tableObj, count=count)
+        if rows is None:
+            rows = table.row_estimate
+
+        # An incremental job only reads the rows after the watermark, at most the new ones
+        if count and incremental and table.watermark is not None:
+            rows = count_rows(
+                connection=connection,
+                table_name=table.name,
+                primary_keys=schema["primary_keys"],
+                after=tuple(table.watermark),
+            )
+
+        pools = get_pools(path=Config.ANONYMIZATION_POOL_PATH)
+        return {
+            "rows": rows,
+            "table_bytes": table_bytes(connection=connection, table=tableObj),
+            "distinct": distinct_values(
+                connection=connection, table=tableObj, rows=rows or 0
+            ),
+            # The primary key and every other index
+            "indexes": 1 + len(schema["indexes"]),
+            "swap_blockers": (
+                swap_blockers(connection=connection, table=tableObj)
+                if connection.dialect.name == "postgresql"
+                else []
+            ),
+            "pooled": list(pools.pools) if pools is not None else [],
+        }
+    finally:
+        connection.close()
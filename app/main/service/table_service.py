@@ -1,9 +1,12 @@
+import logging
+from datetime import datetime
 from math import ceil
 
 from sqlalchemy import MetaData
 from sqlalchemy import Table as saTable
-from sqlalchemy import and_, create_engine, inspect
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, exc
+from sqlalchemy import table as sql_table
+from sqlalchemy.orm import joinedload
 from sqlalchemy_utils import create_database, database_exists
 from werkzeug.datastructures import ImmutableMultiDict
 
@@ -11,6 +14,22 @@ from app.main import db
 from app.main.config import Config
 from app.main.exceptions import DefaultException
 from app.main.model import Database, Table, User
+from app.main.remote import (
+    BulkUpdater,
+    KeysetReader,
+    add_columns,
+    copy_rows,
+    copy_rows_on_server,
+    estimate_rows,
+    get_engine,
+    invalidate_schema,
+    loader_connect_args,
+    same_server,
+    schema_table,
+    table_schema,
+)
+
+logger = logging.getLogger(__name__)
 
 _CONTENT_PER_PAGE = Config.DEFAULT_CONTENT_PER_PAGE
 
@@ -63,6 +82,9 @@ def save_new_table(current_user: User, database_id: int, data: dict[str, str]) -
 
     new_table = Table(database=database, name=name)
 
+    # Keep the primary key, column types and size of the remote table when it is reachable
+    _try_introspect_table(table=new_table)
+
     db.session.add(new_table)
     db.session.commit()
 
@@ -80,7 +102,28 @@ def update_table(current_user: User, table_id: int, data: dict[str, any]) -> Non
         filters=[Table.id != table_id],
     )
 
-    table.name = new_name
+    if table.name != new_name:
+        table.name = new_name
+
+        # What was kept described the table of the old name
+        table.primary_key_columns = None
+        table.column_types = None
+        table.row_estimate = None
+        table.schema_refreshed_at = None
+        _try_introspect_table(table=table)
+
+    db.session.commit()
+
+
+def refresh_table_schema(current_user: User, table_id: int) -> None:
+    table = get_table(table_id=table_id, options=[joinedload(Table.database)])
+
+    verify_user(current_user=current_user, user_id=table.database.user_id)
+
+    try:
+        introspect_table(table=table)
+    except exc.SQLAlchemyError:
+        raise DefaultException("database_not_exists", code=409)
 
     db.session.commit()
 
@@ -108,6 +151,35 @@ def get_table(table_id: int, options: list = None) -> Table:
     return table
 
 
+def introspect_table(table: Table) -> None:
+    """Keep the primary key, column types and estimated rows of the remote table."""
+    # Reflect it again even when the cached columns look the same
+    invalidate_schema(url=table.database.url, table_name=table.name)
+
+    with get_engine(url=table.database.url).connect() as connection:
+        schema = table_schema(connection, table.name)
+        if schema is None:
+            raise DefaultException("table_not_exists", code=409)
+
+        row_estimate = estimate_rows(connection=connection, table=sql_table(table.name))
+
+        table.primary_key_columns = schema["primary_keys"] or None
+        table.column_types = {
+            column["name"]: column["type"].compile(dialect=connection.dialect)
+            for column in schema["columns"]
+        }
+        table.row_estimate = row_estimate
+        table.schema_refreshed_at = datetime.utcnow()
+
+
+def _try_introspect_table(table: Table) -> None:
+    # Tables may be registered before they exist, or while their database is down
+    try:
+        introspect_table(table=table)
+    except Exception:
+        logger.warning("Schema of table %s not introspected", table.name, exc_info=True)
+
+
 def _validate_table_unique_constraint(
     database_id: str, name: str, filters: list = []
 ) -> None:
@@ -121,18 +193,26 @@ def _validate_table_unique_constraint(
         raise DefaultException("table_already_exist", code=409)
 
 
-def clone_table(table: Table, dest_columns: list = None):
-    # Create an engine and metadata for the source database
-    src_engine = create_engine(url=table.database.url)
+def clone_table(
+    table: Table, dest_columns: list = None, server_only: bool = False
+) -> bool:
+    """Create the cloud copy of the table and copy its rows into it.
+
+    With server_only the rows are copied only when the cloud database shares
+    the server of the source, and the copy is left empty otherwise, for the
+    caller to fill. Returns whether the rows were copied.
+    """
+    # Get the shared engine of the source database
+    src_engine = get_engine(url=table.database.url)
     if not database_exists(url=src_engine.url):
         raise DefaultException("database_not_exists", code=409)
 
-    if not inspect(src_engine).has_table(table.name):
+    if table_schema(src_engine, table.name) is None:
         raise DefaultException("table_not_exists", code=409)
 
     src_metadata = MetaData()
 
-    # Reflect the structure of the source table
+    # Reflect the structure of the source table, constraints included for the copy
     src_table = saTable(
         table.name,
         src_metadata,
@@ -144,62 +224,115 @@ def clone_table(table: Table, dest_columns: list = None):
         if not column.name in src_table.columns:
             raise DefaultException("column_not_exists", code=409)
 
-    # Create a session for the source database
-    src_session = Session(bind=src_engine)
-
-    # Create an engine and metadata for the destination database
-    dest_engine = create_engine(url=table.database.cloud_url)
+    # Get the shared engine of the destination database
+    dest_engine = get_engine(
+        url=table.database.cloud_url,
+        connect_args=loader_connect_args(url=table.database.cloud_url),
+    )
     if not database_exists(url=dest_engine.url):
         create_database(url=dest_engine.url)
 
-    dest_metadata = MetaData()
-
-    # Create a table object representing the destination table
-    dest_table = saTable(
-        table.name,
-        dest_metadata,
-        autoload_with=src_engine,
-        include_columns=dest_columns,
-    )
+    # Create a table object representing the destination table, a copy of the source one
+    dest_table = src_table.to_metadata(MetaData())
 
     dest_table.drop(bind=dest_engine, checkfirst=True)
     dest_table.create(bind=dest_engine, checkfirst=True)
 
-    # Create a session for the destination database
-    dest_session = Session(bind=dest_engine)
+    # Create a connection for the reads on the source database
+    src_connection = src_engine.connect()
 
     try:
-        # Select all rows from the source table
-        results = src_session.execute(src_table.select())
+        with dest_engine.begin() as dest_connection:
+            # Copy the rows on the server when the cloud database shares it
+            copied = same_server(
+                src_url=table.database.url, dest_url=table.database.cloud_url
+            ) and copy_rows_on_server(
+                src_url=table.database.url,
+                src_table=src_table,
+                dest_connection=dest_connection,
+                dest_table=dest_table,
+            )
+
+            # Otherwise copy them with the fastest bulk loader the databases support
+            if not copied and not server_only:
+                copy_rows(
+                    src_connection=src_connection,
+                    src_table=src_table,
+                    dest_connection=dest_connection,
+                    dest_table=dest_table,
+                    batch_size=Config.ANONYMIZATION_BATCH_SIZE,
+                )
+                copied = True
+
+    except Exception:
+        dest_table.drop(bind=dest_engine, checkfirst=True)
 
-        # Fetch the rows in batches of a specified size
-        batch_size = 100000
-        rows = results.fetchmany(batch_size)
+        logger.exception("Clone of table %s failed", table.id)
 
-        while rows:
-            rows_values = [tuple(row) for row in rows]
-            # Insert the rows into the destination table
-            dest_session.execute(dest_table.insert().values(rows_values))
+        raise DefaultException("table_not_cloned", code=500)
+    finally:
+        # Close the source connection
+        src_connection.close()
 
-            # Fetch the next batch of rows
-            rows = results.fetchmany(batch_size)
+    return copied
 
-        dest_session.commit()
 
-    except Exception as e:
-        dest_session.rollback()
-        dest_session.close()
-        dest_table.drop(bind=dest_engine, checkfirst=True)
+def clone_columns(table: Table, column_names: list[str]) -> None:
+    """Add columns to the cloud copy of the table and copy their values into it.
 
-        # Print any exceptions that occur during the process
-        print(e)
-    finally:
-        # Close the session
-        src_session.close()
-        dest_session.close()
-        # Dispose of the engines
-        src_engine.dispose()
-        dest_engine.dispose()
+    Only the rows already in the copy are filled. Copying again is harmless
+    while the values in the table are still the original ones.
+    """
+    primary_keys = table.primary_keys
+
+    # The primary key and the columns to copy of the source table
+    src_engine = get_engine(url=table.database.url)
+    src_table = schema_table(
+        src_engine, table.name, include_columns=primary_keys + column_names
+    )
+
+    for name in column_names:
+        if not name in src_table.columns:
+            raise DefaultException("column_not_exists", code=409)
+
+    dest_engine = get_engine(url=table.database.cloud_url)
+
+    # Add the columns the cloud copy does not have yet
+    dest_table = schema_table(dest_engine, table.name)
+    with dest_engine.begin() as dest_connection:
+        add_columns(
+            connection=dest_connection,
+            table=dest_table,
+            columns=[
+                src_table.columns[name]
+                for name in column_names
+                if not name in dest_table.columns
+            ],
+        )
+    dest_table = schema_table(dest_engine, table.name)
+
+    # Read the source in primary key order with short keyset queries
+    reader = KeysetReader(
+        engine=src_engine,
+        table=src_table,
+        primary_key=primary_keys,
+        batch_size=Config.ANONYMIZATION_BATCH_SIZE,
+        columns=primary_keys + column_names,
+    )
+
+    # Write the values of every batch over the matching rows of the copy
+    with dest_engine.connect() as dest_connection:
+        updater = BulkUpdater(
+            connection=dest_connection,
+            table=dest_table,
+            key_columns=primary_keys,
+            value_columns=column_names,
+        )
+        for rows in reader:
+            updater.update(rows=rows)
+            dest_connection.commit()
+        updater.close()
+        dest_connection.commit()
 
 
 from app.main.service.database_service import get_database
@@ -1,5 +1,221 @@
-from flask_restx import Namespace
+from flask_restx import Namespace, fields
 
 
 class AnonymizationDTO:
     api = Namespace("anonymization", description="anonymization related operations")
+
+    anonymization_report = api.model(
+        "anonymization_report",
+        {
+            "rows_processed": fields.Integer(description="anonymized rows"),
+            "cache": fields.Raw(
+                description="largest value cache of a worker process, hits, misses and hit rate of each consistent column"
+            ),
+        },
+    )
+
+    anonymization_plan_column = api.model(
+        "anonymization_plan_column",
+        {
+            "name": fields.String(description="column name"),
+            "type": fields.String(description="anonymization type"),
+            "consistent": fields.Boolean(description="consistent anonymization"),
+            "strategy": fields.String(
+                description="pushdown, python or python_cached for consistent columns"
+            ),
+            "distinct": fields.Integer(
+                description="estimated distinct values, null without statistics"
+            ),
+            "cost": fields.Float(description="estimated cost of its values"),
+        },
+    )
+
+    anonymization_plan_step = api.model(
+        "anonymization_plan_step",
+        {
+            "step": fields.String(description="backup, pushdown, ranges or swap"),
+            "strategy": fields.String(description="how the step runs"),
+            "rows": fields.Integer(description="estimated rows"),
+            "cost": fields.Float(description="estimated cost"),
+        },
+    )
+
+    anonymization_plan_alternative = api.model(
+        "anonymization_plan_alternative",
+        {
+            "mode": fields.String(description="in_place or swap"),
+            "backup": fields.String(description="how the backup is written"),
+            "pushdown": fields.Boolean(
+                description="whether columns are anonymized by the database"
+            ),
+            "cost": fields.Float(description="estimated cost"),
+        },
+    )
+
+    anonymization_plan = api.model(
+        "anonymization_plan",
+        {
+            "mode": fields.String(description="in_place or swap"),
+            "workers": fields.Integer(description="worker processes"),
+            "backup": fields.String(
+                description="server_copy, bulk_copy, batched or columns_copy"
+            ),
+            "rows": fields.Integer(
+                description="estimated rows to anonymize, null when unknown"
+            ),
+            "table_bytes": fields.Integer(
+                description="size of the table and its indexes, null when unknown"
+            ),
+            "indexes": fields.Integer(description="indexes of the table"),
+            "swap_blockers": fields.List(
+                fields.String,
+                description="referenced, privileges, triggers, policies or views "
+                "keeping a swap from being chosen",
+            ),
+            "cost": fields.Float(description="estimated cost of the plan"),
+            "columns": fields.List(fields.Nested(anonymization_plan_column)),
+            "steps": fields.List(fields.Nested(anonymization_plan_step)),
+            "alternatives": fields.List(
+                fields.Nested(anonymization_plan_alternative),
+                description="every plan considered, cheapest first",
+            ),
+        },
+    )
+
+    anonymization_job = api.model(
+        "anonymization_job",
+        {
+            "id": fields.Integer(description="job id"),
+            "table_id": fields.Integer(description="job table relationship"),
+            "type": fields.String(description="anonymization or restore"),
+            "state": fields.String(description="queued, running, succeeded or failed"),
+            "workers": fields.Integer(description="requested worker processes"),
+            "mode": fields.String(
+                description="in_place or swap, null until the job plans it"
+            ),
+            "incremental": fields.Boolean(
+                description="whether only the rows after the watermark are anonymized"
+            ),
+            "columns": fields.List(
+                fields.String, description="columns anonymized again, null for all"
+            ),
+            "pushdown_columns": fields.List(
+                fields.String,
+                description="columns anonymized by the database with a single UPDATE",
+            ),
+            "plan": fields.Nested(anonymization_plan, allow_null=True),
+            "rows_total": fields.Integer(description="estimated rows of the table"),
+            "rows_processed": fields.Integer(description="rows processed so far"),
+            "rows_per_second": fields.Float(description="average throughput"),
+            "eta_seconds": fields.Float(description="estimated seconds left"),
+            "wait_seconds": fields.Float(
+                description="seconds queued so far, or until the job started"
+            ),
+            "report": fields.Nested(anonymization_report, allow_null=True),
+            "error": fields.String(description="error message of a failed job"),
+            "created_at": fields.DateTime(),
+            "queued_at": fields.DateTime(),
+            "started_at": fields.DateTime(),
+            "finished_at": fields.DateTime(),
+        },
+    )
+
+    anonymization_group_job = api.model(
+        "anonymization_group_job",
+        {
+            "id": fields.Integer(description="job id"),
+            "table_id": fields.Integer(description="job table relationship"),
+            "state": fields.String(description="queued, running, succeeded or failed"),
+            "rows_total": fields.Integer(description="estimated rows of the table"),
+            "rows_processed": fields.Integer(description="rows processed so far"),
+            "error": fields.String(description="error message of a failed job"),
+        },
+    )
+
+    anonymization_group_skipped = api.model(
+        "anonymization_group_skipped",
+        {
+            "table_id": fields.Integer(description="table id"),
+            "name": fields.String(description="table name"),
+            "error": fields.String(description="why the table was left out"),
+        },
+    )
+
+    anonymization_job_group = api.model(
+        "anonymization_job_group",
+        {
+            "id": fields.Integer(description="job group id"),
+            "database_id": fields.Integer(
+                description="job group database relationship"
+            ),
+            "type": fields.String(description="anonymization or restore"),
+            "state": fields.String(
+                description="queued, running until every job finished, then "
+                "succeeded or failed when a job failed"
+            ),
+            "jobs_by_state": fields.Raw(description="jobs in each state"),
+            "rows_total": fields.Integer(description="estimated rows of the tables"),
+            "rows_processed": fields.Integer(description="rows processed so far"),
+            "rows_per_second": fields.Float(description="average throughput"),
+            "eta_seconds": fields.Float(description="estimated seconds left"),
+            "jobs": fields.List(
+                fields.Nested(anonymization_group_job),
+                description="jobs in the order they start, largest first",
+            ),
+            "skipped": fields.List(fields.Nested(anonymization_group_skipped)),
+            "created_at": fields.DateTime(),
+            "started_at": fields.DateTime(),
+            "finished_at": fields.DateTime(),
+        },
+    )
+
+    job_queue_wait = {
+        "queued": fields.Integer(description="jobs waiting to start"),
+        "running": fields.Integer(description="jobs started"),
+        "oldest_wait_seconds": fields.Float(
+            description="seconds the oldest queued job waited so far"
+        ),
+        "average_wait_seconds": fields.Float(
+            description="average seconds the queued jobs waited so far"
+        ),
+    }
+
+    job_queue_user = api.model(
+        "job_queue_user",
+        {
+            "user_id": fields.Integer(description="user owning the databases"),
+            "connections": fields.Integer(description="connections of its jobs"),
+            **job_queue_wait,
+        },
+    )
+
+    job_queue_server = api.model(
+        "job_queue_server",
+        {
+            "server": fields.String(description="host:port of the database server"),
+            "connections": fields.Integer(
+                description="connections of the jobs running on it"
+            ),
+            **job_queue_wait,
+        },
+    )
+
+    job_queue = api.model(
+        "job_queue",
+        {
+            **job_queue_wait,
+            "started_wait_seconds": fields.Float(
+                description="average seconds the latest started jobs waited"
+            ),
+            "users": fields.List(fields.Nested(job_queue_user)),
+            "servers": fields.List(fields.Nested(job_queue_server)),
+        },
+    )
+
+    anonymization_job_created = api.model(
+        "anonymization_job_created",
+        {
+            "message": fields.String(),
+            "job_id": fields.Integer(description="job id"),
+        },
+    )
@@ -27,7 +27,16 @@ class ColumnDTO:
         )
     }
 
-    column_post = api.model("column_post", column_name | column_anonymization_type)
+    column_consistent = {
+        "consistent": fields.Boolean(
+            description="anonymize equal original values to equal fake values",
+            default=False,
+        )
+    }
+
+    column_post = api.model(
+        "column_post", column_name | column_anonymization_type | column_consistent
+    )
 
     column_update = api.clone("column_put", column_post)
 
@@ -24,12 +24,29 @@ class TableDTO:
         )
     }
 
+    table_schema = {
+        "primary_key_columns": fields.List(
+            fields.String, description="primary key columns of the remote table"
+        ),
+        "column_types": fields.Raw(
+            description="type of each column of the remote table",
+            example={"id": "INTEGER", "name": "VARCHAR(255)"},
+        ),
+        "row_estimate": fields.Integer(
+            description="estimated rows of the remote table, from its statistics"
+        ),
+        "schema_refreshed_at": fields.DateTime(
+            description="when the remote table was last introspected"
+        ),
+    }
+
     table_post = api.model("table_post", table_name)
 
     table_update = api.clone("table_put", table_post)
 
     table_response = api.model(
-        "table_response", table_id | table_database_id | table_name | table_anonymized
+        "table_response",
+        table_id | table_database_id | table_name | table_anonymized | table_schema,
     )
 
     table_list = api.model(
@@ -0,0 +1,112 @@
+import pytest
+
+from app.main.anonymization import (
+    POOL_TYPES,
+    PoolSet,
+    Pseudonymizer,
+    build_pools,
+    get_pools,
+    job_pools,
+)
+from app.main.config import Config
+from app.main.model import Column, anonymization_applied
+
+SECRET = "00" * 32
+POOL_SIZE = 50
+
+
+@pytest.fixture(scope="module")
+def pool_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pools") / "pools.bin")
+    build_pools(path=path, size=POOL_SIZE)
+    return path
+
+
+class TestPools:
+    def test_build_pools(self, pool_path):
+        pools = PoolSet(pool_path)
+
+        assert sorted(pools.pools) == sorted(POOL_TYPES)
+        for anonymization_type in POOL_TYPES:
+            pool = pools.get(anonymization_type)
+            assert len(pool) == POOL_SIZE
+            assert all(isinstance(pool[index], str) for index in range(POOL_SIZE))
+
+    def test_build_pools_reproducible(self, pool_path, tmp_path):
+        other_path = str(tmp_path / "other_pools.bin")
+        build_pools(path=other_path, size=POOL_SIZE)
+
+        with open(pool_path, "rb") as file, open(other_path, "rb") as other_file:
+            assert file.read() == other_file.read()
+
+    def test_pseudonymizer_pools(self, pool_path):
+        pools = PoolSet(pool_path)
+        pseudonymizer = Pseudonymizer(
+            secret=SECRET, database_id=1, table_id=1, pools=pools
+        )
+        names = [pools.get("name")[index] for index in range(POOL_SIZE)]
+
+        values = pseudonymizer.anonymize_column("column", "name", range(20), range(20))
+
+        assert all(value in names for value in values)
+        assert values == [
+            pseudonymizer.anonymize("column", "name", row_key, row_key)
+            for row_key in range(20)
+        ]
+
+    def test_invalid_pool_file(self, tmp_path):
+        path = tmp_path / "invalid.bin"
+        path.write_bytes(b"\0" * 64)
+
+        with pytest.raises(ValueError):
+            PoolSet(str(path))
+
+    def test_get_pools(self, tmp_path):
+        path = str(tmp_path / "pools.bin")
+
+        # A missing file is looked for again on the next call
+        assert get_pools(path=path) is None
+
+        build_pools(path=path, size=POOL_SIZE)
+        pools = get_pools(path=path)
+        assert pools is get_pools(path=path)
+
+        build_pools(path=path, size=POOL_SIZE, seed=1)
+        assert get_pools(path=path).checksum != pools.checksum
+
+    def test_job_pools(self, tmp_path):
+        path = str(tmp_path / "pools.bin")
+        build_pools(path=path, size=POOL_SIZE)
+        checksum = get_pools(path=path).checksum
+
+        assert job_pools(path=path, checksum=None) is None
+        assert job_pools(path=path, checksum=checksum).checksum == checksum
+
+        # Rebuilt with other values while the job ran
+        build_pools(path=path, size=POOL_SIZE, seed=1)
+        with pytest.raises(ValueError):
+            job_pools(path=path, checksum=checksum)
+
+    def test_column_outdated_by_pools(self, monkeypatch, tmp_path):
+        path = str(tmp_path / "pools.bin")
+        monkeypatch.setattr(Config, "ANONYMIZATION_POOL_PATH", path)
+        build_pools(path=path, size=POOL_SIZE)
+        columns = [
+            Column(
+                name=name,
+                anonymization_type=anonymization_type,
+                consistent=False,
+                applied_anonymization=anonymization_applied(
+                    name=name,
+                    anonymization_type=anonymization_type,
+                    consistent=False,
+                    pools=get_pools(path=path).checksum,
+                ),
+            )
+            for name, anonymization_type in [("name", "name"), ("ip", "ipv4")]
+        ]
+        assert not any(column.outdated for column in columns)
+
+        # Only the values drawn from the pools change
+        build_pools(path=path, size=POOL_SIZE, seed=1)
+        assert [column.outdated for column in columns] == [True, False]
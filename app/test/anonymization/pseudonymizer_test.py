@@ -0,0 +1,149 @@
+import ipaddress
+from datetime import datetime
+
+import pytest
+
+from app.main.anonymization import HashRandom, Pseudonymizer, RowTransformer, ValueCache
+from app.main.model import ANONYMIZATION_TYPE
+
+SECRET = "00" * 32
+OTHER_SECRET = "11" * 32
+
+
+class TestPseudonymizer:
+    @pytest.mark.parametrize("anonymization_type", ANONYMIZATION_TYPE)
+    def test_anonymize_reproducible(self, anonymization_type):
+        first = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        second = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+
+        for row_key in range(20):
+            assert first.anonymize(
+                "column", anonymization_type, row_key, "value"
+            ) == second.anonymize("column", anonymization_type, row_key, "value")
+
+    @pytest.mark.parametrize("anonymization_type", ANONYMIZATION_TYPE)
+    def test_anonymize_depends_on_secret(self, anonymization_type):
+        first = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        second = Pseudonymizer(secret=OTHER_SECRET, database_id=1, table_id=1)
+
+        assert [
+            first.anonymize("column", anonymization_type, row_key, "value")
+            for row_key in range(20)
+        ] != [
+            second.anonymize("column", anonymization_type, row_key, "value")
+            for row_key in range(20)
+        ]
+
+    @pytest.mark.parametrize("anonymization_type", ANONYMIZATION_TYPE)
+    def test_anonymize_column_matches_cells(self, anonymization_type):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        row_keys = list(range(20))
+        values = [f"value {row_key % 3}" for row_key in row_keys]
+
+        assert pseudonymizer.anonymize_column(
+            "column", anonymization_type, row_keys, values
+        ) == [
+            pseudonymizer.anonymize("column", anonymization_type, row_key, value)
+            for row_key, value in zip(row_keys, values)
+        ]
+
+    def test_anonymize_column_empty(self):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+
+        assert pseudonymizer.anonymize_column("column", "ipv4", [], []) == []
+
+    def test_digest_inputs(self):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        other_table = Pseudonymizer(secret=SECRET, database_id=1, table_id=2)
+
+        digest = pseudonymizer.digest("column", 1, "value")
+
+        assert len(digest) == Pseudonymizer.digest_size
+        assert digest != pseudonymizer.digest("other column", 1, "value")
+        assert digest != pseudonymizer.digest("column", 2, "value")
+        assert digest != pseudonymizer.digest("column", 1, "other value")
+        assert digest != other_table.digest("column", 1, "value")
+
+    def test_numeric_types(self):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+
+        for row_key in range(50):
+            ipaddress.IPv4Address(pseudonymizer.anonymize("c", "ipv4", row_key, 1))
+            ipaddress.IPv6Address(pseudonymizer.anonymize("c", "ipv6", row_key, 1))
+            datetime.strptime(
+                pseudonymizer.anonymize("c", "date", row_key, 1), "%Y-%m-%d"
+            )
+            datetime.strptime(
+                pseudonymizer.anonymize("c", "time", row_key, 1), "%H:%M:%S"
+            )
+            assert pseudonymizer.anonymize("c", "date_time", row_key, 1) < datetime(
+                2030, 1, 1
+            )
+
+
+class TestRowTransformer:
+    COLUMNS = [("name", "name", False), ("ip", "ipv4", True), ("birth", "date", False)]
+
+    @pytest.mark.parametrize("key_count", [1, 2])
+    def test_matches_columns(self, key_count):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        transform = RowTransformer(
+            pseudonymizer=pseudonymizer,
+            columns=self.COLUMNS,
+            key_count=key_count,
+            value_caches={"ip": ValueCache(max_size=10)},
+        )
+        rows = [
+            (row_key, "x")[:key_count]
+            + (f"name {row_key}", f"ip {row_key % 3}", row_key, "kept")
+            for row_key in range(20)
+        ]
+
+        row_keys = [row[0] if key_count == 1 else row[:2] for row in rows]
+        expected = list(
+            zip(
+                *zip(*[row[:key_count] for row in rows]),
+                pseudonymizer.anonymize_column(
+                    "name", "name", row_keys, [row[key_count] for row in rows]
+                ),
+                pseudonymizer.anonymize_consistent_column(
+                    "ip",
+                    "ipv4",
+                    [row[key_count + 1] for row in rows],
+                    ValueCache(max_size=10),
+                ),
+                pseudonymizer.anonymize_column(
+                    "birth", "date", row_keys, [row[key_count + 2] for row in rows]
+                ),
+                ["kept"] * len(rows),
+            )
+        )
+
+        assert transform(rows) == expected
+
+    def test_empty(self):
+        transform = RowTransformer(
+            pseudonymizer=Pseudonymizer(secret=SECRET, database_id=1, table_id=1),
+            columns=self.COLUMNS,
+            key_count=1,
+            value_caches={"ip": ValueCache(max_size=10)},
+        )
+
+        assert transform([]) == []
+
+
+class TestHashRandom:
+    def test_stream_reproducible(self):
+        first = HashRandom(b"digest")
+        second = HashRandom(b"digest")
+
+        assert [first.random() for _ in range(100)] == [
+            second.random() for _ in range(100)
+        ]
+
+    def test_ranges(self):
+        rng = HashRandom(b"digest")
+
+        assert all(0 <= rng.random() < 1 for _ in range(1000))
+        assert {rng.randint(0, 3) for _ in range(1000)} == {0, 1, 2, 3}
+        assert rng.getrandbits(100) < 2**100
@@ -0,0 +1,149 @@
+import hmac
+from hashlib import sha256
+
+import pytest
+from sqlalchemy import Column, Date, Integer, MetaData, String, Table
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.dialects.postgresql import INET
+
+from app.main.anonymization import (
+    PUSHDOWN_TYPES,
+    SqlPseudonymizer,
+    pushdown_supported,
+)
+from app.main.anonymization.pushdown import _hmac_pads
+
+SECRET = "00" * 32
+PADS = _hmac_pads(secret=SECRET)
+
+people = Table(
+    "people",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("ip", INET),
+    Column("birth", Date),
+    Column("cpf", String(11)),
+)
+
+
+def _compile(dialect, columns: list[tuple], key_columns=["id"], lower=None, upper=None):
+    pseudonymizer = SqlPseudonymizer(
+        secret=SECRET, database_id=1, table_id=2, dialect=dialect
+    )
+    statement = pseudonymizer.update(
+        table=people,
+        columns=columns,
+        key_columns=key_columns,
+        lower=lower,
+        upper=upper,
+    ).compile(dialect=dialect)
+    return " ".join(str(statement).split()), statement.params
+
+
+class TestSqlPseudonymizer:
+    @pytest.mark.parametrize(
+        "dialect_name, anonymization_type, expected",
+        [
+            ("postgresql", "ipv4", True),
+            ("mysql", "date_time", True),
+            ("postgresql", "name", False),
+            ("mysql", "cpf", False),
+            ("sqlite", "ipv4", False),
+        ],
+    )
+    def test_pushdown_supported(self, dialect_name, anonymization_type, expected):
+        assert pushdown_supported(dialect_name, anonymization_type) == expected
+
+    def test_unsupported_dialect(self):
+        with pytest.raises(ValueError):
+            SqlPseudonymizer(
+                secret=SECRET, database_id=1, table_id=2, dialect=sqlite.dialect()
+            )
+
+    def test_unsupported_type(self):
+        with pytest.raises(ValueError):
+            _compile(postgresql.dialect(), [("cpf", "name", False)])
+
+    @pytest.mark.parametrize("dialect", [postgresql.dialect(), mysql.dialect()])
+    @pytest.mark.parametrize("anonymization_type", PUSHDOWN_TYPES)
+    def test_update_compiles(self, dialect, anonymization_type):
+        statement, params = _compile(dialect, [("cpf", anonymization_type, False)])
+
+        assert statement.startswith("UPDATE people SET cpf = ")
+        assert params == {
+            **PADS,
+            "column_2": "database1\x1ftable2\x1fcolumncpf\x1f",
+        }
+
+    def test_update_postgresql(self):
+        statement, params = _compile(
+            postgresql.dialect(),
+            [("ip", "ipv4", False), ("birth", "date", True)],
+        )
+
+        # Casted to the column types, the row key hashed only when not consistent
+        assert statement.startswith(
+            "UPDATE people SET ip = CAST(host(inet '0.0.0.0' + CAST(CAST('x' || "
+            "substr(encode(sha256(decode(%(outer_pad)s, 'hex') || "
+            "sha256(decode(%(inner_pad)s, 'hex') || convert_to("
+            "%(column_2)s || 'row' || concat_ws(chr(31), id) || chr(31) || "
+            "'value' || coalesce(CAST(ip AS text), 'None'), 'UTF8'))), 'hex'), 1, 8) "
+            "AS bit(32)) AS bigint)) AS INET), birth = CAST(DATE '1970-01-01' + "
+        )
+        assert statement.endswith(
+            "convert_to(%(column_3)s || 'value' || coalesce(CAST(birth AS text), "
+            "'None'), 'UTF8'))), 'hex'), 17, 12) AS bit(48)) AS bigint), 21915) "
+            "AS integer) AS DATE)"
+        )
+        assert list(params) == ["outer_pad", "inner_pad", "column_2", "column_3"]
+
+    def test_update_mysql(self):
+        statement, _ = _compile(mysql.dialect(), [("birth", "date", False)])
+
+        assert statement == (
+            "UPDATE people SET birth = DATE_ADD(DATE '1970-01-01', INTERVAL MOD("
+            "CAST(CONV(SUBSTR(SHA2(CONCAT(UNHEX(%s), UNHEX(SHA2(CONCAT(UNHEX(%s), "
+            "%s, 'row', CONCAT_WS(CHAR(31), id), CHAR(31), 'value', "
+            "COALESCE(birth, 'None')), 256))), 256), 17, 12), 16, 10) "
+            "AS UNSIGNED), 21915) DAY)"
+        )
+
+    @pytest.mark.parametrize("secret", [SECRET, "ab" * 100])
+    def test_hmac_pads(self, secret):
+        # The two hashes of the statements compute the HMAC of the secret
+        message = b"database1\x1ftable2\x1fcolumnip\x1fvalue10.0.0.1"
+        pads = _hmac_pads(secret=secret)
+        inner = sha256(bytes.fromhex(pads["inner_pad"]) + message).digest()
+
+        assert sha256(bytes.fromhex(pads["outer_pad"]) + inner).hexdigest() == (
+            hmac.new(bytes.fromhex(secret), message, sha256).hexdigest()
+        )
+
+    @pytest.mark.parametrize(
+        "key_columns, upper, expected",
+        [
+            (["id"], (5,), "WHERE (id) <= (%(upper_0)s)"),
+            (["id", "cpf"], (5, "x"), "WHERE (id, cpf) <= (%(upper_0)s, %(upper_1)s)"),
+        ],
+    )
+    def test_update_up_to_key(self, key_columns, upper, expected):
+        statement, params = _compile(
+            postgresql.dialect(),
+            [("ip", "ipv4", False)],
+            key_columns=key_columns,
+            upper=upper,
+        )
+
+        # Only the rows saved in the backup
+        assert statement.endswith(f"AS INET) {expected}")
+        assert [params[f"upper_{index}"] for index in range(len(upper))] == list(upper)
+
+    def test_update_key_range(self):
+        statement, params = _compile(
+            postgresql.dialect(), [("ip", "ipv4", False)], lower=(5,), upper=(9,)
+        )
+
+        assert statement.endswith(
+            "AS INET) WHERE (id) > (%(lower_0)s) AND (id) <= (%(upper_0)s)"
+        )
+        assert (params["lower_0"], params["upper_0"]) == (5, 9)
@@ -0,0 +1,47 @@
+from app.main.anonymization import Pseudonymizer, ValueCache
+
+SECRET = "00" * 32
+
+
+class TestValueCache:
+    def test_eviction(self):
+        cache = ValueCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert len(cache) == 2
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_consistent_column(self):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        cache = ValueCache(max_size=10)
+        values = ["São Paulo", "Recife", "São Paulo", "Recife", "Natal"]
+
+        anonymized = pseudonymizer.anonymize_consistent_column(
+            "city", "address", values, cache
+        )
+
+        assert anonymized[0] == anonymized[2]
+        assert anonymized[1] == anonymized[3]
+        assert len(set(anonymized)) == 3
+        assert cache.report() == {
+            "size": 3,
+            "hits": 2,
+            "misses": 3,
+            "hit_rate": 0.4,
+        }
+
+    def test_consistent_column_without_cache_entries(self):
+        pseudonymizer = Pseudonymizer(secret=SECRET, database_id=1, table_id=1)
+        values = [f"value {index % 7}" for index in range(30)]
+
+        # An evicting cache must give the same fakes as a cache that keeps everything
+        assert pseudonymizer.anonymize_consistent_column(
+            "column", "name", values, ValueCache(max_size=1)
+        ) == pseudonymizer.anonymize_consistent_column(
+            "column", "name", values, ValueCache(max_size=100)
+        )
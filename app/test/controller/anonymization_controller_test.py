@@ -0,0 +1,681 @@
+import socket
+import subprocess
+import threading
+import time
+from unittest import mock
+
+import pytest
+from sqlalchemy import Column as saColumn
+from sqlalchemy import Integer, MetaData, String
+from sqlalchemy import Table as saTable
+from sqlalchemy import create_engine, inspect, select
+
+from app.main import db
+from app.main.anonymization import Pseudonymizer, get_pools
+from app.main.config import Config
+from app.main.model import Column, Database, Job, Table
+from app.main.service import (
+    create_jwt,
+    job_service,
+    run_job_worker,
+    start_job_scheduler,
+)
+from app.test.seeders import create_base_seed_database, create_base_seed_user
+
+ROWS = 50
+
+people = saTable(
+    "people",
+    MetaData(),
+    saColumn("id", Integer, primary_key=True),
+    saColumn("name", String(255)),
+    saColumn("ip", String(64)),
+    saColumn("email", String(255)),
+)
+
+
+@pytest.fixture(scope="module")
+def urls(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("anonymization")
+    src_url = f"sqlite:///{directory}/source.db"
+    cloud_url = f"sqlite:///{directory}/cloud.db"
+
+    engine = create_engine(src_url)
+    people.create(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            people.insert(),
+            [
+                {
+                    "id": key,
+                    "name": f"name {key}",
+                    "ip": "127.0.0.1",
+                    "email": f"user{key}@example.com",
+                }
+                for key in range(1, ROWS + 1)
+            ],
+        )
+    engine.dispose()
+
+    # Point every registered database at the SQLite files
+    with mock.patch.object(Database, "url", property(lambda _: src_url)):
+        with mock.patch.object(Database, "cloud_url", property(lambda _: cloud_url)):
+            yield src_url, cloud_url
+
+
+@pytest.fixture(scope="module")
+def seeded_database(client, database, urls):
+    create_base_seed_user(db)
+    create_base_seed_database(db)
+
+    table = Table(database_id=1, name="people", anonymized=False)
+    db.session.add(table)
+    db.session.add(Column(table=table, name="name", anonymization_type="name"))
+    db.session.add(Column(table=table, name="ip", anonymization_type="ipv4"))
+    db.session.add(Table(database_id=1, name="missing", anonymized=False))
+    db.session.commit()
+
+
+def _select_all(url: str, columns: list = ["id", "name", "ip"]) -> list:
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(*[people.columns[name] for name in columns]).order_by(people.c.id)
+        ).all()
+    engine.dispose()
+    return rows
+
+
+def _pseudonymizer() -> Pseudonymizer:
+    return Pseudonymizer(
+        secret=db.session.get(Database, 1).secret,
+        database_id=1,
+        table_id=1,
+        pools=get_pools(path=Config.ANONYMIZATION_POOL_PATH),
+    )
+
+
+def _auth(user_id: int = 1) -> dict:
+    # The administrator by default, the owner of the first database
+    return {"Authorization": f"Bearer {create_jwt(user_id=user_id)}"}
+
+
+def wait_for_job(client, job_id: int) -> dict:
+    for _ in range(100):
+        # The job runs in another thread, do not answer from this session
+        db.session.expire_all()
+        response = client.get(f"/anonymization/jobs/{job_id}", headers=_auth())
+        if response.json["state"] in ["succeeded", "failed"]:
+            return response.json
+        time.sleep(0.05)
+
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def wait_for_job_group(client, group_id: int) -> dict:
+    for _ in range(200):
+        db.session.expire_all()
+        response = client.get(f"/anonymization/groups/{group_id}", headers=_auth())
+        if response.json["state"] in ["succeeded", "failed"]:
+            return response.json
+        time.sleep(0.05)
+
+    raise TimeoutError(f"job group {group_id} did not finish")
+
+
+@pytest.mark.usefixtures("seeded_database")
+class TestAnonymizationController:
+    def test_create_anonymization_of_table_that_not_exists(self, client):
+        response = client.post("/anonymization/0")
+
+        assert response.json["message"] == "table_not_found"
+        assert response.status_code == 404
+
+    def test_create_anonymization_with_job_in_progress(self, client):
+        job = Job(table_id=1, type="anonymization")
+        db.session.add(job)
+        db.session.commit()
+
+        response = client.post("/anonymization/1")
+
+        assert response.json["message"] == "job_in_progress"
+        assert response.status_code == 409
+
+        db.session.delete(job)
+        db.session.commit()
+
+    def test_create_incremental_anonymization_of_table_not_anonymized(self, client):
+        response = client.post("/anonymization/1?incremental=true")
+
+        assert response.json["message"] == "table_not_anonymized"
+        assert response.status_code == 409
+
+    def test_create_anonymization_with_invalid_mode(self, client):
+        response = client.post("/anonymization/1?mode=copy")
+
+        assert response.json["message"] == "anonymization_mode_invalid"
+        assert response.status_code == 400
+
+    def test_create_swap_anonymization_not_supported(self, client):
+        response = client.post("/anonymization/1?mode=swap")
+
+        assert response.json["message"] == "swap_not_supported"
+        assert response.status_code == 409
+
+    def test_get_anonymization_plan(self, client):
+        response = client.get("/anonymization/1/plan?mode=auto", headers=_auth())
+
+        # SQLite has no statistics, server copy, pushdown or swap, and no row is counted
+        assert response.status_code == 200
+        assert response.json["mode"] == "in_place"
+        assert response.json["workers"] == 1
+        assert response.json["backup"] == "batched"
+        assert response.json["rows"] is None
+        assert [
+            (column["name"], column["strategy"]) for column in response.json["columns"]
+        ] == [("name", "python"), ("ip", "python")]
+        assert [step["step"] for step in response.json["steps"]] == ["backup", "ranges"]
+        assert response.json["cost"] == response.json["alternatives"][0]["cost"]
+        assert not Job.query.filter(Job.table_id == 1).count()
+
+    def test_get_anonymization_plan_of_registered_estimate(self, client):
+        table = db.session.get(Table, 1)
+        table.row_estimate = 1000
+        db.session.commit()
+
+        response = client.get("/anonymization/1/plan", headers=_auth())
+
+        table.row_estimate = None
+        db.session.commit()
+        assert response.json["rows"] == 1000
+
+    def test_get_anonymization_plan_token_not_found(self, client):
+        response = client.get("/anonymization/1/plan")
+
+        assert response.json["message"] == "token_not_found"
+        assert response.status_code == 404
+
+    def test_get_anonymization_plan_of_other_user(self, client):
+        response = client.get("/anonymization/1/plan", headers=_auth(user_id=2))
+
+        assert response.json["message"] == "user_unauthorized"
+        assert response.status_code == 401
+
+    def test_get_anonymization_plan_with_invalid_mode(self, client):
+        response = client.get("/anonymization/1/plan?mode=copy", headers=_auth())
+
+        assert response.json["message"] == "anonymization_mode_invalid"
+        assert response.status_code == 400
+
+    def test_get_anonymization_plan_of_table_missing_in_database(self, client):
+        response = client.get("/anonymization/2/plan", headers=_auth())
+
+        assert response.json["message"] == "table_not_exists"
+        assert response.status_code == 409
+
+    def test_create_anonymization(self, client, urls):
+        src_url, cloud_url = urls
+        original = _select_all(src_url)
+
+        response = client.post("/anonymization/1")
+
+        assert response.json["message"] == "anonymization_job_created"
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "succeeded"
+        assert job["type"] == "anonymization"
+        assert job["mode"] == "in_place"
+        assert job["plan"]["backup"] == "batched"
+        assert job["rows_total"] == ROWS
+        assert job["rows_processed"] == ROWS
+        assert job["report"]["rows_processed"] == ROWS
+        assert job["error"] is None
+
+        anonymized = _select_all(src_url)
+        assert all(
+            row.name != original_row.name
+            for row, original_row in zip(anonymized, original)
+        )
+        assert _select_all(cloud_url) == original
+        assert db.session.get(Table, 1).anonymized
+
+    def test_create_anonymization_of_anonymized_table(self, client):
+        response = client.post("/anonymization/1")
+
+        assert response.json["message"] == "table_already_anonymized"
+        assert response.status_code == 409
+
+    def test_create_anonymization_of_table_missing_in_database(self, client):
+        response = client.post("/anonymization/2")
+
+        assert response.json["message"] == "table_not_exists"
+        assert response.status_code == 409
+
+    def test_failed_job(self, client):
+        # Planned as if the table existed, the job finds out it does not
+        with mock.patch(
+            "app.main.service.anonymization_service.plan_anonymization",
+            return_value={
+                "mode": "in_place",
+                "workers": 1,
+                "backup": "batched",
+                "columns": [],
+                "rows": ROWS,
+            },
+        ):
+            response = client.post("/anonymization/2")
+
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "failed"
+        assert job["error"] == "table_not_exists"
+
+    def test_delete_anonymization(self, client, urls):
+        src_url, cloud_url = urls
+        original = _select_all(cloud_url)
+
+        response = client.delete("/anonymization/1")
+
+        assert response.json["message"] == "restore_job_created"
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "succeeded"
+        assert job["type"] == "restore"
+        assert job["rows_processed"] == ROWS
+        assert _select_all(src_url) == original
+        assert not inspect(create_engine(cloud_url)).has_table("people")
+        assert not db.session.get(Table, 1).anonymized
+
+    def test_resume_anonymization(self, client, urls, monkeypatch):
+        src_url, _ = urls
+        original = _select_all(src_url)
+        monkeypatch.setattr(Config, "ANONYMIZATION_BATCH_SIZE", 10)
+
+        # Kill the job after the second batch is committed, before its checkpoint
+        checkpoints = []
+
+        def save_checkpoint(**kwargs):
+            checkpoints.append(kwargs["last_key"])
+            if len(checkpoints) == 2:
+                raise RuntimeError("killed")
+            job_service.save_checkpoint(**kwargs)
+
+        with mock.patch(
+            "app.main.service.anonymization_service.save_checkpoint", save_checkpoint
+        ):
+            response = client.post("/anonymization/1")
+            job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "failed"
+        assert job["error"] == "killed"
+        assert job["rows_processed"] == 10
+        assert db.session.get(Job, job["id"]).ranges[0].last_key == [10]
+
+        response = client.post(
+            f"/anonymization/jobs/{job['id']}/resume", headers=_auth()
+        )
+
+        assert response.json["message"] == "job_resumed"
+        assert response.status_code == 202
+
+        job = wait_for_job(client, job["id"])
+
+        assert job["state"] == "succeeded"
+        assert job["rows_processed"] == ROWS
+
+        # Every row anonymized once from its original value, the second batch too
+        pseudonymizer = _pseudonymizer()
+        assert [row.name for row in _select_all(src_url)] == [
+            pseudonymizer.anonymize("name", "name", row.id, row.name)
+            for row in original
+        ]
+        assert db.session.get(Table, 1).watermark == [ROWS]
+
+    def test_create_incremental_anonymization(self, client, urls):
+        src_url, cloud_url = urls
+        anonymized = _select_all(src_url)
+        backup = _select_all(cloud_url)
+
+        # New rows arrive after the table was anonymized
+        new_rows = [
+            {
+                "id": key,
+                "name": f"name {key}",
+                "ip": "127.0.0.1",
+                "email": f"user{key}@example.com",
+            }
+            for key in range(ROWS + 1, ROWS + 11)
+        ]
+        engine = create_engine(src_url)
+        with engine.begin() as connection:
+            connection.execute(people.insert(), new_rows)
+        engine.dispose()
+
+        response = client.post("/anonymization/1?incremental=true&workers=2")
+
+        assert response.json["message"] == "anonymization_job_created"
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "succeeded"
+        assert job["incremental"]
+        assert job["rows_total"] == 10
+        assert job["rows_processed"] == 10
+
+        # Only the new rows are anonymized, their originals appended to the backup
+        rows = _select_all(src_url)
+        assert rows[:ROWS] == anonymized
+        assert all(row.name != f"name {row.id}" for row in rows[ROWS:])
+        assert _select_all(cloud_url) == backup + [
+            (row["id"], row["name"], row["ip"]) for row in new_rows
+        ]
+        assert db.session.get(Table, 1).watermark == [ROWS + 10]
+
+    def test_resume_job_not_resumable(self, client):
+        job = Job.query.filter(Job.state == "succeeded").first()
+
+        response = client.post(f"/anonymization/jobs/{job.id}/resume", headers=_auth())
+
+        assert response.json["message"] == "job_not_resumable"
+        assert response.status_code == 409
+
+    def test_get_job_token_not_found(self, client):
+        job = Job.query.first()
+
+        response = client.get(f"/anonymization/jobs/{job.id}")
+
+        assert response.json["message"] == "token_not_found"
+        assert response.status_code == 404
+
+    def test_job_of_other_user(self, client):
+        job = Job.query.filter(Job.state == "succeeded").first()
+
+        response = client.get(f"/anonymization/jobs/{job.id}", headers=_auth(user_id=2))
+
+        assert response.json["message"] == "user_unauthorized"
+        assert response.status_code == 401
+
+        response = client.post(
+            f"/anonymization/jobs/{job.id}/resume", headers=_auth(user_id=2)
+        )
+
+        assert response.json["message"] == "user_unauthorized"
+        assert response.status_code == 401
+
+    def test_get_job_that_not_exists(self, client):
+        response = client.get("/anonymization/jobs/0", headers=_auth())
+
+        assert response.json["message"] == "job_not_found"
+        assert response.status_code == 404
+
+    def test_create_anonymization_of_changed_column(self, client, urls):
+        src_url, cloud_url = urls
+        anonymized = _select_all(src_url)
+        backup = _select_all(cloud_url)
+
+        column = Column.query.filter(Column.name == "ip").one()
+        column.anonymization_type = "ipv6"
+        db.session.commit()
+
+        response = client.post("/anonymization/1?incremental=true")
+
+        assert response.json["message"] == "table_columns_outdated"
+        assert response.status_code == 409
+
+        response = client.post("/anonymization/1")
+
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "succeeded"
+        assert job["columns"] == ["ip"]
+        assert job["rows_processed"] == len(backup)
+
+        # Only the changed column is anonymized again, from the backed up values
+        pseudonymizer = _pseudonymizer()
+        rows = _select_all(src_url)
+        assert [row.name for row in rows] == [row.name for row in anonymized]
+        assert [row.ip for row in rows] == [
+            pseudonymizer.anonymize("ip", "ipv6", row.id, row.ip) for row in backup
+        ]
+        assert _select_all(cloud_url) == backup
+        assert not db.session.get(Column, column.id).outdated
+
+    def test_create_anonymization_of_added_column(self, client, urls):
+        src_url, cloud_url = urls
+        original = _select_all(src_url, columns=["id", "name", "ip", "email"])
+
+        db.session.add(Column(table_id=1, name="email", anonymization_type="email"))
+        db.session.commit()
+
+        response = client.post("/anonymization/1")
+        job = wait_for_job(client, response.json["job_id"])
+
+        assert job["state"] == "succeeded"
+        assert job["columns"] == ["email"]
+
+        # The original values of the new column are backed up before they are anonymized
+        pseudonymizer = _pseudonymizer()
+        rows = _select_all(src_url, columns=["id", "name", "ip", "email"])
+        assert [row[:3] for row in rows] == [row[:3] for row in original]
+        assert [row.email for row in rows] == [
+            pseudonymizer.anonymize("email", "email", row.id, row.email)
+            for row in original
+        ]
+        assert [
+            row.email for row in _select_all(cloud_url, columns=["id", "email"])
+        ] == [row.email for row in original]
+
+        response = client.post("/anonymization/1")
+
+        assert response.json["message"] == "table_already_anonymized"
+        assert response.status_code == 409
+
+    def test_create_database_anonymization_token_not_found(self, client):
+        response = client.post("/anonymization/database/1")
+
+        assert response.json["message"] == "token_not_found"
+        assert response.status_code == 404
+
+    def test_create_database_anonymization_of_other_user(self, client):
+        response = client.post("/anonymization/database/1", headers=_auth(user_id=2))
+
+        assert response.json["message"] == "user_unauthorized"
+        assert response.status_code == 401
+        assert not Job.query.filter(Job.group_id.isnot(None)).count()
+
+    def test_create_database_anonymization_of_database_that_not_exists(self, client):
+        response = client.post("/anonymization/database/0", headers=_auth())
+
+        assert response.json["message"] == "database_not_found"
+        assert response.status_code == 404
+
+    def test_create_database_anonymization_without_tables(self, client):
+        response = client.post("/anonymization/database/2", headers=_auth())
+
+        assert response.json["message"] == "no_table_to_anonymize"
+        assert response.status_code == 409
+
+    def test_create_database_anonymization(self, client, urls, monkeypatch):
+        src_url, _ = urls
+        monkeypatch.setattr(Config, "JOB_SERVER_CONNECTIONS", 1)
+
+        # Two more tables of the database, the second one larger
+        metadata = MetaData()
+        engine = create_engine(src_url)
+        for name, rows in [("small", 5), ("large", 20)]:
+            table = saTable(
+                name,
+                metadata,
+                saColumn("id", Integer, primary_key=True),
+                saColumn("name", String(255)),
+            )
+            table.create(bind=engine)
+            with engine.begin() as connection:
+                connection.execute(
+                    table.insert(),
+                    [{"id": key, "name": f"name {key}"} for key in range(1, rows + 1)],
+                )
+
+            new_table = Table(
+                database_id=1, name=name, anonymized=False, row_estimate=rows
+            )
+            db.session.add(new_table)
+            db.session.add(
+                Column(table=new_table, name="name", anonymization_type="name")
+            )
+        engine.dispose()
+        db.session.commit()
+        small, large = Table.query.filter(Table.name.in_(["small", "large"])).order_by(
+            Table.id
+        )
+
+        missing = Table.query.filter(Table.name == "missing").one()
+
+        response = client.post("/anonymization/database/1", headers=_auth())
+
+        # Queued by their registered estimates, the database is only read by the jobs
+        assert response.status_code == 202
+        assert [job["table_id"] for job in response.json["jobs"]] == [
+            large.id,
+            small.id,
+            missing.id,
+        ]
+        assert response.json["rows_total"] == 25
+        assert [
+            (skipped["name"], skipped["error"]) for skipped in response.json["skipped"]
+        ] == [("people", "table_already_anonymized")]
+
+        group = wait_for_job_group(client, response.json["id"])
+
+        response = client.get(
+            f"/anonymization/groups/{group['id']}", headers=_auth(user_id=2)
+        )
+        assert response.json["message"] == "user_unauthorized"
+        assert response.status_code == 401
+
+        assert group["state"] == "failed"
+        assert group["jobs_by_state"]["succeeded"] == 2
+        assert group["rows_processed"] == 25
+        assert group["eta_seconds"] is None
+
+        # Planned when it started, the table missing in the database fails its job
+        large_job, small_job, missing_job = [
+            db.session.get(Job, job["id"]) for job in group["jobs"]
+        ]
+        assert large_job.plan["mode"] == large_job.mode == "in_place"
+        assert missing_job.state == "failed"
+        assert missing_job.error == "table_not_exists"
+
+        # A connection of the SQLite server each, the small table waited for the large one
+        assert large_job.finished_at <= small_job.started_at
+        assert db.session.get(Table, small.id).anonymized
+        assert db.session.get(Table, large.id).anonymized
+
+    def test_get_job_group_that_not_exists(self, client):
+        response = client.get("/anonymization/groups/0", headers=_auth())
+
+        assert response.json["message"] == "job_group_not_found"
+        assert response.status_code == 404
+
+    def test_get_job_queue_token_not_found(self, client):
+        response = client.get("/anonymization/queue")
+
+        assert response.json["message"] == "token_not_found"
+        assert response.status_code == 404
+
+    def test_get_job_queue(self, client, base_admin_auth):
+        response = client.get(
+            "/anonymization/queue",
+            headers={"Authorization": f"Bearer {base_admin_auth}"},
+        )
+
+        assert response.status_code == 200
+        assert response.json["queued"] == 0
+        assert response.json["running"] == 0
+        assert response.json["oldest_wait_seconds"] is None
+        assert response.json["started_wait_seconds"] >= 0
+        assert response.json["users"] == []
+
+    def test_job_worker(self, client, monkeypatch, base_admin_auth, base_auth):
+        monkeypatch.setattr(Config, "JOB_SCHEDULER", "worker")
+        small = Table.query.filter(Table.name == "small").one()
+
+        response = client.delete(f"/anonymization/{small.id}")
+        job_id = response.json["job_id"]
+
+        # Left in the queue for a worker process
+        time.sleep(0.1)
+        db.session.expire_all()
+        assert db.session.get(Job, job_id).owner is None
+
+        response = client.get(
+            "/anonymization/queue",
+            headers={"Authorization": f"Bearer {base_admin_auth}"},
+        )
+
+        assert response.json["queued"] == 1
+        assert response.json["oldest_wait_seconds"] > 0
+        assert response.json["users"][0]["user_id"] == 1
+        assert response.json["users"][0]["queued"] == 1
+
+        # Other users see none of the jobs, users or servers of the first one
+        response = client.get(
+            "/anonymization/queue", headers={"Authorization": f"Bearer {base_auth}"}
+        )
+
+        assert response.json["queued"] == 0
+        assert response.json["users"] == []
+        assert response.json["servers"] == []
+
+        def worker():
+            with client.application.app_context():
+                run_job_worker(poll_seconds=0.05, stop=stop)
+
+        stop = threading.Event()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            job = wait_for_job(client, job_id)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert job["state"] == "succeeded"
+        assert job["wait_seconds"] >= 0.1
+        assert not db.session.get(Table, small.id).anonymized
+
+    def test_job_scheduler(self, client, monkeypatch):
+        monkeypatch.setattr(Config, "JOB_SCHEDULER", "worker")
+        monkeypatch.setattr(Config, "JOB_POLL_SECONDS", 0.05)
+        large = Table.query.filter(Table.name == "large").one()
+
+        response = client.delete(f"/anonymization/{large.id}")
+        job_id = response.json["job_id"]
+
+        # Claimed by a process killed before it started the job
+        process = subprocess.Popen(["true"])
+        process.wait()
+        db.session.get(Job, job_id).owner = f"{socket.gethostname()}:{process.pid}"
+        db.session.commit()
+
+        # A restarted API process drains the queue without any request
+        monkeypatch.setattr(Config, "JOB_SCHEDULER", "in_process")
+        stop = threading.Event()
+        thread = start_job_scheduler(client.application, stop=stop)
+        try:
+            job = wait_for_job(client, job_id)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert job["state"] == "succeeded"
+        assert not db.session.get(Table, large.id).anonymized
@@ -108,7 +108,7 @@ class TestColumnController:
         )
 
         assert response.status_code == 200
-        assert len(response.json) == 4
+        assert len(response.json) == 5
 
         column = Column.query.filter(Column.id == 1).one_or_none()
         check_object_with_json(object=column, json=response.json)
@@ -161,12 +161,14 @@ class TestColumnController:
             ("name", ""),
             ("name", "a" * 256),
             ("anonymization_type", 0),
+            ("consistent", "yes"),
         ],
         ids=[
             "invalid_name",
             "short_name",
             "long_name",
             "invalid_anonymization_type",
+            "invalid_consistent",
         ],
     )
     def test_update_column_with_invalid_data(
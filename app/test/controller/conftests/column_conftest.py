@@ -16,6 +16,7 @@ def base_column_put():
     column = {
         "name": "column name put",
         "anonymization_type": "address",
+        "consistent": True,
     }
 
     return column
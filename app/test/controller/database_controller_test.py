@@ -246,7 +246,17 @@ class TestDatabaseController:
         assert response.json["message"] == "database_already_exist"
         assert response.status_code == 409
 
-    def test_update_database(self, client, base_admin_auth, base_database_put):
+    def test_update_database(
+        self, client, base_admin_auth, base_database_put, monkeypatch
+    ):
+        disposed = []
+        monkeypatch.setattr(
+            "app.main.service.database_service.dispose_engines",
+            lambda url: disposed.append(url),
+        )
+        database = Database.query.filter(Database.id == 1).one_or_none()
+        urls = [database.url, database.cloud_url]
+
         response = client.put(
             "/database/1",
             headers={"Authorization": f"Bearer {base_admin_auth}"},
@@ -260,6 +270,9 @@ class TestDatabaseController:
 
         check_object_with_json(object=database, json=base_database_put)
 
+        # The engines opened with the old credentials are dropped
+        assert disposed == urls
+
     # --------------------- POST ---------------------
 
     @pytest.mark.parametrize(
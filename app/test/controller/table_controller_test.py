@@ -1,9 +1,11 @@
 from datetime import datetime
+from unittest import mock
 
 import pytest
+from sqlalchemy import create_engine, text
 
 from app.main import db
-from app.main.model import Table
+from app.main.model import Database, Table
 from app.test.seeders import (
     create_base_seed_database,
     create_base_seed_table,
@@ -106,7 +108,7 @@ class TestTableController:
         )
 
         assert response.status_code == 200
-        assert len(response.json) == 4
+        assert len(response.json) == 8
 
         table = Table.query.filter(Table.id == 1).one_or_none()
         check_object_with_json(object=table, json=response.json)
@@ -312,6 +314,77 @@ class TestTableController:
 
         check_object_with_json(object=table, json=base_table_post)
 
+    # --------------------- REFRESH ---------------------
+
+    def test_refresh_table_schema(self, client, base_admin_auth, tmp_path):
+        name = Table.query.filter(Table.id == 1).one_or_none().name
+        url = f"sqlite:///{tmp_path}/source.db"
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    f'CREATE TABLE "{name}" (tenant INTEGER, id INTEGER, '
+                    "name VARCHAR(255), PRIMARY KEY (tenant, id))"
+                )
+            )
+            connection.execute(
+                text(f'INSERT INTO "{name}" VALUES (1, 1, NULL), (1, 2, NULL)')
+            )
+        engine.dispose()
+
+        with mock.patch.object(Database, "url", property(lambda _: url)):
+            response = client.post(
+                "/table/1/refresh",
+                headers={"Authorization": f"Bearer {base_admin_auth}"},
+            )
+
+            table = Table.query.filter(Table.id == 1).one_or_none()
+
+            # Read back without reaching the database again
+            assert table.primary_keys == ["tenant", "id"]
+
+        assert response.json["message"] == "table_schema_refreshed"
+        assert response.status_code == 200
+        assert table.column_types == {
+            "tenant": "INTEGER",
+            "id": "INTEGER",
+            "name": "VARCHAR(255)",
+        }
+        assert table.row_estimate == 2
+        assert table.primary_keys == ["tenant", "id"]
+
+        response = client.get(
+            "/table/1", headers={"Authorization": f"Bearer {base_admin_auth}"}
+        )
+
+        assert response.json["row_estimate"] == 2
+        assert response.json["primary_key_columns"] == ["tenant", "id"]
+
+    def test_refresh_table_schema_of_unreachable_database(
+        self, client, base_admin_auth
+    ):
+        response = client.post(
+            "/table/2/refresh",
+            headers={"Authorization": f"Bearer {base_admin_auth}"},
+        )
+
+        assert response.json["message"] == "database_not_exists"
+        assert response.status_code == 409
+
+    def test_refresh_table_schema_of_table_missing_in_database(
+        self, client, base_admin_auth, tmp_path
+    ):
+        url = f"sqlite:///{tmp_path}/source.db"
+
+        with mock.patch.object(Database, "url", property(lambda _: url)):
+            response = client.post(
+                "/table/2/refresh",
+                headers={"Authorization": f"Bearer {base_admin_auth}"},
+            )
+
+        assert response.json["message"] == "table_not_exists"
+        assert response.status_code == 409
+
     # --------------------- DELETE ---------------------
 
     def test_delete_table_with_non_registered_id(self, client, base_admin_auth):
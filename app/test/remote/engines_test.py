@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from sqlalchemy.pool import NullPool, QueuePool
+
+from app.main.remote import EngineRegistry
+
+
+@pytest.fixture()
+def registry():
+    return EngineRegistry(max_size=2, idle_seconds=600, pool_recycle=3600)
+
+
+class TestEngineRegistry:
+    def test_reused(self, registry, tmp_path):
+        url = f"sqlite:///{tmp_path}/first.db"
+
+        engine = registry.get(url)
+
+        assert registry.get(url) is engine
+        assert registry.get(url, echo=True) is not engine
+        assert isinstance(engine.pool, NullPool)
+
+    def test_pooled(self, registry):
+        engine = registry.get("postgresql+psycopg2://u:p@host/db")
+
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool._pre_ping
+        assert engine.pool._recycle == 3600
+
+    def test_least_recently_used_evicted(self, registry, tmp_path):
+        first = registry.get(f"sqlite:///{tmp_path}/first.db")
+        second = registry.get(f"sqlite:///{tmp_path}/second.db")
+
+        # The first one is used again, so the second one makes room
+        registry.get(f"sqlite:///{tmp_path}/first.db")
+        registry.get(f"sqlite:///{tmp_path}/third.db")
+
+        assert registry.get(f"sqlite:///{tmp_path}/first.db") is first
+        assert registry.get(f"sqlite:///{tmp_path}/second.db") is not second
+
+    def test_idle_disposed(self, registry, tmp_path, monkeypatch):
+        url = f"sqlite:///{tmp_path}/first.db"
+        engine = registry.get(url)
+
+        now = time.monotonic()
+        monkeypatch.setattr("app.main.remote.engines.time.monotonic", lambda: now + 601)
+
+        assert registry.get(url) is not engine
+
+    def test_dispose(self, registry, tmp_path):
+        url = f"sqlite:///{tmp_path}/first.db"
+        engine = registry.get(url)
+        other = registry.get(f"sqlite:///{tmp_path}/second.db")
+
+        registry.dispose(url=url)
+
+        assert registry.get(url) is not engine
+        assert registry.get(f"sqlite:///{tmp_path}/second.db") is other
+
+    def test_after_fork(self, registry, tmp_path):
+        url = f"sqlite:///{tmp_path}/first.db"
+        engine = registry.get(url)
+
+        registry._after_fork()
+
+        assert registry.get(url) is not engine
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine
+
+from app.main.remote import KeysetReader, stream_batches
+
+table = Table("numbers", MetaData(), Column("id", Integer, primary_key=True))
+
+
+class TestStreamBatches:
+    def test_stream_batches(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path}/numbers.db")
+        table.create(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(table.insert(), [{"id": key} for key in range(25)])
+
+        with engine.connect() as connection:
+            batches = list(
+                stream_batches(
+                    connection=connection,
+                    statement=table.select().order_by(table.c.id),
+                    batch_size=10,
+                )
+            )
+
+        assert [len(batch) for batch in batches] == [10, 10, 5]
+        assert [row.id for batch in batches for row in batch] == list(range(25))
+
+
+pairs = Table(
+    "pairs",
+    MetaData(),
+    Column("tenant", Integer, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("value", Integer),
+)
+
+
+class TestKeysetReader:
+    @pytest.fixture()
+    def engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path}/pairs.db")
+        pairs.create(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(
+                pairs.insert(),
+                [
+                    {"tenant": key % 3, "id": key // 3, "value": key}
+                    for key in range(30)
+                ],
+            )
+        return engine
+
+    def test_composite_primary_key(self, engine):
+        reader = KeysetReader(
+            engine=engine, table=pairs, primary_key=["tenant", "id"], batch_size=7
+        )
+
+        batches = list(reader)
+        keys = [(row.tenant, row.id) for batch in batches for row in batch]
+
+        assert [len(batch) for batch in batches] == [7, 7, 7, 7, 2]
+        assert keys == sorted((key % 3, key // 3) for key in range(30))
+        assert reader.last_key == (2, 9)
+
+    def test_resume_and_upper_bound(self, engine):
+        reader = KeysetReader(
+            engine=engine,
+            table=pairs,
+            primary_key=["tenant", "id"],
+            batch_size=4,
+            columns=["tenant", "id"],
+            after=(0, 8),
+            upper=(1, 2),
+        )
+
+        assert [tuple(row) for batch in reader for row in batch] == [
+            (0, 9),
+            (1, 0),
+            (1, 1),
+            (1, 2),
+        ]
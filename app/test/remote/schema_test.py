@@ -0,0 +1,121 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import NoSuchTableError
+
+from app.main.remote import SchemaCache
+from app.main.remote import schema as schema_module
+from app.main.remote import schema_table
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/people.db")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE people (tenant INTEGER, id INTEGER, name VARCHAR(255), "
+                "PRIMARY KEY (tenant, id))"
+            )
+        )
+    return engine
+
+
+@pytest.fixture()
+def cache(monkeypatch):
+    cache = SchemaCache(max_size=2, ttl=300)
+    monkeypatch.setattr(schema_module, "_cache", cache)
+    return cache
+
+
+@pytest.fixture()
+def reflections(monkeypatch):
+    reflected = []
+    reflect = schema_module._reflect
+
+    def counted(**kwargs):
+        reflected.append(kwargs["table_name"])
+        return reflect(**kwargs)
+
+    monkeypatch.setattr(schema_module, "_reflect", counted)
+    return reflected
+
+
+class TestSchemaCache:
+    def test_reflected_once(self, cache, engine, reflections):
+        schema = cache.get(engine, "people")
+
+        assert cache.get(engine, "people") is schema
+        assert schema["primary_keys"] == ["tenant", "id"]
+        assert [column["name"] for column in schema["columns"]] == [
+            "tenant",
+            "id",
+            "name",
+        ]
+        assert reflections == ["people"]
+
+    def test_reflected_again_when_columns_change(self, cache, engine, reflections):
+        cache.get(engine, "people")
+
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE people ADD COLUMN email VARCHAR(255)"))
+
+        columns = cache.get(engine, "people")["columns"]
+
+        assert columns[-1]["name"] == "email"
+        assert reflections == ["people", "people"]
+
+    def test_reflected_again_when_indexes_change(self, cache, engine, reflections):
+        cache.get(engine, "people")
+
+        with engine.begin() as connection:
+            connection.execute(text("CREATE INDEX people_name ON people (name)"))
+
+        indexes = cache.get(engine, "people")["indexes"]
+
+        assert [index["name"] for index in indexes] == ["people_name"]
+        assert reflections == ["people", "people"]
+
+    def test_ttl_with_fingerprint(self, cache, engine, reflections):
+        cache.get(engine, "people")
+
+        # A backstop for the changes the fingerprint would miss
+        cache.ttl = 0
+        cache.get(engine, "people")
+
+        assert reflections == ["people", "people"]
+
+    def test_missing_table(self, cache, engine):
+        cache.get(engine, "people")
+
+        with engine.begin() as connection:
+            connection.execute(text("DROP TABLE people"))
+
+        assert cache.get(engine, "people") is None
+        assert cache.get(engine, "other") is None
+
+    def test_ttl_without_fingerprint(self, cache, engine, reflections, monkeypatch):
+        monkeypatch.setattr(schema_module, "_FINGERPRINTS", {})
+        cache.get(engine, "people")
+        cache.get(engine, "people")
+
+        cache.ttl = 0
+        cache.get(engine, "people")
+
+        assert reflections == ["people", "people"]
+
+    def test_invalidate(self, cache, engine, reflections):
+        cache.get(engine, "people")
+
+        cache.invalidate(url=str(engine.url), table_name="people")
+        cache.get(engine, "people")
+
+        assert reflections == ["people", "people"]
+
+    def test_schema_table(self, cache, engine):
+        table = schema_table(engine, "people", include_columns=["id", "name"])
+
+        assert table.columns.keys() == ["id", "name"]
+        assert table.primary_key.columns.keys() == ["id"]
+
+        with pytest.raises(NoSuchTableError):
+            schema_table(engine, "other")
@@ -0,0 +1,46 @@
+import pytest
+
+from app.main.remote import index_definition, shadow_name
+
+
+@pytest.mark.parametrize(
+    "table_name, expected",
+    [
+        ("people", "people_shadow"),
+        ("p" * 63, "p" * 56 + "_shadow"),
+    ],
+    ids=["short", "truncated"],
+)
+def test_shadow_name(table_name, expected):
+    name = shadow_name(table_name, "shadow")
+
+    assert name == expected
+    assert len(name) <= 63
+
+
+@pytest.mark.parametrize(
+    "definition, expected",
+    [
+        (
+            "CREATE INDEX people_name_idx ON public.people USING btree (name)",
+            'CREATE INDEX IF NOT EXISTS "tmp" ON people_shadow USING btree (name)',
+        ),
+        (
+            'CREATE UNIQUE INDEX "People Email" ON ONLY "My Schema"."People" '
+            "USING btree (lower((email)::text)) WHERE (email IS NOT NULL)",
+            'CREATE UNIQUE INDEX IF NOT EXISTS "tmp" ON people_shadow '
+            "USING btree (lower((email)::text)) WHERE (email IS NOT NULL)",
+        ),
+    ],
+    ids=["plain", "quoted_partial"],
+)
+def test_index_definition(definition, expected):
+    assert (
+        index_definition(definition=definition, name='"tmp"', table="people_shadow")
+        == expected
+    )
+
+
+def test_unknown_index_definition():
+    with pytest.raises(ValueError):
+        index_definition(definition="DROP TABLE people", name="tmp", table="people")
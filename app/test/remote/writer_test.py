@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, inspect
+
+from app.main.remote import BulkUpdater, add_columns
+
+people = Table(
+    "people",
+    MetaData(),
+    Column("tenant", Integer, primary_key=True),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(255)),
+    Column("email", String(255)),
+)
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/people.db")
+    people.create(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            people.insert(),
+            [
+                {"tenant": key % 2, "id": key, "name": f"name {key}", "email": ""}
+                for key in range(10)
+            ],
+        )
+    return engine
+
+
+class TestBulkUpdater:
+    @pytest.mark.parametrize("strategy", ["executemany", "join"])
+    def test_update(self, engine, strategy):
+        with engine.connect() as connection:
+            updater = BulkUpdater(
+                connection=connection,
+                table=people,
+                key_columns=["tenant", "id"],
+                value_columns=["name", "email"],
+                strategy=strategy,
+            )
+            # Two batches, the second one going through the reused staging table
+            updater.update(rows=[(0, 0, "a", "a@x"), (1, 1, "b", "b@x")])
+            updater.update(rows=[(0, 2, "c", "c@x"), (0, 3, "d", "d@x")])
+            updater.close()
+            connection.commit()
+
+            rows = connection.execute(
+                people.select().order_by(people.c.id).limit(4)
+            ).all()
+
+        # (0, 3) does not exist, so the row with id 3 keeps its values
+        assert [tuple(row) for row in rows] == [
+            (0, 0, "a", "a@x"),
+            (1, 1, "b", "b@x"),
+            (0, 2, "c", "c@x"),
+            (1, 3, "name 3", ""),
+        ]
+
+    def test_close_drops_staging_table(self, engine):
+        with engine.connect() as connection:
+            updater = BulkUpdater(
+                connection=connection,
+                table=people,
+                key_columns=["tenant", "id"],
+                value_columns=["name"],
+            )
+            updater.update(rows=[(0, 0, "a")])
+
+            assert updater.strategy == "join"
+            assert "staging_people" in inspect(connection).get_temp_table_names()
+
+            updater.close()
+
+            assert inspect(connection).get_temp_table_names() == []
+
+    def test_unknown_strategy(self, engine):
+        with engine.connect() as connection, pytest.raises(ValueError):
+            BulkUpdater(
+                connection=connection,
+                table=people,
+                key_columns=["id"],
+                value_columns=["name"],
+                strategy="upsert",
+            )
+
+
+def test_add_columns(engine):
+    phone = Table("contacts", MetaData(), Column("phone", String(32)))
+
+    with engine.begin() as connection:
+        add_columns(connection=connection, table=people, columns=[phone.c.phone])
+
+    columns = {
+        column["name"]: column for column in inspect(engine).get_columns("people")
+    }
+    assert columns["phone"]["nullable"]
+    assert isinstance(columns["phone"]["type"], String)
@@ -0,0 +1,318 @@
+import pytest
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+)
+from sqlalchemy.exc import IntegrityError
+
+from app.main.config import Config
+from app.main.model import Job
+from app.main.remote import insert_rows
+from app.main.service import anonymization_service
+from app.main.service.anonymization_service import (
+    _anonymize_range,
+    _merge_reports,
+    _primary_key_ranges,
+    _push_down_columns,
+)
+from app.test.util import copy_branch
+
+ROWS = 100
+
+people = Table(
+    "people",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(255)),
+    Column("ip", String(64)),
+)
+
+
+@pytest.fixture()
+def spec(tmp_path):
+    url = f"sqlite:///{tmp_path}/source.db"
+    engine = create_engine(url)
+    people.create(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            people.insert(),
+            [
+                {"id": key, "name": f"name {key % 10}", "ip": "127.0.0.1"}
+                for key in range(1, ROWS + 1)
+            ],
+        )
+    engine.dispose()
+
+    return {
+        "url": url,
+        "table_name": "people",
+        "primary_keys": ["id"],
+        "columns": [("name", "name", True), ("ip", "ipv4", False)],
+        "backup_url": None,
+        "backup_copied": False,
+        "secret": "00" * 32,
+        "database_id": 1,
+        "table_id": 1,
+        "pool_path": str(tmp_path / "pools.bin"),
+        "pools": None,
+        "cache_size": 100,
+        "batch_size": 30,
+        "commit_batches": 1,
+        "shadow": None,
+    }
+
+
+class _SqlPseudonymizer:
+    """Stand-in of SqlPseudonymizer on SQLite, keeping the key ranges it updates."""
+
+    ranges = []
+
+    def __init__(self, **kwargs) -> None:
+        pass
+
+    def update(self, table, columns, key_columns, lower=None, upper=None):
+        self.ranges.append((lower, upper))
+        statement = table.update().values({name: "pushed" for name, _, _ in columns})
+        if lower is not None:
+            statement = statement.where(table.c.id > lower[0])
+        return statement.where(table.c.id <= upper[0])
+
+
+def _select_all(url: str) -> list:
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT * FROM people ORDER BY id").all()
+    engine.dispose()
+    return rows
+
+
+class TestAnonymizationService:
+    def test_primary_key_ranges(self, spec):
+        ranges = _primary_key_ranges(spec=spec, partitions=4)
+
+        assert ranges == [(None, (25,)), ((25,), (50,)), ((50,), (75,)), ((75,), None)]
+
+    def test_primary_key_ranges_after_key(self, spec):
+        ranges = _primary_key_ranges(spec=spec, partitions=2, after=(60,))
+
+        assert ranges == [((60,), (80,)), ((80,), None)]
+
+    def test_ranges_match_serial(self, spec):
+        original = _select_all(spec["url"])
+
+        report = _merge_reports(
+            reports=[
+                _anonymize_range(spec, lower, upper)
+                for lower, upper in _primary_key_ranges(spec=spec, partitions=3)
+            ]
+        )
+        by_ranges = _select_all(spec["url"])
+
+        # Restore the original rows and anonymize them in a single range
+        engine = create_engine(spec["url"])
+        with engine.begin() as connection:
+            connection.exec_driver_sql("DELETE FROM people")
+            connection.exec_driver_sql(
+                "INSERT INTO people VALUES (?, ?, ?)", [tuple(row) for row in original]
+            )
+        engine.dispose()
+        _anonymize_range(spec)
+
+        assert report["rows_processed"] == ROWS
+        assert report["cache"]["name"]["misses"] >= 10
+        assert by_ranges == _select_all(spec["url"])
+        assert all(
+            row[1] != original_row[1] for row, original_row in zip(by_ranges, original)
+        )
+
+    def test_merge_reports(self):
+        report = _merge_reports(
+            reports=[
+                {
+                    "rows_processed": 10,
+                    "cache": {"name": {"size": 4, "hits": 6, "misses": 4}},
+                },
+                {
+                    "rows_processed": 20,
+                    "cache": {"name": {"size": 8, "hits": 12, "misses": 8}},
+                },
+            ]
+        )
+
+        # The caches of the worker processes are apart, only the lookups add up
+        assert report == {
+            "rows_processed": 30,
+            "cache": {"name": {"size": 8, "hits": 18, "misses": 12, "hit_rate": 0.6}},
+        }
+
+    def test_backup_written_with_batches(self, spec, tmp_path):
+        original = _select_all(spec["url"])
+        spec["backup_url"] = f"sqlite:///{tmp_path}/backup.db"
+        engine = create_engine(spec["backup_url"])
+        people.create(bind=engine)
+        engine.dispose()
+
+        _anonymize_range(spec)
+
+        assert _select_all(spec["backup_url"]) == original
+        assert _select_all(spec["url"]) != original
+
+    def test_backup_written_through_copy(self, spec, tmp_path, monkeypatch):
+        original = _select_all(spec["url"])
+        spec["backup_url"] = f"sqlite:///{tmp_path}/backup.db"
+        engine = create_engine(spec["backup_url"])
+        people.create(bind=engine)
+        engine.dispose()
+
+        # The backup connection only writes with COPY, as on a PostgreSQL cloud database
+        def copy_insert_rows(connection, **kwargs):
+            with copy_branch(connection):
+                insert_rows(connection=connection, **kwargs)
+
+        monkeypatch.setattr(anonymization_service, "insert_rows", copy_insert_rows)
+
+        _anonymize_range(spec)
+
+        assert _select_all(spec["backup_url"]) == original
+        assert _select_all(spec["url"]) != original
+
+    def test_failed_backup_write_skips_batch(self, spec, tmp_path):
+        original = _select_all(spec["url"])
+        spec["backup_url"] = f"sqlite:///{tmp_path}/backup.db"
+        engine = create_engine(spec["backup_url"])
+        # The backup refuses a row of the second batch
+        Table(
+            "people",
+            MetaData(),
+            Column("id", Integer, CheckConstraint("id != 45"), primary_key=True),
+            Column("name", String(255)),
+            Column("ip", String(64)),
+        ).create(bind=engine)
+        engine.dispose()
+
+        with pytest.raises(IntegrityError):
+            _anonymize_range(spec)
+
+        # Only the first batch, backed up and committed, is anonymized
+        rows = _select_all(spec["url"])
+        assert all(
+            row != original_row for row, original_row in zip(rows[:30], original)
+        )
+        assert rows[30:] == original[30:]
+
+    def test_resume_after_checkpoint(self, spec, tmp_path):
+        original = _select_all(spec["url"])
+        spec["backup_url"] = f"sqlite:///{tmp_path}/backup.db"
+        backup_engine = create_engine(spec["backup_url"])
+        people.create(bind=backup_engine)
+
+        _anonymize_range(spec)
+        expected = _select_all(spec["url"])
+
+        # Killed with the checkpoint at 30, rows up to 60 backed up and committed
+        engine = create_engine(spec["url"])
+        with engine.begin() as connection:
+            connection.execute(people.delete().where(people.c.id > 60))
+            connection.execute(
+                people.insert(), [row._asdict() for row in original[60:]]
+            )
+        engine.dispose()
+        with backup_engine.begin() as connection:
+            connection.execute(people.delete().where(people.c.id > 60))
+        backup_engine.dispose()
+
+        report = _anonymize_range(spec, after=(30,))
+
+        assert report["rows_processed"] == ROWS - 30
+        assert _select_all(spec["url"]) == expected
+        assert _select_all(spec["backup_url"]) == original
+
+    @pytest.mark.parametrize(
+        "pushdown_key, expected",
+        [
+            (None, [(None, (30,)), ((30,), (60,)), ((60,), (90,)), ((90,), (100,))]),
+            ([60], [((60,), (90,)), ((90,), (100,))]),
+        ],
+        ids=["first_run", "resumed"],
+    )
+    def test_push_down_columns_in_key_ranges(
+        self, client, spec, monkeypatch, pushdown_key, expected
+    ):
+        monkeypatch.setattr(Config, "ANONYMIZATION_PUSHDOWN_ROWS", 30)
+        monkeypatch.setattr(
+            anonymization_service, "SqlPseudonymizer", _SqlPseudonymizer
+        )
+        monkeypatch.setattr(_SqlPseudonymizer, "ranges", [])
+        spec["backup_url"] = spec["url"]
+        job = Job(pushdown_key=pushdown_key)
+
+        rows = _push_down_columns(
+            job=job, spec=spec, column_names=["ip"], progress=False
+        )
+
+        # A transaction per range, each one saved as the checkpoint of the job
+        assert _SqlPseudonymizer.ranges == expected
+        assert rows == ROWS - (pushdown_key or [0])[0]
+        assert job.pushdown_key == [ROWS]
+        assert [row.ip for row in _select_all(spec["url"])] == ["127.0.0.1"] * (
+            ROWS - rows
+        ) + ["pushed"] * rows
+
+    def test_shadow_table_matches_in_place(self, spec):
+        original = _select_all(spec["url"])
+
+        engine = create_engine(spec["url"])
+        shadow = people.to_metadata(MetaData(), name="people_shadow")
+        shadow.create(bind=engine)
+
+        # Only the name is anonymized, the ip is copied as it is
+        spec["columns"] = [("name", "name", True)]
+        _anonymize_range(
+            {**spec, "shadow": {"table": "people_shadow", "columns": ["ip"]}}
+        )
+
+        with engine.connect() as connection:
+            shadow_rows = connection.execute(
+                shadow.select().order_by(shadow.c.id)
+            ).all()
+        engine.dispose()
+
+        # The table is untouched until the swap
+        assert _select_all(spec["url"]) == original
+
+        _anonymize_range(spec)
+
+        assert shadow_rows == _select_all(spec["url"])
+        assert [row.ip for row in shadow_rows] == [row.ip for row in original]
+
+    def test_resumed_shadow_range(self, spec):
+        engine = create_engine(spec["url"])
+        # Without a primary key until the swap builds it
+        shadow = Table(
+            "people_shadow",
+            MetaData(),
+            Column("id", Integer),
+            Column("name", String(255)),
+            Column("ip", String(64)),
+        )
+        shadow.create(bind=engine)
+        spec = {**spec, "shadow": {"table": "people_shadow", "columns": []}}
+
+        _anonymize_range(spec)
+        with engine.connect() as connection:
+            expected = connection.execute(shadow.select().order_by(shadow.c.id)).all()
+
+        # Killed with the checkpoint at 30 of the range up to 90, its later rows committed
+        report = _anonymize_range(spec, upper=(90,), after=(30,), resumed=True)
+
+        with engine.connect() as connection:
+            rows = connection.execute(shadow.select().order_by(shadow.c.id)).all()
+        engine.dispose()
+
+        assert report["rows_processed"] == 60
+        assert rows == expected
@@ -0,0 +1,183 @@
+import pytest
+
+from app.main.config import Config
+from app.main.service.plan_service import choose_plan, pushdown_columns
+
+COLUMNS = [
+    {"name": "name", "type": "name", "consistent": True, "anonymized": False},
+    {"name": "ip", "type": "ipv4", "consistent": False, "anonymized": False},
+    {"name": "birth", "type": "date", "consistent": False, "anonymized": True},
+]
+
+
+def _statistics(**kwargs) -> dict:
+    return {
+        "rows": 1000,
+        "table_bytes": None,
+        "distinct": {},
+        "indexes": 1,
+        "swap_blockers": [],
+        "pooled": [],
+        **kwargs,
+    }
+
+
+class TestPlanService:
+    @pytest.mark.parametrize(
+        "backend_name, kwargs, expected",
+        [
+            ("postgresql", {}, ["ip", "birth"]),
+            ("mysql", {}, ["ip", "birth"]),
+            ("sqlite", {}, []),
+            ("postgresql", {"incremental": True}, []),
+        ],
+        ids=["postgresql", "mysql", "sqlite", "incremental"],
+    )
+    def test_pushdown_columns(self, backend_name, kwargs, expected):
+        plan = choose_plan(
+            backend_name=backend_name,
+            columns=COLUMNS[1:],
+            statistics=_statistics(),
+            **kwargs,
+        )
+
+        assert pushdown_columns(plan=plan) == expected
+
+    def test_pushdown_columns_of_delta(self):
+        # Only the columns never anonymized still hold their original values
+        plan = choose_plan(
+            backend_name="postgresql",
+            columns=COLUMNS[1:2],
+            statistics=_statistics(),
+            delta=True,
+        )
+        anonymized = choose_plan(
+            backend_name="postgresql",
+            columns=COLUMNS[2:],
+            statistics=_statistics(),
+            delta=True,
+        )
+
+        assert pushdown_columns(plan=plan) == ["ip"]
+        assert not any(
+            alternative["pushdown"] for alternative in anonymized["alternatives"]
+        )
+
+    def test_pushdown_of_consistent_column(self):
+        # Its database digest would differ from the one of incremental runs
+        column = {**COLUMNS[1], "consistent": True}
+        plan = choose_plan(
+            backend_name="postgresql", columns=[column], statistics=_statistics()
+        )
+
+        assert pushdown_columns(plan=plan) == []
+        assert not any(alternative["pushdown"] for alternative in plan["alternatives"])
+
+    def test_pushdown_not_worth_a_pass(self):
+        # The ranges read every row for the name anyway
+        plan = choose_plan(
+            backend_name="postgresql", columns=COLUMNS, statistics=_statistics()
+        )
+
+        assert pushdown_columns(plan=plan) == []
+        assert [alternative["pushdown"] for alternative in plan["alternatives"]] == [
+            False,
+            False,
+            True,
+        ]
+
+    def test_pushdown_disabled(self, monkeypatch):
+        monkeypatch.setattr(Config, "ANONYMIZATION_PUSHDOWN", False)
+
+        plan = choose_plan(
+            backend_name="postgresql", columns=COLUMNS[1:], statistics=_statistics()
+        )
+
+        assert pushdown_columns(plan=plan) == []
+        assert plan["backup"] == "batched"
+
+    def test_pushdown_loads_backup_in_bulk(self):
+        plan = choose_plan(
+            backend_name="postgresql",
+            columns=COLUMNS[1:],
+            statistics=_statistics(),
+            load_strategy="copy",
+        )
+
+        # No range is left to run
+        assert plan["backup"] == "bulk_copy"
+        assert [step["step"] for step in plan["steps"]] == ["backup", "pushdown"]
+        assert plan["cost"] == sum(step["cost"] for step in plan["steps"])
+        assert plan["cost"] == min(
+            alternative["cost"] for alternative in plan["alternatives"]
+        )
+
+    def test_server_copy(self):
+        plan = choose_plan(
+            backend_name="mysql",
+            columns=COLUMNS,
+            statistics=_statistics(),
+            server_copy=True,
+        )
+
+        assert plan["backup"] == "server_copy"
+
+    def test_consistent_columns_cached(self):
+        plan = choose_plan(
+            backend_name="sqlite",
+            columns=COLUMNS,
+            statistics=_statistics(distinct={"name": 10}),
+        )
+        columns = {column["name"]: column for column in plan["columns"]}
+
+        # Ten distinct names generated once each, every other one found in the cache
+        assert columns["name"]["strategy"] == "python_cached"
+        assert columns["name"]["distinct"] == 10
+        assert columns["name"]["cost"] < columns["ip"]["cost"]
+        assert columns["ip"]["strategy"] == "python"
+
+    @pytest.mark.parametrize(
+        "rows, workers, expected", [(1000, None, 1), (10**9, None, 4), (1000, 3, 3)]
+    )
+    def test_workers(self, monkeypatch, rows, workers, expected):
+        monkeypatch.setattr(Config, "ANONYMIZATION_MAX_WORKERS", 4)
+
+        plan = choose_plan(
+            backend_name="sqlite",
+            columns=COLUMNS,
+            statistics=_statistics(rows=rows),
+            workers=workers,
+        )
+
+        assert plan["workers"] == expected
+
+    def test_auto_mode(self):
+        plan = choose_plan(
+            backend_name="postgresql",
+            columns=COLUMNS,
+            statistics=_statistics(),
+            mode="auto",
+        )
+
+        assert {alternative["mode"] for alternative in plan["alternatives"]} == {
+            "in_place",
+            "swap",
+        }
+
+    @pytest.mark.parametrize(
+        "blocker", ["referenced", "privileges", "triggers", "policies", "views"]
+    )
+    def test_auto_mode_of_table_not_swappable(self, blocker):
+        plan = choose_plan(
+            backend_name="postgresql",
+            columns=COLUMNS,
+            statistics=_statistics(swap_blockers=[blocker]),
+            mode="auto",
+        )
+
+        # The swapped in table would lose them, or the old one could not be dropped
+        assert plan["mode"] == "in_place"
+        assert plan["swap_blockers"] == [blocker]
+        assert {alternative["mode"] for alternative in plan["alternatives"]} == {
+            "in_place"
+        }
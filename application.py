@@ -2,11 +2,14 @@ import logging
 import os
 from logging.handlers import RotatingFileHandler
 
+import click
 from werkzeug.exceptions import HTTPException
 
 import app.main.model
 from app import blueprint
 from app.main import create_app, db
+from app.main.anonymization import build_pools
+from app.main.service import run_job_worker, start_job_scheduler
 from seeder import create_seed
 
 env_name = os.environ.get("ENV_NAME", "dev")
@@ -51,5 +54,27 @@ def create_db():
         create_seed()
 
 
+@app.cli.command("build_pools")
+@click.option("--size", type=int, default=None, help="Values per anonymization type")
+def build_anonymization_pools(size):
+    build_pools(
+        path=app.config["ANONYMIZATION_POOL_PATH"],
+        size=size or app.config["ANONYMIZATION_POOL_SIZE"],
+    )
+
+
+@app.cli.command("run_jobs")
+@click.option(
+    "--poll", type=float, default=None, help="Seconds between two looks at the queue"
+)
+def run_jobs(poll):
+    # The local worker of JOB_SCHEDULER=worker, jobs are queued by the API processes
+    run_job_worker(poll_seconds=poll or app.config["JOB_POLL_SECONDS"])
+
+
 if __name__ == "__main__":
+    # Only in the process serving the requests, not in the reloader watching it
+    if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_job_scheduler(app)
+
     app.run(host=app.config["HOST"])
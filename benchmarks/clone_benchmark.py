@@ -0,0 +1,124 @@
+"""Rows/sec of the clone_table bulk loaders against the old multi-VALUES insert.
+
+Usage: python -m benchmarks.clone_benchmark [rows] [source url] [destination url]
+
+Both databases must share the dialect, as a database and its cloud copy do.
+COPY runs only between PostgreSQL databases and LOAD DATA only into a MySQL
+server with local_infile enabled; without urls two temporary SQLite files are
+used and only the insert loaders run. The benchmark tables are dropped and
+recreated.
+"""
+
+import sys
+import tempfile
+import time
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    func,
+    select,
+)
+
+from app.main.remote import copy_rows, load_strategy, loader_connect_args
+from app.main.remote.reader import stream_batches
+
+TABLE_NAME = "clone_benchmark"
+BATCH_SIZE = 100000
+
+table = Table(
+    TABLE_NAME,
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(255)),
+    Column("email", String(255)),
+    Column("notes", String(255)),
+    Column("created_at", DateTime),
+)
+
+
+def create_source_table(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        "id": key,
+                        "name": f"name {key}",
+                        "email": f"{key}@example.com",
+                        "notes": "tab\there" if key % 7 else None,
+                        "created_at": None,
+                    }
+                    for key in range(start + 1, min(start + 10000, rows) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def copy_rows_values(src_connection, dest_connection) -> None:
+    # The loader clone_table used before, one multi-VALUES literal per batch
+    for rows in stream_batches(
+        connection=src_connection, statement=table.select(), batch_size=BATCH_SIZE
+    ):
+        dest_connection.execute(table.insert().values([tuple(row) for row in rows]))
+
+
+def main(rows: int, src_url: str, dest_url: str) -> None:
+    create_source_table(url=src_url, rows=rows)
+    src_engine = create_engine(src_url)
+    dest_engine = create_engine(dest_url, connect_args=loader_connect_args(dest_url))
+
+    with src_engine.connect() as src_connection:
+        with dest_engine.connect() as dest_connection:
+            native = load_strategy(src_connection, dest_connection)
+
+    strategies = ["values", "insert"] + ([native] if native != "insert" else [])
+
+    print(f"{'loader':>10}{'seconds':>10}{'rows/s':>12}")
+    for strategy in strategies:
+        table.drop(bind=dest_engine, checkfirst=True)
+        table.create(bind=dest_engine)
+
+        start = time.perf_counter()
+        with src_engine.connect() as src_connection:
+            with dest_engine.begin() as dest_connection:
+                if strategy == "values":
+                    copy_rows_values(src_connection, dest_connection)
+                else:
+                    copy_rows(
+                        src_connection=src_connection,
+                        src_table=table,
+                        dest_connection=dest_connection,
+                        dest_table=table,
+                        batch_size=BATCH_SIZE,
+                        strategy=strategy,
+                    )
+        elapsed = time.perf_counter() - start
+
+        with dest_engine.connect() as dest_connection:
+            copied = dest_connection.execute(select(func.count()).select_from(table))
+            assert copied.scalar() == rows
+
+        print(f"{strategy:>10}{elapsed:>10.2f}{rows / elapsed:>12,.0f}")
+
+    src_engine.dispose()
+    dest_engine.dispose()
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    main(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        src_url=sys.argv[2] if len(sys.argv) > 2 else f"sqlite:///{directory}/src.db",
+        dest_url=sys.argv[3] if len(sys.argv) > 3 else f"sqlite:///{directory}/dest.db",
+    )
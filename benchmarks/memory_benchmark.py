@@ -0,0 +1,101 @@
+"""Peak RSS of reading a whole table with buffered and server-side cursors.
+
+Usage: python -m benchmarks.memory_benchmark [database url] [rows ...]
+
+Each read runs in a fresh process so ru_maxrss only reflects that read.
+psycopg2 and mysqlclient buffer the whole result of a client-side cursor,
+so point it at PostgreSQL or MySQL: SQLite steps its cursor natively and
+stays flat in both modes. The benchmark table is dropped and recreated.
+"""
+
+import resource
+import subprocess
+import sys
+import tempfile
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, create_engine
+
+from app.main.remote import stream_batches
+
+TABLE_NAME = "memory_benchmark"
+BATCH_SIZE = 10000
+
+table = Table(
+    TABLE_NAME,
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("payload", Text),
+)
+
+
+def create_benchmark_table(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    payload = "x" * 1024
+    with engine.begin() as connection:
+        for start in range(0, rows, BATCH_SIZE):
+            connection.execute(
+                table.insert(),
+                [
+                    {"id": key, "payload": payload}
+                    for key in range(start + 1, min(start + BATCH_SIZE, rows) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def read(url: str, mode: str) -> None:
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        if mode == "streamed":
+            for _ in stream_batches(connection, table.select(), BATCH_SIZE):
+                pass
+        else:
+            # How the services read before: a client-side cursor and fetchmany
+            results = connection.execute(table.select())
+            while results.fetchmany(BATCH_SIZE):
+                pass
+    engine.dispose()
+
+    # ru_maxrss is in KiB on Linux
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def main(url: str, sizes: list[int]) -> None:
+    print(f"{'rows':>10}{'buffered MiB':>16}{'streamed MiB':>16}")
+    for rows in sizes:
+        create_benchmark_table(url=url, rows=rows)
+
+        peaks = []
+        for mode in ("buffered", "streamed"):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.memory_benchmark",
+                    "--read",
+                    url,
+                    mode,
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            peaks.append(int(output.split()[-1]) / 1024)
+        print(f"{rows:>10}{peaks[0]:>16.1f}{peaks[1]:>16.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--read"]:
+        read(url=sys.argv[2], mode=sys.argv[3])
+    else:
+        main(
+            url=(
+                sys.argv[1]
+                if len(sys.argv) > 1
+                else f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+            ),
+            sizes=[int(rows) for rows in sys.argv[2:]] or [10000, 50000, 100000],
+        )
@@ -0,0 +1,96 @@
+"""Rows/sec of the primary key range anonymization from 1 to N worker processes.
+
+Usage: python -m benchmarks.parallel_benchmark [rows] [max workers] [database url]
+
+Without a database url a temporary SQLite file is used, whose single writer
+lock serializes the updates, so point it at PostgreSQL or MySQL for real
+scaling numbers. The benchmark table is dropped and recreated.
+"""
+
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine
+
+from app.main.config import Config
+from app.main.service.anonymization_service import anonymize_ranges
+
+TABLE_NAME = "anonymization_benchmark"
+
+
+def create_benchmark_table(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    table = Table(
+        TABLE_NAME,
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("name", String(255)),
+        Column("email", String(255)),
+        Column("ip", String(64)),
+    )
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            connection.execute(
+                table.insert(),
+                [
+                    {"id": key, "name": f"name {key}", "email": f"{key}@x", "ip": ""}
+                    for key in range(start + 1, min(start + 10000, rows) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def main(rows: int, max_workers: int, url: str) -> None:
+    spec = {
+        "url": url,
+        "table_name": TABLE_NAME,
+        "primary_keys": ["id"],
+        "columns": [
+            ("name", "name", False),
+            ("email", "email", False),
+            ("ip", "ipv4", False),
+        ],
+        "backup_url": None,
+        "backup_copied": False,
+        "secret": secrets.token_hex(32),
+        "database_id": 1,
+        "table_id": 1,
+        "pool_path": Config.ANONYMIZATION_POOL_PATH,
+        "cache_size": Config.ANONYMIZATION_CACHE_SIZE,
+        "batch_size": 100000,
+        "commit_batches": 1,
+        "shadow": None,
+    }
+
+    print(f"{'workers':>8}{'seconds':>10}{'rows/s':>12}{'speedup':>10}")
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        create_benchmark_table(url=url, rows=rows)
+
+        start = time.perf_counter()
+        anonymize_ranges(spec=spec, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        baseline = baseline or elapsed
+        print(
+            f"{workers:>8}{elapsed:>10.2f}{rows / elapsed:>12,.0f}"
+            f"{baseline / elapsed:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        max_workers=int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count(),
+        url=(
+            sys.argv[3]
+            if len(sys.argv) > 3
+            else f"sqlite:///{tempfile.mkdtemp()}/benchmark.db?timeout=60"
+        ),
+    )
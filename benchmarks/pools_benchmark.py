@@ -0,0 +1,62 @@
+"""Warm-up time and per-value cost of the memory-mapped pools against Faker.
+
+Usage: python -m benchmarks.pools_benchmark [pool size] [cells]
+"""
+
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+from app.main.anonymization import POOL_TYPES, PoolSet, Pseudonymizer, build_pools
+
+
+def main(size: int, cells: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "pools.bin")
+
+    start = time.perf_counter()
+    build_pools(path=path, size=size)
+    print(f"build {size} values per type: {time.perf_counter() - start:.2f}s")
+    print(f"pool file size: {os.path.getsize(path) / 2**20:.1f} MiB")
+
+    # Warm-up: what every worker pays before producing its first value
+    start = time.perf_counter()
+    Pseudonymizer(secret=secrets.token_hex(32), database_id=1, table_id=1)
+    faker_warmup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pools = PoolSet(path)
+    pools_warmup = time.perf_counter() - start
+    print(
+        f"warm-up faker generator: {faker_warmup * 1000:.1f}ms, "
+        f"pool mmap: {pools_warmup * 1000:.2f}ms"
+    )
+
+    faker_pseudonymizer = Pseudonymizer(
+        secret=secrets.token_hex(32), database_id=1, table_id=1
+    )
+    pools_pseudonymizer = Pseudonymizer(
+        secret=secrets.token_hex(32), database_id=1, table_id=1, pools=pools
+    )
+    row_keys = list(range(cells))
+
+    print(f"{'type':<18}{'faker us/value':>16}{'pools us/value':>16}")
+    for anonymization_type in POOL_TYPES:
+        timings = []
+        for pseudonymizer in (faker_pseudonymizer, pools_pseudonymizer):
+            start = time.perf_counter()
+            pseudonymizer.anonymize_column(
+                anonymization_type, anonymization_type, row_keys, row_keys
+            )
+            timings.append((time.perf_counter() - start) / cells * 1e6)
+        print(f"{anonymization_type:<18}{timings[0]:>16.2f}{timings[1]:>16.2f}")
+
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2**16,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20000,
+    )
@@ -0,0 +1,122 @@
+"""Cells/sec of the per-cell faker reseeding against the keyed-hash pseudonymizer,
+called once per cell and once per column batch, and with the pools for their types.
+
+Only the types computed from the digest alone, dates, times and IP addresses,
+gain several times over reseeding. Without pools the text types still run the
+Faker generators, which cost about as much as the reseeding did: at 20,000
+cells they gain 0.9x to 1.9x depending on the type and the run. Drawn from the
+pools, name, address, email and phone numbers gain ten times or more; cpf and
+rg have no pool and stay close to reseeding.
+
+Usage: python -m benchmarks.pseudonymizer_benchmark [cells] [pool size]
+"""
+
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+
+from faker import Faker
+
+from app.main.anonymization import (
+    POOL_TYPES,
+    PoolSet,
+    Pseudonymizer,
+    build_pools,
+    fix_cpf,
+    fix_rg,
+)
+
+faker = Faker(locale=["pt_BR"])
+
+# Generators as they were called before the pseudonymizer, one reseed per cell
+legacy_mapping = {
+    "name": faker.name,
+    "address": faker.address,
+    "email": faker.ascii_email,
+    "date_time": faker.date_time,
+    "date": faker.date,
+    "time": faker.time,
+    "cpf": lambda: fix_cpf(faker.cpf()),
+    "rg": lambda: fix_rg(faker.rg()),
+    "ipv4": faker.ipv4,
+    "ipv6": faker.ipv6,
+    "phone_number": faker.phone_number,
+    "cellphone_number": faker.cellphone_number,
+}
+
+
+def legacy(anonymization_type: str, cells: int) -> float:
+    generate = legacy_mapping[anonymization_type]
+    start = time.perf_counter()
+    for row in range(cells):
+        faker.seed_instance(
+            f"database1table1column{anonymization_type}row{row}value{str(row * 7)}"
+        )
+        generate()
+    return cells / (time.perf_counter() - start)
+
+
+def keyed_hash(
+    pseudonymizer: Pseudonymizer, anonymization_type: str, cells: int
+) -> float:
+    anonymize = pseudonymizer.anonymize
+    start = time.perf_counter()
+    for row in range(cells):
+        anonymize(anonymization_type, anonymization_type, row, row * 7)
+    return cells / (time.perf_counter() - start)
+
+
+def keyed_hash_batch(
+    pseudonymizer: Pseudonymizer, anonymization_type: str, cells: int
+) -> float:
+    row_keys = list(range(cells))
+    values = [row * 7 for row in row_keys]
+    start = time.perf_counter()
+    pseudonymizer.anonymize_column(
+        anonymization_type, anonymization_type, row_keys, values
+    )
+    return cells / (time.perf_counter() - start)
+
+
+def main(cells: int, pool_size: int) -> None:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "pools.bin")
+    build_pools(path=path, size=pool_size)
+
+    secret = secrets.token_hex(32)
+    pseudonymizer = Pseudonymizer(secret=secret, database_id=1, table_id=1)
+    pooled_pseudonymizer = Pseudonymizer(
+        secret=secret, database_id=1, table_id=1, pools=PoolSet(path)
+    )
+
+    print(
+        f"{'type':<18}{'before':>12}{'per cell':>12}{'batch':>12}{'speedup':>10}"
+        f"{'pooled':>12}{'speedup':>10}"
+    )
+    for anonymization_type in legacy_mapping:
+        before = legacy(anonymization_type, cells)
+        after = keyed_hash(pseudonymizer, anonymization_type, cells)
+        batch = keyed_hash_batch(pseudonymizer, anonymization_type, cells)
+        line = (
+            f"{anonymization_type:<18}{before:>12,.0f}{after:>12,.0f}{batch:>12,.0f}"
+            f"{batch / before:>9.1f}x"
+        )
+
+        # Only the text types have pools, the others are computed the same with them
+        if anonymization_type in POOL_TYPES:
+            pooled = keyed_hash_batch(pooled_pseudonymizer, anonymization_type, cells)
+            line += f"{pooled:>12,.0f}{pooled / before:>9.1f}x"
+        print(line)
+    print("(cells/sec)")
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2**14,
+    )
@@ -0,0 +1,146 @@
+"""Seconds and table size of the in place anonymization against the shadow table swap.
+
+Usage: python -m benchmarks.swap_benchmark <postgresql url> [rows]
+
+The swap only runs on PostgreSQL. The in place path updates every row, so
+the table and its indexes grow with a dead version of each one until
+vacuumed; the swap bulk loads a new table, builds its indexes once and
+renames it in. Nothing writes to the table meanwhile, so no change is
+replayed. The benchmark table is dropped and recreated.
+"""
+
+import secrets
+import sys
+import time
+
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    text,
+)
+
+from app.main.config import Config
+from app.main.remote import capture_changes, create_shadow_table, shadow_name
+from app.main.service.anonymization_service import (
+    _anonymize_range,
+    _shadow_spec,
+    _swap_shadow_table,
+)
+
+TABLE_NAME = "swap_benchmark"
+
+table = Table(
+    TABLE_NAME,
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(255)),
+    Column("email", String(255)),
+    Column("notes", String(255)),
+    Index("swap_benchmark_name", "name"),
+    Index("swap_benchmark_email", "email"),
+)
+
+
+def create_benchmark_table(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            connection.execute(
+                table.insert(),
+                [
+                    {
+                        "id": key,
+                        "name": f"name {key}",
+                        "email": f"{key}@x",
+                        "notes": "kept as it is",
+                    }
+                    for key in range(start + 1, min(start + 10000, rows) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def table_size(url: str) -> int:
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        size = connection.execute(
+            text("SELECT pg_total_relation_size(CAST(:table AS regclass))"),
+            {"table": TABLE_NAME},
+        ).scalar()
+    engine.dispose()
+    return size
+
+
+def anonymize_in_place(spec: dict) -> None:
+    _anonymize_range(spec)
+
+
+def anonymize_swap(spec: dict) -> None:
+    engine = create_engine(spec["url"])
+    with engine.begin() as connection:
+        capture_changes(
+            connection=connection,
+            table=table,
+            key_columns=spec["primary_keys"],
+            changes=shadow_name(TABLE_NAME, "changes"),
+        )
+        create_shadow_table(
+            connection=connection,
+            table=table,
+            shadow=shadow_name(TABLE_NAME, "shadow"),
+        )
+    engine.dispose()
+
+    spec = {**spec, "shadow": _shadow_spec(spec=spec)}
+    _anonymize_range(spec)
+    # The table stands in for the backup, no change is replayed into it
+    _swap_shadow_table(spec=spec, backup_url=spec["url"])
+
+
+def main(url: str, rows: int) -> None:
+    spec = {
+        "url": url,
+        "table_name": TABLE_NAME,
+        "primary_keys": ["id"],
+        "columns": [("name", "name", False), ("email", "email", False)],
+        "backup_url": None,
+        "backup_copied": False,
+        "secret": secrets.token_hex(32),
+        "database_id": 1,
+        "table_id": 1,
+        "pool_path": Config.ANONYMIZATION_POOL_PATH,
+        "cache_size": Config.ANONYMIZATION_CACHE_SIZE,
+        "batch_size": Config.ANONYMIZATION_BATCH_SIZE,
+        "commit_batches": 1,
+        "shadow": None,
+    }
+
+    print(f"{'mode':>10}{'seconds':>10}{'rows/s':>12}{'size MB':>10}{'growth':>9}")
+    for mode, anonymize in [("in_place", anonymize_in_place), ("swap", anonymize_swap)]:
+        create_benchmark_table(url=url, rows=rows)
+        size = table_size(url=url)
+
+        start = time.perf_counter()
+        anonymize(spec=spec)
+        elapsed = time.perf_counter() - start
+
+        after = table_size(url=url)
+        print(
+            f"{mode:>10}{elapsed:>10.2f}{rows / elapsed:>12,.0f}"
+            f"{after / 2**20:>10.1f}{after / size:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+
+    main(url=sys.argv[1], rows=int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
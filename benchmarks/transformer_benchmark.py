@@ -0,0 +1,115 @@
+"""Per-row overhead of anonymizing batches column by column through the
+pseudonymizer against the RowTransformer compiled once per range.
+
+Usage: python -m benchmarks.transformer_benchmark [rows] [columns]
+
+Generation is left out: every generator returns its digests, so what is
+measured is the transposing, hashing, dispatch and row assembly around it.
+"""
+
+import secrets
+import sys
+import time
+
+from app.main.anonymization import Pseudonymizer, RowTransformer, ValueCache
+
+BATCH_SIZE = 1000
+
+
+def column_by_column(
+    pseudonymizer: Pseudonymizer,
+    value_caches: dict,
+    columns: list[tuple],
+    key_count: int,
+    rows: list,
+) -> list[tuple]:
+    # The batch path as it was, every column resolved again on each batch
+    batch_columns = list(zip(*rows))
+    key_columns = batch_columns[:key_count]
+    row_keys = key_columns[0] if key_count == 1 else list(zip(*key_columns))
+
+    anonymized_columns = [
+        (
+            pseudonymizer.anonymize_consistent_column(
+                name, anonymization_type, batch_columns[index], value_caches[name]
+            )
+            if consistent
+            else pseudonymizer.anonymize_column(
+                name, anonymization_type, row_keys, batch_columns[index]
+            )
+        )
+        for index, (name, anonymization_type, consistent) in enumerate(
+            columns, start=key_count
+        )
+    ]
+
+    return list(
+        zip(
+            *key_columns,
+            *anonymized_columns,
+            *batch_columns[key_count + len(columns) :],
+        )
+    )
+
+
+def measure(anonymize, batches: list) -> float:
+    start = time.perf_counter()
+    for rows in batches:
+        anonymize(rows)
+    return time.perf_counter() - start
+
+
+def main(rows: int, column_count: int) -> None:
+    pseudonymizer = Pseudonymizer(
+        secret=secrets.token_hex(32), database_id=1, table_id=1
+    )
+    for anonymization_type in pseudonymizer.providers.mapping:
+        pseudonymizer.providers.mapping[anonymization_type] = lambda digests: digests
+
+    print(f"{'key':<10}{'consistent':>12}{'before':>10}{'after':>10}{'speedup':>10}")
+    for key_count in [1, 2]:
+        for consistent in [False, True]:
+            columns = [
+                (f"column{index}", "name", consistent) for index in range(column_count)
+            ]
+            batches = [
+                [
+                    tuple(range(row, row + key_count))
+                    + tuple(f"value {row % 100}" for _ in columns)
+                    + ("kept",)
+                    for row in range(start, min(start + BATCH_SIZE, rows))
+                ]
+                for start in range(0, rows, BATCH_SIZE)
+            ]
+
+            def caches():
+                return {name: ValueCache(max_size=1000) for name, _, _ in columns}
+
+            before = measure(
+                lambda batch, value_caches=caches(): column_by_column(
+                    pseudonymizer, value_caches, columns, key_count, batch
+                ),
+                batches,
+            )
+            after = measure(
+                RowTransformer(
+                    pseudonymizer=pseudonymizer,
+                    columns=columns,
+                    key_count=key_count,
+                    value_caches=caches(),
+                ),
+                batches,
+            )
+            print(
+                f"{'composite' if key_count > 1 else 'single':<10}{str(consistent):>12}"
+                f"{before / rows * 1e6:>10.2f}{after / rows * 1e6:>10.2f}"
+                f"{before / after:>9.1f}x"
+            )
+    print(f"(microseconds per row of {column_count} columns, generation excluded)")
+
+
+if __name__ == "__main__":
+    main(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        column_count=int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+    )
@@ -0,0 +1,97 @@
+"""Rows/sec of each bulk UPDATE strategy on the anonymization write paths.
+
+Usage: python -m benchmarks.update_benchmark [rows] [batch size] [database url]
+
+The anonymize path rewrites the anonymized columns and the restore path every
+column but the primary key. Without a database url a temporary SQLite file is
+used; the executemany strategy pays one round trip per row on psycopg2 and
+mysqlclient, so run it against PostgreSQL or MySQL to see the gap. The
+benchmark table is dropped and recreated.
+"""
+
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine
+
+from app.main.remote import UPDATE_STRATEGIES, BulkUpdater
+
+TABLE_NAME = "update_benchmark"
+
+WRITE_PATHS = {
+    "anonymize": ["name", "email"],
+    "restore": ["name", "email", "ip", "notes"],
+}
+
+table = Table(
+    TABLE_NAME,
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(255)),
+    Column("email", String(255)),
+    Column("ip", String(64)),
+    Column("notes", String(255)),
+)
+
+
+def create_benchmark_table(url: str, rows: int) -> None:
+    engine = create_engine(url)
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            connection.execute(
+                table.insert(),
+                [
+                    {"id": key, "name": "", "email": "", "ip": "", "notes": ""}
+                    for key in range(start + 1, min(start + 10000, rows) + 1)
+                ],
+            )
+    engine.dispose()
+
+
+def main(rows: int, batch_size: int, url: str) -> None:
+    create_benchmark_table(url=url, rows=rows)
+    engine = create_engine(url)
+
+    print(f"{'path':>10}{'strategy':>14}{'seconds':>10}{'rows/s':>12}")
+    for path, value_columns in WRITE_PATHS.items():
+        for strategy in UPDATE_STRATEGIES:
+            with engine.connect() as connection:
+                updater = BulkUpdater(
+                    connection=connection,
+                    table=table,
+                    key_columns=["id"],
+                    value_columns=value_columns,
+                    strategy=strategy,
+                )
+
+                start = time.perf_counter()
+                for first in range(1, rows + 1, batch_size):
+                    updater.update(
+                        rows=[
+                            (key, *[f"{strategy} {key}"] * len(value_columns))
+                            for key in range(first, min(first + batch_size, rows + 1))
+                        ]
+                    )
+                updater.close()
+                connection.commit()
+                elapsed = time.perf_counter() - start
+
+            print(f"{path:>10}{strategy:>14}{elapsed:>10.2f}{rows / elapsed:>12,.0f}")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main(
+        rows=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        batch_size=int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+        url=(
+            sys.argv[3]
+            if len(sys.argv) > 3
+            else f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+        ),
+    )